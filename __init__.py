@@ -5,10 +5,14 @@ from __future__ import print_function
 # To provide an entry point to PyMOL's API
 import os
 import math
+import threading
 #must do .module import
 from .calc_miv import *
+from .emit_miv import PymolScript
+from .structure_miv import object_name, structure_from_pymol
 # pylint: disable=wrong-import-order
 from pymol import cmd
+from pymol.Qt import QtCore
 from pymol.Qt import QtWidgets
 from pymol.Qt.utils import loadUi
 from pymol.Qt.utils import *
@@ -38,10 +42,184 @@ def __init_plugin__(app=None):
     '''
     addmenuitemqt('PyMIV', run_plugin_gui)
 
+############################################################
+###################  Background Analyses  ##################
+############################################################
+
+class AnalysisWorker(QtCore.QObject):
+    '''
+    This class runs one calc_miv analysis on a worker thread and reports
+    its progress and result back to the dialog through Qt signals
+    '''
+    progressed = QtCore.Signal(int, str)
+    succeeded = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+    cancelled = QtCore.Signal()
+
+    def __init__(self, function, pdb_file, kwargs):
+        super().__init__()
+        self.function = function
+        self.pdb_file = pdb_file
+        self.kwargs = kwargs
+        self.cancel_requested = threading.Event()
+
+    def report(self, fraction, message):
+        '''
+        This function will be passed to the analysis as its progress callback
+
+        **Parameters**
+
+        fraction: *float*
+            The fraction of the analysis done, from 0 to 1
+
+        message: *str*
+            A short description of the current step
+
+        **Returns**
+
+            None, or raises AnalysisCancelled once Cancel was clicked
+        '''
+        if self.cancel_requested.is_set():
+            raise AnalysisCancelled()
+        self.progressed.emit(int(round(fraction * 100)), message)
+
+    @QtCore.Slot()
+    def run(self):
+        '''
+        This function will run the analysis on the worker thread
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+            None
+        '''
+        try:
+            result = self.function(self.pdb_file, progress=self.report, **self.kwargs)
+        except AnalysisCancelled:
+            self.cancelled.emit()
+        # pylint: disable=broad-except
+        except Exception as error:
+            self.failed.emit(str(error))
+        else:
+            self.succeeded.emit(result)
+
+class AnalysisRunner(QtCore.QObject):
+    '''
+    This class lives on the Qt event thread, starts one AnalysisWorker at a
+    time and applies the PyMOL drawing step once the analysis finishes
+    '''
+    def __init__(self, form, parent=None):
+        super().__init__(parent)
+        self.form = form
+        self.thread = None
+        self.worker = None
+        self.on_done = None
+
+    def start(self, function, pdb_file, on_done=None, **kwargs):
+        '''
+        This function will run an analysis in the background
+
+        **Parameters**
+
+        function: *callable*
+            The calc_miv analysis to run
+
+        pdb_file: *str*
+            The PDB file to analyze
+
+        on_done: *callable*
+            A function called with the analysis result on the Qt event thread,
+            which is where PyMOL commands are safe to run
+
+        kwargs: *dict*
+            Extra keyword arguments for the analysis
+
+        **Returns**
+
+            None
+        '''
+        if self.thread is not None:
+            print("Please wait for the running analysis to finish or cancel it")
+            return
+        self.on_done = on_done
+        self.thread = QtCore.QThread(self)
+        self.worker = AnalysisWorker(function, pdb_file, kwargs)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run)
+        self.worker.progressed.connect(self.show_progress)
+        self.worker.succeeded.connect(self.finish_succeeded)
+        self.worker.failed.connect(self.finish_failed)
+        self.worker.cancelled.connect(self.finish_cancelled)
+        self.form.progressBar.setValue(0)
+        self.form.cancel.setEnabled(True)
+        self.thread.start()
+
+    def cancel(self):
+        '''
+        This function will ask the running analysis to stop at its next progress report
+        '''
+        if self.worker is not None:
+            self.worker.cancel_requested.set()
+
+    @QtCore.Slot(int, str)
+    def show_progress(self, percent, message):
+        '''
+        This function will show the analysis progress in the dialog
+        '''
+        self.form.progressBar.setValue(percent)
+        self.form.progressBar.setFormat("{} %p%".format(message))
+
+    @QtCore.Slot(object)
+    def finish_succeeded(self, result):
+        '''
+        This function will stop the worker thread and draw the result in PyMOL
+        '''
+        on_done = self.on_done
+        self.stop_thread()
+        if on_done is not None:
+            on_done(result)
+
+    @QtCore.Slot(str)
+    def finish_failed(self, message):
+        '''
+        This function will stop the worker thread and print the analysis error
+        '''
+        self.stop_thread()
+        print("Analysis failed:", message)
+
+    @QtCore.Slot()
+    def finish_cancelled(self):
+        '''
+        This function will stop the worker thread after the analysis was cancelled
+        '''
+        self.stop_thread()
+        self.form.progressBar.setValue(0)
+        self.form.progressBar.setFormat("Cancelled")
+        print("Analysis cancelled")
+
+    def stop_thread(self):
+        '''
+        This function will end the worker thread and reset the dialog
+        '''
+        self.thread.quit()
+        self.thread.wait()
+        self.worker.deleteLater()
+        self.thread.deleteLater()
+        self.thread = None
+        self.worker = None
+        self.on_done = None
+        self.form.cancel.setEnabled(False)
+
 # To create global reference of the dialog variables
 # pylint: disable=invalid-name
 dialog = None
 
+# The proteomic PSM sites mapped by `PARmap`
+SITE_FILE = os.path.join(os.path.dirname(__file__), '231017_PAR15map_nuclear_PSMs.csv')
+
 # to give filename of the UI file
 uifile = os.path.join(os.path.dirname(__file__), 'PyMIV_GUI.ui')
 
@@ -90,6 +268,28 @@ def make_dialog():
     uifile = os.path.join(os.path.dirname(__file__), 'PyMIV_GUI.ui')
     form = loadUi(uifile, dialog)
 
+    # To run analyses off the Qt event thread
+    runner = AnalysisRunner(form, dialog)
+
+    def structure_source(pdb_file):
+        '''
+        This function will reuse the coordinates of a structure already loaded
+        in PyMOL, so the analysis does not read and parse the file again
+
+        **Parameters**
+
+        pdb_file: *str*
+            The PDB file name entered in the dialog
+
+        **Returns**
+
+            Structure of the loaded object, or the file name if it is not loaded
+        '''
+        name = object_name(pdb_file)
+        if name in cmd.get_names("objects"):
+            return structure_from_pymol(cmd, name, pdb_file)
+        return pdb_file
+
     # To create buttons in the GUI
 
     def browse_filename():
@@ -112,8 +312,8 @@ def make_dialog():
 
     def disulfide_finder_button():
         '''
-        This function will run the disulfide_finder function and 
-        load `disulfide_bonds.pml when `Disulfide Finder` is clicked
+        This function will run the calc_disulfide function and
+        draw the disulfide bonds when `Disulfide Finder` is clicked
 
         **Parameters**
 
@@ -130,14 +330,18 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            calc_disulfide(pdb_file)
-            cmd.run("disulfide_bonds.pml")
-            print('Yellow = Cysteine Sulfur Atoms')
+            script = PymolScript()
+
+            def draw(result):
+                script.apply(cmd)
+                print('Yellow = Cysteine Sulfur Atoms')
+            runner.start(calc_disulfide, structure_source(pdb_file), draw,
+                         pml_file=None, script=script)
 
     def wc_nwc_button():
         '''
-        This function will run the calc_wc_nwc function and 
-        load `get_bonds.pml when `WC vs Non-WC` is clicked
+        This function will run the calc_wc_nwc function and
+        draw the WC and Non-WC bonds when `WC vs Non-WC` is clicked
 
         **Parameters**
 
@@ -153,14 +357,18 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            calc_wc_nwc(pdb_file)
-            cmd.run("get_bonds.pml")
-            print('Yellow = WC\nRed=Non-WC')
+            script = PymolScript()
+
+            def draw(result):
+                script.apply(cmd)
+                print('Yellow = WC\nRed=Non-WC')
+            runner.start(calc_wc_nwc, structure_source(pdb_file), draw,
+                         pml_file=None, script=script)
 
     def alpha_helix_button():
         '''
-        This function will run alpha_helice function and 
-        load `helix_bonds.pml when `Alpha Helix` is clicked
+        This function will run alpha_helice function and
+        color the alpha helices when `Alpha Helix` is clicked
 
         **Parameters**
 
@@ -176,8 +384,9 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            alpha_helice(pdb_file)
-            cmd.run("helix_bonds.pml")
+            script = PymolScript()
+            runner.start(alpha_helice, structure_source(pdb_file),
+                         lambda result: script.apply(cmd), pml_file=None, script=script)
 
     def calc_mw_button():
         '''
@@ -199,13 +408,13 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            calc_peptide_mw(pdb_file)
-            cmd.load(pdb_file)
+            runner.start(calc_peptide_mw, structure_source(pdb_file),
+                         lambda result: cmd.load(pdb_file))
 
     def end_to_end_button():
         '''
-        This function will run end_to_end_dist function and 
-        load `end_to_end.pml when `End to End Distance` is clicked
+        This function will run end_to_end_dist function and
+        draw the end to end distance when `End to End Distance` is clicked
 
         **Parameters**
 
@@ -222,8 +431,9 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            end_to_end_dist(pdb_file)
-            cmd.run("end_to_end.pml")
+            script = PymolScript()
+            runner.start(end_to_end_dist, structure_source(pdb_file),
+                         lambda result: script.apply(cmd), pml_file=None, script=script)
 
     def output_fasta_button():
         '''
@@ -245,12 +455,12 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            output_fasta(pdb_file)
+            runner.start(output_fasta, structure_source(pdb_file))
 
     def map_site_button():
         '''
-        This function will run map_site function and 
-        load `mapped_site.pml when `PARmap` is clicked
+        This function will run map_structure function and color the protein
+        by the PSM coverage of every residue when `PARmap` is clicked
 
         **Parameters**
 
@@ -260,6 +470,9 @@ def make_dialog():
 
             None
         '''
+        # pylint: disable=import-outside-toplevel
+        # pandas and bs4 are only needed once proteomic sites are mapped
+        from .proteomic_miv import map_structure
         # retreive PDB file data
         pdb_file = form.lineEdit.text()
         # Error Code
@@ -267,12 +480,14 @@ def make_dialog():
             print("Please input a valid .pdb file name")
         else:
             print('User Entered Filename:', pdb_file)
-            end_to_end_dist(pdb_file)
-            cmd.run("mapped_site.pml")
+            script = PymolScript()
+            runner.start(map_structure, structure_source(pdb_file),
+                         lambda result: script.apply(cmd), site_file=SITE_FILE, script=script)
 
     # To connect clicking buttons to a value, text or command
     form.browse.clicked.connect(browse_filename)
     form.done.clicked.connect(dialog.close)
+    form.cancel.clicked.connect(runner.cancel)
     form.disulfideFinder.clicked.connect(disulfide_finder_button)
     form.calculateMW.clicked.connect(calc_mw_button)
     form.wcAndNonWC.clicked.connect(wc_nwc_button)
@@ -0,0 +1,209 @@
+import os
+import sqlite3
+import threading
+
+############################################################
+###################  AlphaFold Accession Index  ############
+############################################################
+
+# Accessions looked up per SQL query, below the SQLite limit of bound parameters
+_LOOKUP_BATCH = 500
+
+# Rows inserted per transaction while an index is built
+_BUILD_BATCH = 100000
+
+def _accession_rows(accession_file):
+    '''
+    This function will read the rows of an AlphaFold accession table, e.g.
+    A0A009IHW8,1,157,AF-A0A009IHW8-F1,4 for the accession, first and last
+    residue, AlphaFold ID and model version
+
+    **Parameters**
+
+    accession_file: *str*
+        The AlphaFold accession_ids.csv (or .txt) file
+
+    **Returns**
+
+        Iterator of (accession, alphafold_id, first, last, version) tuples
+    '''
+    with open(accession_file, "r", encoding="utf8") as accessionfile:
+        for line in accessionfile:
+            fields = line.rstrip("\r\n").split(",")
+            if len(fields) < 4 or not fields[1].isdigit():
+                continue
+            yield (fields[0], fields[3], int(fields[1]), int(fields[2]),
+                   int(fields[4]) if len(fields) > 4 and fields[4].isdigit() else None)
+
+def _source_stamp(accession_file):
+    '''
+    This function will return the size and modification time of the accession table as text
+    '''
+    status = os.stat(accession_file)
+    return "{}:{}".format(status.st_size, status.st_mtime_ns)
+
+def build_accession_index(accession_file="accession_ids.txt", index_file=None):
+    '''
+    This function will build an SQLite index of an AlphaFold accession table
+    once, streaming the table in batches so memory stays small for the full
+    AlphaFold DB. The index is written to a temporary file and moved into
+    place when complete, so readers never see a half built index
+
+    **Parameters**
+
+    accession_file: *str*
+        The AlphaFold accession_ids.csv (or .txt) file
+
+    index_file: *str*
+        The index to write, or None for the accession file name plus .sqlite
+
+    **Returns**
+
+        String of the index file name
+    '''
+    index_file = accession_file + ".sqlite" if index_file is None else index_file
+    building = "{}.{}.tmp".format(index_file, os.getpid())
+    if os.path.exists(building):
+        os.remove(building)
+    connection = sqlite3.connect(building)
+    try:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("CREATE TABLE source (stamp TEXT)")
+        connection.execute("CREATE TABLE accessions (accession TEXT, alphafold_id TEXT, "
+                           "first INTEGER, last INTEGER, version INTEGER)")
+        rows = _accession_rows(accession_file)
+        while True:
+            batch = [row for _, row in zip(range(_BUILD_BATCH), rows)]
+            if not batch:
+                break
+            connection.executemany("INSERT INTO accessions VALUES (?, ?, ?, ?, ?)", batch)
+            connection.commit()
+        # One index built after loading is much faster than keeping it sorted while inserting
+        connection.execute("CREATE INDEX accession_key ON accessions (accession, alphafold_id)")
+        connection.execute("INSERT INTO source VALUES (?)", (_source_stamp(accession_file),))
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(building, index_file)
+    return index_file
+
+class AccessionIndex:
+    '''
+    This class answers UniProt accession to AlphaFold ID lookups from an
+    SQLite index of the AlphaFold accession table, rebuilding the index when
+    it is missing or older than the table
+
+    **Attributes**
+
+    accession_file: *str*
+        The AlphaFold accession table
+
+    index_file: *str*
+        The SQLite index of the table
+    '''
+    def __init__(self, accession_file="accession_ids.txt", index_file=None):
+        self.accession_file = accession_file
+        self.index_file = accession_file + ".sqlite" if index_file is None else index_file
+        if not self._current():
+            build_accession_index(accession_file, self.index_file)
+        self._connection = sqlite3.connect("file:{}?mode=ro".format(self.index_file),
+                                           uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<AccessionIndex {}>".format(self.index_file)
+
+    def _current(self):
+        '''
+        This function will check that the index exists and was built from the
+        accession table as it is now
+        '''
+        if not os.path.exists(self.index_file):
+            return False
+        if not os.path.exists(self.accession_file):
+            return True
+        connection = sqlite3.connect("file:{}?mode=ro".format(self.index_file), uri=True)
+        try:
+            stamp = connection.execute("SELECT stamp FROM source").fetchone()
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            connection.close()
+        return stamp is not None and stamp[0] == _source_stamp(self.accession_file)
+
+    def lookup(self, accessions):
+        '''
+        This function will look up the AlphaFold IDs of many accessions at once,
+        a few hundred accessions per query
+
+        **Parameters**
+
+        accessions: *list*
+            UniProt accession IDs (e.g. P22626)
+
+        **Returns**
+
+            Dictionary of every found accession to the list of its AlphaFold IDs
+            (one per fragment, e.g. AF-P22626-F1)
+        '''
+        accessions = list(dict.fromkeys(accessions))
+        found = {}
+        with self._lock:
+            for start in range(0, len(accessions), _LOOKUP_BATCH):
+                batch = accessions[start:start + _LOOKUP_BATCH]
+                rows = self._connection.execute(
+                    "SELECT accession, alphafold_id FROM accessions WHERE accession IN ({}) "
+                    "ORDER BY accession, alphafold_id".format(", ".join("?" * len(batch))),
+                    batch)
+                for accession, alphafold_id in rows:
+                    found.setdefault(accession, []).append(alphafold_id)
+        return found
+
+    def get(self, accession, default=None):
+        '''
+        This function will look up the first AlphaFold ID of one accession
+
+        **Parameters**
+
+        accession: *str*
+            A UniProt accession ID (e.g. P22626)
+
+        default: *object*
+            The value returned when the accession is not in the table
+
+        **Returns**
+
+            String of the AlphaFold ID (e.g. AF-P22626-F1), or default
+        '''
+        return self.lookup([accession]).get(accession, [default])[0]
+
+    def close(self):
+        '''
+        This function will close the index
+        '''
+        self._connection.close()
+
+# Open indexes by accession table, shared by every lookup of a process
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def accession_index(accession_file="accession_ids.txt"):
+    '''
+    This function will return the open index of an accession table, building
+    it on first use
+
+    **Parameters**
+
+    accession_file: *str*
+        The AlphaFold accession_ids.csv (or .txt) file
+
+    **Returns**
+
+        AccessionIndex of the table
+    '''
+    key = os.path.abspath(accession_file)
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = AccessionIndex(accession_file)
+        return _INDEXES[key]
@@ -0,0 +1,339 @@
+import argparse
+import contextlib
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+# pylint: disable=import-error
+try:
+    from .structure_miv import STRUCTURE_EXTENSIONS, load_structure, object_name
+    from .calc_miv import (calc_disulfide, calc_wc_nwc, alpha_helice, calc_hbonds,
+                           calc_contacts, end_to_end_dist, calc_peptide_mw, output_fasta)
+    from .stats_miv import run_instrumented
+    from .results_miv import ResultWriter
+except ImportError:
+    from structure_miv import STRUCTURE_EXTENSIONS, load_structure, object_name
+    from calc_miv import (calc_disulfide, calc_wc_nwc, alpha_helice, calc_hbonds,
+                          calc_contacts, end_to_end_dist, calc_peptide_mw, output_fasta)
+    from stats_miv import run_instrumented
+    from results_miv import ResultWriter
+
+############################################################
+###################  Batch Analyses  #######################
+############################################################
+
+def _count_pairs(result):
+    '''
+    This function will summarize the WC and non-WC bonds as "WC/non-WC" counts
+    '''
+    return "{}/{}".format(result.values["wc"], result.values["nwc"])
+
+def _count_helix(result):
+    '''
+    This function will summarize the helix as the number of helical residues
+    '''
+    return str(result.values["helical_residues"])
+
+def _count_contacts(result):
+    '''
+    This function will summarize the contacts as "salt bridge/stacking/hydrophobic/metal" counts
+    '''
+    return "/".join(str(count) for count in result.values.values())
+
+def _format_number(result):
+    '''
+    This function will summarize the distance or mass of a result with two decimals
+    '''
+    value = next(iter(result.values.values()))
+    return "" if value is None else "{:.2f}".format(value)
+
+def _count_length(result):
+    '''
+    This function will summarize bonds or a sequence by their number of records
+    '''
+    return str(len(result))
+
+# Analysis name to the calc_miv function, the PyMOL script it writes and
+# how its AnalysisResult is reduced to one summary table entry
+ANALYSES = {
+    "disulfide": (calc_disulfide, "disulfide_bonds.pml", _count_length),
+    "wc_nwc": (calc_wc_nwc, "get_bonds.pml", _count_pairs),
+    "alpha_helix": (alpha_helice, "helix_bonds.pml", _count_helix),
+    "hbonds": (calc_hbonds, "interface_hbonds.pml", _count_length),
+    "contacts": (calc_contacts, "contacts.pml", _count_contacts),
+    "end_to_end": (end_to_end_dist, "end_to_end.pml", _format_number),
+    "mw": (calc_peptide_mw, None, _format_number),
+    "fasta": (output_fasta, None, _count_length),
+}
+
+SUMMARY_COLUMNS = ["structure", "analysis", "atoms", "result", "seconds", "status"]
+
+def expand_inputs(patterns):
+    '''
+    This function will expand directories and glob patterns into a sorted list of structure files
+
+    **Parameters**
+
+    patterns: *list*
+        Directories, whose PDB, mmCIF and BinaryCIF files (plain or gzip
+        compressed) are all taken, glob patterns (e.g. PDB_Files/*.pdb) or file names
+
+    **Returns**
+
+        Sorted list of file names without duplicates
+    '''
+    filenames = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in STRUCTURE_EXTENSIONS:
+                for suffix in (extension, extension + ".gz"):
+                    filenames.update(glob.glob(os.path.join(pattern, "*" + suffix)))
+        else:
+            filenames.update(glob.glob(pattern))
+    return sorted(filenames)
+
+def structure_names(filenames):
+    '''
+    This function will name the output folder of every structure after its
+    object name, numbering a name already taken by an earlier file (e.g. x.pdb
+    and x.cif, or x.pdb in two folders become x and x_2) so no two structures
+    write to the same folder. Names are compared ignoring case, as some file
+    systems do
+
+    **Parameters**
+
+    filenames: *list*
+        Structure file names, in the order they are run
+
+    **Returns**
+
+        List of unique folder names, one per file
+    '''
+    names, taken = [], set()
+    for filename in filenames:
+        base = name = object_name(filename)
+        number = 1
+        while name.lower() in taken:
+            number += 1
+            name = "{}_{}".format(base, number)
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+def run_structure(filename, analyses, output_dir, stats=False, profile=False,
+                  structure_name=None, keep_results=True):
+    '''
+    This function will parse one structure once and run every requested analysis on it,
+    writing the printed text and PyMOL script of each analysis to the structure's folder
+
+    **Parameters**
+
+    filename: *str*
+        A string with the structure file name
+
+    analyses: *list*
+        Names of the analyses to run (keys of ANALYSES)
+
+    output_dir: *str*
+        The folder in which a folder per structure is made
+
+    stats: *bool*
+        Also write the stage times and counters of each analysis as <analysis>.stats.json
+
+    profile: *bool*
+        Also write a cProfile file of each analysis as <analysis>.prof
+
+    structure_name: *str*
+        The name of the structure's folder and summary rows, or None for its
+        object name (see structure_names)
+
+    keep_results: *bool*
+        Return the AnalysisResults, e.g. to export their records. Without
+        them a pool worker only sends the summary rows back
+
+    **Returns**
+
+        Tuple of the list of summary rows, one per analysis, and the list of
+        AnalysisResults of the analyses that ran (empty without keep_results)
+    '''
+    structure_name = object_name(filename) if structure_name is None else structure_name
+    structure_dir = os.path.join(output_dir, structure_name)
+    os.makedirs(structure_dir, exist_ok=True)
+    rows, results = [], []
+    try:
+        structure = load_structure(filename)
+    # pylint: disable=broad-except
+    except Exception as error:
+        return ([[structure_name, name, 0, "", 0.0, "error: {}".format(error)]
+                 for name in analyses], results)
+
+    for name in analyses:
+        function, pml_name, summarize = ANALYSES[name]
+        kwargs = {}
+        if pml_name is not None:
+            kwargs["pml_file"] = os.path.join(structure_dir, pml_name)
+        status, result = "ok", None
+        start = time.perf_counter()
+        with open(os.path.join(structure_dir, name + ".txt"), "w", encoding="utf8") as textfile:
+            with contextlib.redirect_stdout(textfile):
+                try:
+                    result = run_instrumented(
+                        function, structure,
+                        os.path.join(structure_dir, name + ".stats.json") if stats else None,
+                        os.path.join(structure_dir, name + ".prof") if profile else None,
+                        **kwargs)[0]
+                # pylint: disable=broad-except
+                except Exception as error:
+                    status = "error: {}".format(error)
+        seconds = time.perf_counter() - start
+        summary = ""
+        if result is not None:
+            summary = summarize(result)
+            if keep_results:
+                results.append(result)
+        rows.append([structure_name, name, len(structure), summary,
+                     round(seconds, 4), status])
+    return rows, results
+
+def _run_structure_job(job):
+    '''
+    This function will unpack a pool job and run it with run_structure
+
+    **Parameters**
+
+    job: *tuple*
+        The (filename, analyses, output_dir, stats, profile, structure_name,
+        keep_results) arguments of run_structure
+
+    **Returns**
+
+        Tuple of summary rows and AnalysisResults, as from run_structure
+    '''
+    return run_structure(*job)
+
+def run_batch(filenames, analyses, output_dir, jobs=None, summary_file="summary.tsv",
+              stats=False, profile=False, export=None):
+    '''
+    This function will fan structure files out across a process pool and
+    write a tab separated summary table of every analysis of every structure
+
+    **Parameters**
+
+    filenames: *list*
+        Structure file names
+
+    analyses: *list*
+        Names of the analyses to run (keys of ANALYSES)
+
+    output_dir: *str*
+        The folder for the per-structure results and the summary table
+
+    jobs: *int*
+        Number of worker processes, or None for one per CPU
+
+    summary_file: *str*
+        The file name of the summary table inside output_dir
+
+    stats: *bool*
+        Also write the stage times and counters of every analysis as JSON
+
+    profile: *bool*
+        Also write a cProfile file of every analysis
+
+    export: *str*
+        The file name inside output_dir to which the records of every analysis
+        are streamed as .jsonl, .csv or .parquet, or None to skip the export
+
+    **Returns**
+
+        List of all summary rows
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    names = structure_names(filenames)
+    for filename, name in zip(filenames, names):
+        if name != object_name(filename):
+            print("{} shares its name with an earlier structure, writing it to {}".format(
+                filename, os.path.join(output_dir, name)))
+    # The records of every analysis only travel back from the workers to be exported
+    work = [(filename, list(analyses), output_dir, stats, profile, name, bool(export))
+            for filename, name in zip(filenames, names)]
+    rows = []
+    writer = ResultWriter(os.path.join(output_dir, export)) if export else None
+
+    def collect(structure_rows, results):
+        rows.extend(structure_rows)
+        if writer is not None:
+            for result in results:
+                writer.write(result)
+
+    try:
+        if jobs == 1:
+            for job in work:
+                collect(*_run_structure_job(job))
+        else:
+            # Several small structures go to a worker at a time to keep pool overhead low
+            chunksize = max(1, len(work) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for structure_rows, results in pool.map(_run_structure_job, work,
+                                                        chunksize=chunksize):
+                    collect(structure_rows, results)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    with open(os.path.join(output_dir, summary_file), "w", encoding="utf8") as summary:
+        summary.write("\t".join(SUMMARY_COLUMNS) + "\n")
+        for row in rows:
+            summary.write("\t".join(str(value) for value in row) + "\n")
+    return rows
+
+def main(argv=None):
+    '''
+    This function will run calc_miv analyses over many structures from the command line
+
+    **Parameters**
+
+    argv: *list*
+        Command line arguments, or None to use sys.argv
+
+    **Returns**
+
+        Exit status, 1 if any analysis failed
+    '''
+    parser = argparse.ArgumentParser(
+        description="Run PyMIV analyses over a directory or glob of PDB, mmCIF "
+                    "or BinaryCIF files, plain or gzip compressed")
+    parser.add_argument("inputs", nargs="+",
+                        help="directories, glob patterns (e.g. 'PDB_Files/*.pdb') or files")
+    parser.add_argument("-a", "--analysis", action="append", choices=sorted(ANALYSES),
+                        help="analysis to run, may be repeated (default: all)")
+    parser.add_argument("-o", "--output", default="miv_batch",
+                        help="output folder (default: miv_batch)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--summary", default="summary.tsv",
+                        help="summary table file name inside the output folder")
+    parser.add_argument("--stats", action="store_true",
+                        help="write per-stage times and counters of each analysis as JSON")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile file of each analysis")
+    parser.add_argument("--export", default=None, metavar="FILE",
+                        help="also write the records of every analysis inside the output "
+                             "folder as .jsonl, .csv or .parquet")
+    args = parser.parse_args(argv)
+
+    filenames = expand_inputs(args.inputs)
+    if not filenames:
+        parser.error("no structure files match {}".format(" ".join(args.inputs)))
+    analyses = args.analysis or list(ANALYSES)
+    rows = run_batch(filenames, analyses, args.output, args.jobs, args.summary,
+                     args.stats, args.profile, args.export)
+    failed = [row for row in rows if row[-1] != "ok"]
+    print("Ran {} analyses on {} structures, {} failed; summary in {}".format(
+        len(rows), len(filenames), len(failed), os.path.join(args.output, args.summary)))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
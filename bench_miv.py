@@ -0,0 +1,289 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .structure_miv import Structure, load_structure, object_name
+    from .batch_miv import ANALYSES, expand_inputs
+except ImportError:
+    from structure_miv import Structure, load_structure, object_name
+    from batch_miv import ANALYSES, expand_inputs
+
+############################################################
+###################  Benchmark Harness  ####################
+############################################################
+
+# The bundled test structures benchmarked when no inputs are given
+DEFAULT_INPUTS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "PDB_Files")]
+
+# Name of the benchmark entry that times reading the file itself
+PARSE = "parse"
+
+# Space in angstroms left between the tiled copies of a synthetic structure,
+# wider than every analysis cutoff so copies never interact
+_TILE_GAP = 10.0
+
+def tile_structure(structure, copies):
+    '''
+    This function will build a synthetic larger structure from copies of a
+    structure laid out side by side on a grid, so analyses can be timed on
+    sizes beyond the bundled files while their per-copy results stay the same
+
+    **Parameters**
+
+    structure: *Structure*
+        The structure to copy
+
+    copies: *int*
+        The number of copies
+
+    **Returns**
+
+        Structure of copies times the atoms, named e.g. 1kx5_x8
+    '''
+    if copies == 1:
+        return structure
+    side = int(np.ceil(copies ** (1.0 / 3.0)))
+    grid = np.array([(i, j, k) for i in range(side) for j in range(side)
+                     for k in range(side)][:copies], dtype=np.float32)
+    extent = np.ptp(structure.coords, axis=0) + _TILE_GAP if len(structure) else np.zeros(3)
+    shifts = (grid * extent)[:, np.newaxis, :]
+    coords = (structure.coords[np.newaxis, :, :] + shifts).reshape(-1, 3)
+    fields = [np.tile(getattr(structure, field), copies) for field, _ in Structure.FIELDS]
+    name = "{}_x{}.pdb".format(structure.object_name, copies)
+    return Structure(*fields, coords=coords, filename=name)
+
+def _measure(function, structure, kwargs, repeat):
+    '''
+    This function will time an analysis several times and then measure its
+    peak traced memory in one extra run, since tracing slows the code down
+
+    **Parameters**
+
+    function: *function*
+        The analysis, called as function(structure, **kwargs)
+
+    structure: *Structure*
+        The structure to analyze
+
+    kwargs: *dict*
+        Keyword arguments of the analysis
+
+    repeat: *int*
+        The number of timed runs
+
+    **Returns**
+
+        List of the run times in seconds and the peak memory in bytes
+    '''
+    times = []
+    with open(os.devnull, "w", encoding="utf8") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(structure, **kwargs)
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            function(structure, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return times, peak
+
+def _parse_file(filename):
+    '''
+    This function will read a structure file without the structure cache
+    '''
+    return load_structure(filename, cache=None)
+
+def run_benchmarks(filenames, analyses, scales=(1,), repeat=3):
+    '''
+    This function will time reading every structure file and every analysis on
+    every structure and its tiled copies
+
+    **Parameters**
+
+    filenames: *list*
+        Structure file names
+
+    analyses: *list*
+        Names of the analyses to run (keys of batch_miv.ANALYSES)
+
+    scales: *tuple*
+        Numbers of copies each structure is tiled into, 1 for the file itself
+
+    repeat: *int*
+        The number of timed runs of every benchmark
+
+    **Returns**
+
+        List of result dictionaries, one per structure, scale and benchmark
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for filename in filenames:
+            times, peak = _measure(_parse_file, filename, {}, repeat)
+            structure = load_structure(filename, cache=None)
+            results.append(_result(structure.object_name, PARSE, len(structure), times, peak))
+            for copies in scales:
+                scaled = tile_structure(structure, copies)
+                for name in analyses:
+                    function, pml_name, _ = ANALYSES[name]
+                    kwargs = {}
+                    if pml_name is not None:
+                        kwargs["pml_file"] = os.path.join(scratch, pml_name)
+                    times, peak = _measure(function, scaled, kwargs, repeat)
+                    results.append(_result(scaled.object_name, name, len(scaled), times, peak))
+    return results
+
+def _result(structure_name, benchmark, atoms, times, peak):
+    '''
+    This function will summarize the runs of one benchmark
+
+    **Parameters**
+
+    structure_name: *str*
+        The name of the benchmarked structure
+
+    benchmark: *str*
+        The analysis name, or parse
+
+    atoms: *int*
+        The number of atoms of the structure
+
+    times: *list*
+        The run times in seconds
+
+    peak: *int*
+        The peak traced memory in bytes
+
+    **Returns**
+
+        Dictionary of the benchmark result
+    '''
+    median = statistics.median(times)
+    return {"structure": structure_name, "benchmark": benchmark, "atoms": atoms,
+            "repeat": len(times), "seconds_min": round(min(times), 6),
+            "seconds_median": round(median, 6),
+            "atoms_per_second": round(atoms / median, 1) if median > 0 else None,
+            "peak_bytes": peak}
+
+def environment():
+    '''
+    This function will describe the machine and library versions a benchmark ran with
+
+    **Parameters**
+
+    None
+
+    **Returns**
+
+        Dictionary of the benchmark environment
+    '''
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.005):
+    '''
+    This function will compare benchmark results against a saved baseline and
+    report every benchmark that got slower or used more memory than allowed
+
+    **Parameters**
+
+    results: *list*
+        Result dictionaries of run_benchmarks
+
+    baseline: *list*
+        Result dictionaries of an earlier run
+
+    tolerance: *float*
+        The allowed relative increase of median time and peak memory (0.25 is 25%)
+
+    min_seconds: *float*
+        Benchmarks faster than this in the baseline are too noisy to compare times
+
+    **Returns**
+
+        List of regression dictionaries with the metric, baseline and new values
+    '''
+    saved = {(entry["structure"], entry["benchmark"]): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = saved.get((entry["structure"], entry["benchmark"]))
+        if old is None:
+            continue
+        for metric in ("seconds_median", "peak_bytes"):
+            if metric == "seconds_median" and old[metric] < min_seconds:
+                continue
+            if entry[metric] > old[metric] * (1 + tolerance):
+                regressions.append({"structure": entry["structure"],
+                                    "benchmark": entry["benchmark"], "metric": metric,
+                                    "baseline": old[metric], "value": entry[metric],
+                                    "ratio": round(entry[metric] / max(old[metric], 1e-12), 3)})
+    return regressions
+
+def main(argv=None):
+    '''
+    This function will run the benchmarks from the command line and write them as JSON
+
+    **Parameters**
+
+    argv: *list*
+        Command line arguments, or None to use sys.argv
+
+    **Returns**
+
+        Exit status, 1 if any benchmark regressed against the baseline
+    '''
+    parser = argparse.ArgumentParser(
+        description="Time the PyMIV analyses over structure files and tiled copies of them")
+    parser.add_argument("inputs", nargs="*", default=DEFAULT_INPUTS,
+                        help="directories, glob patterns or files (default: PDB_Files)")
+    parser.add_argument("-a", "--analysis", action="append", choices=sorted(ANALYSES),
+                        help="analysis to time, may be repeated (default: all)")
+    parser.add_argument("-s", "--scale", type=int, action="append",
+                        help="number of tiled copies to also time, may be repeated (default: 1)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="timed runs per benchmark (default: 3)")
+    parser.add_argument("-o", "--output", default="bench_miv.json",
+                        help="JSON file for the results (default: bench_miv.json)")
+    parser.add_argument("-b", "--baseline",
+                        help="JSON file of an earlier run to check for regressions")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown or memory growth (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    filenames = expand_inputs(args.inputs)
+    if not filenames:
+        parser.error("no structure files match {}".format(" ".join(args.inputs)))
+    analyses = args.analysis or list(ANALYSES)
+    results = run_benchmarks(filenames, analyses, args.scale or [1], args.repeat)
+    report = {"environment": environment(), "results": results}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf8") as basefile:
+            report["regressions"] = compare(results, json.load(basefile)["results"],
+                                            args.tolerance)
+    with open(args.output, "w", encoding="utf8") as outfile:
+        json.dump(report, outfile, indent=1)
+
+    for entry in results:
+        print("{:<14} {:<12} {:>9} atoms {:>10.4f} s {:>12.0f} atoms/s {:>8.1f} MB".format(
+            entry["structure"], entry["benchmark"], entry["atoms"], entry["seconds_median"],
+            entry["atoms_per_second"] or 0, entry["peak_bytes"] / 1e6))
+    for regression in report.get("regressions", []):
+        print("REGRESSION {structure} {benchmark} {metric}: {baseline} -> {value} "
+              "({ratio}x)".format(**regression))
+    print("Wrote {} benchmarks to {}".format(len(results), args.output))
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
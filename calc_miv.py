@@ -1,9 +1,151 @@
 import math
+from collections import OrderedDict
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .structure_miv import Structure, load_structure
+    from .neighbor_miv import CellList, spread_models
+    from .emit_miv import PymolScript
+    from .stats_miv import AnalysisStats
+    from .dssp_miv import ALPHA_HELIX, assign_secondary_structure
+    from .hbond_miv import HBOND_ANGLE, HBOND_DISTANCE, find_hbonds
+    from .contact_miv import CONTACT_CUTOFFS, find_contacts
+    from .results_miv import (AnalysisResult, interaction_records, residue_records,
+                              value_records)
+except ImportError:
+    from structure_miv import Structure, load_structure
+    from neighbor_miv import CellList, spread_models
+    from emit_miv import PymolScript
+    from stats_miv import AnalysisStats
+    from dssp_miv import ALPHA_HELIX, assign_secondary_structure
+    from hbond_miv import HBOND_ANGLE, HBOND_DISTANCE, find_hbonds
+    from contact_miv import CONTACT_CUTOFFS, find_contacts
+    from results_miv import (AnalysisResult, interaction_records, residue_records,
+                             value_records)
+
+# Three letter residue names to single amino acid code
+AMINO_ACIDS={
+    "ALA":"A", "CYS":"C", "ASP":"D", "GLU":"E", "PHE":"F", "GLY":"G",
+    "HIS":"H", "ILE":"I", "LYS":"K", "LEU":"L", "MET":"M", "MSE":"M",
+    "ASN":"N", "PRO":"P", "GLN":"Q", "ARG":"R", "SER":"S", "THR":"T",
+    "VAL":"V", "TRP":"W", "UNK":"X", "TYR":"Y",
+}
 
 ############################################################
 #####################  Core Functions  #####################
 ############################################################
 
+class AnalysisCancelled(Exception):
+    '''
+    This exception is raised from a progress callback to stop a running analysis
+    '''
+
+def report_progress(progress, fraction, message):
+    '''
+    This function will pass the progress of an analysis to an optional callback
+
+    **Parameters**
+
+    progress: *callable*
+        A function taking the fraction done and a message, or None.
+        It may raise AnalysisCancelled to stop the analysis
+
+    fraction: *float*
+        The fraction of the analysis done, from 0 to 1
+
+    message: *str*
+        A short description of the current step
+
+    **Returns**
+
+        None
+    '''
+    if progress is not None:
+        progress(fraction, message)
+
+def scaled_progress(progress, start, stop):
+    '''
+    This function will narrow a progress callback to one stage of an analysis,
+    so a search can report, and be cancelled, from inside its own loops
+
+    **Parameters**
+
+    progress: *callable*
+        A function taking the fraction done and a message, or None
+
+    start, stop: *float*
+        The fractions of the whole analysis the stage starts and stops at
+
+    **Returns**
+
+        A function taking the fraction of the stage done and a message, or None
+    '''
+    if progress is None:
+        return None
+    return lambda fraction, message: progress(start + (stop - start) * fraction, message)
+
+def model_pairs(structure, atoms, cutoff, stats=None, progress=None):
+    '''
+    This function will find the pairs of the given atoms closer than a cutoff
+    within every model of a structure, all models in one cell list search
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    atoms: *numpy.ndarray*
+        Array of the atom indices to pair
+
+    cutoff: *float*
+        The distance in angstroms
+
+    stats: *AnalysisStats*
+        Counts the pairs evaluated, or None
+
+    progress: *callable*
+        A function taking the fraction of the search done and a message, or None
+
+    **Returns**
+
+        Array of model numbers, array of first and array of second positions
+        in atoms (the first always smaller) and array of distances, ordered by
+        model, first and second position
+    '''
+    if cutoff <= 0:
+        # No pair is closer than a cutoff of zero, e.g. for an empty rule set
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, np.zeros(0)
+    cell_list = CellList(spread_models(structure.models[:, atoms], cutoff), cutoff)
+    first, second, distance = cell_list.query_pairs(progress=progress)
+    if stats is not None:
+        stats.count("pairs_evaluated", cell_list.candidates)
+    model, first = np.divmod(first, max(len(atoms), 1))
+    return model, first, second % max(len(atoms), 1), distance
+
+def print_model_counts(structure, model, label):
+    '''
+    This function will print how many bonds each model of an ensemble has
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    model: *numpy.ndarray*
+        The model number of each bond found
+
+    label: *str*
+        What was counted (e.g. disulfide bonds)
+
+    **Returns**
+
+        None
+    '''
+    print("\n{} per model:".format(label[0].upper() + label[1:]))
+    for number, count in enumerate(np.bincount(model, minlength=structure.model_count), 1):
+        print("Model {}: {}".format(number, count))
+
 def pdb_read(pdbfile):
     '''
     This function will read into a PDB file format using the readlines command
@@ -306,876 +448,1118 @@ def strip_ca_atoms(pdb, ca_atoms):
             returnedlist.append(line)
     return returnedlist
 
+def ca_sequence(structure):
+    '''
+    This function will list the residue names of a structure in
+    chain order using the C-alpha atom of each residue
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    **Returns**
+
+        List of three letter residue names, one per C-alpha atom
+    '''
+    return structure.resn[structure.select(name="CA", record="ATOM")].tolist()
+
+def one_letter_sequence(structure):
+    '''
+    This function will convert the C-alpha residues of a structure into single amino acid code
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    **Returns**
+
+        List of single letter amino acid codes, with X for unknown residues
+    '''
+    return [AMINO_ACIDS.get(resn, "X") for resn in ca_sequence(structure)]
+
 ############################################################
 ###################  Output Peptide FASTA  #################
 ############################################################
 
-def output_fasta(filename=str, fasta_seq_list=list):
+def output_fasta(filename=str, fasta_seq_list=list, progress=None, stats=None):
     '''
     This function will output a text of FASTA sequence of peptide in single amino acid code
 
     **Parameters**
 
-    filename: *str*
-        A string of the input PDB file
+    filename: *str or Structure*
+        A string of the input PDB file, or an already parsed Structure
 
     fasta_seq_list: *list*
         An empty list to be appended to with the single amino acid code of the peptide
 
+    progress: *callable*
+        A function taking the fraction done and a message, or None (see report_progress)
 
+    stats: *AnalysisStats*
+        Collects the time of each stage and the atoms and pairs counted, or None
 
     **Returns*
-    
-        Appended list an fasta sequecne of given peptide in PDB file
+
+        AnalysisResult with one sequence record per residue holding its
+        single letter code, and the fasta sequecne of given peptide in its values
     '''
-    aminoacid={}
-    aminoacid["ALA"]="A"
-    aminoacid["CYS"]="C"
-    aminoacid["ASP"]="D"
-    aminoacid["GLU"]="E"
-    aminoacid["PHE"]="F"
-    aminoacid["GLY"]="G"
-    aminoacid["HIS"]="H"
-    aminoacid["ILE"]="I"
-    aminoacid["LYS"]="K"
-    aminoacid["LEU"]="L"
-    aminoacid["MET"]="M"
-    aminoacid["MSE"]="M"
-    aminoacid["ASN"]="N"
-    aminoacid["PRO"]="P"
-    aminoacid["GLN"]="Q"
-    aminoacid["ARG"]="R"
-    aminoacid["SER"]="S"
-    aminoacid["THR"]="T"
-    aminoacid["VAL"]="V"
-    aminoacid["TRP"]="W"
-    aminoacid["UNK"]="X"
-    aminoacid["TYR"]="Y"
-
-    # read in a pdb file from command line:
-
-    pdbfileraw=open(filename,"r", encoding="utf8")
-    pdbfilelist=pdbfileraw.readlines()
-
-    # make a list for storing amino acids
-    aalist=[]
-
-    for line in pdbfilelist:
-        if line[0:4]=="ATOM":
-            # here only look at CA lines
-            if line[13:15]=="CA":
-            #copy residue type into list
-                aalist.append(line[17:20])
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("output_fasta") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
 
     # here output in FASTA format, with first line beginning with ">" and having info about sequence
-    counter=0 # for printing out nicely
-    fasta_seq_list=[]
-    print(">"+filename)
-    for letter in aalist:
-        if letter in aminoacid:
-            fasta_seq_list.append(aminoacid[letter])
-            print(aminoacid[letter],end="")
-        else:
-            fasta_seq_list.append("X")
-            print("X",end="")
-    if (counter+1)%40==0:
-        print()
-    counter+=1
+    stats.start("filter")
+    fasta_seq_list=one_letter_sequence(structure)
+    stats.count("residues", len(fasta_seq_list))
+    stats.start("print")
+    print(">"+structure.filename)
+    print(*fasta_seq_list, sep="", end="")
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("fasta", structure.object_name, residue_records(
+        structure, "sequence", structure.select(name="CA", record="ATOM"), fasta_seq_list),
+                          {"sequence": "".join(fasta_seq_list)})
 
 ############################################################
 ###################  Detect Sulfide Bonds  #################
 ############################################################
 
-def calc_disulfide(filename=str):
+def calc_disulfide(filename=str, pml_file="disulfide_bonds.pml", progress=None,
+                   script=None, stats=None):
     '''
-        This function will calculate any disulfide bonds in a PDB file and display in PyMOL 
+        This function will calculate any disulfide bonds in a PDB file and display in PyMOL
 
         **Parameters**
 
-        filename: *string*
-            A string with the PDB file name (e.g. 1fdl.pdb)
-        **Returns**
+        filename: *str or Structure*
+            A string with the PDB file name (e.g. 1fdl.pdb), or an already parsed Structure
 
-            Text of residues with connecting disulfiude bonds
-            PyMOL Viewer Structure with disulfiees highlighted and bonds drawn
-        '''
-    # Initialize reading into PDB file and converting into a list of lines as strings
+        pml_file: *str*
+            The PyMOL script to write, or None to skip writing it
 
-    # To write a pml file
-    bondfile=open("disulfide_bonds.pml", "w",  encoding="utf8")
-    # pylint: disable=consider-using-f-string
-    bondfile.write("load {:}\n".format((filename)))
-    bondfile.write("remove resn hoh\n")
-    #bondfile.write("color green")
+        script: *PymolScript*
+            A script to add the PyMOL commands to, e.g. to apply them through
+            the pymol cmd API, or None to start a new one
 
-    #pdbfile=input("Enter a PDB file\n")
-    rawfile=open(filename,"r",  encoding="utf8")
-    pdblist=rawfile.readlines()
-    rawfile.close()
-    cys_list_unsorted=[]
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see report_progress)
 
-    # To find all the Cysteine residues in the PDB structure
-    residue_finder(pdblist,"CYS", cys_list_unsorted)
+        stats: *AnalysisStats*
+            Collects the time of each stage and the atoms and pairs counted, or None
+        **Returns**
 
-    # To sort all the Cysteine residues in acsending order
-    cys_sorted=sorted_pdb(cys_list_unsorted)
+            AnalysisResult with one disulfide record per pair of sulfur atoms
+            bonded in any model, with its distance in the first model and the
+            fraction of models having it
+            Text of residues with connecting disulfiude bonds, with the fraction
+            of models having each bond for an ensemble
+            PyMOL Viewer Structure with disulfiees highlighted and bonds drawn
+        '''
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("calc_disulfide") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    report_progress(progress, 0.4, "Searching cysteine pairs")
+
+    # To find all the Cysteine sulfur atoms in the PDB structure
+    # and sort them in acsending residue order
+    stats.start("filter")
+    cys_atoms = structure.select(resn="CYS", element="S", record="ATOM")
+    cys_sorted = cys_atoms[np.argsort(structure.resv[cys_atoms], kind="stable")]
+    stats.count("atoms_selected", len(cys_sorted))
 
     # To print out the total number of Cysteine residues in the PDB structure
     print("\nThere are",len(cys_sorted), "CYS residues")
 
-    # A dictionary where the keys are the Cys to Cys
-    # residue pairs and the values are the bond distances
-    cys_dist_list=[]
-    cyskeys= []
-    cysvalues = []
-    cysdict={}
+    # To find every sulfur pair within the accpetable 2.00 angstroms plus or minus 0.05
+    # with one neighbor query, kept as compact (atom, atom) index pairs
+    # in every model, merged into one list of bonds with the number of models having each
+    stats.start("distance")
+    model, first, second, distance = model_pairs(structure, cys_sorted, 2.05, stats,
+                                                scaled_progress(progress, 0.4, 0.8))
+    in_range = distance > 1.95
+    model = model[in_range]
+    bond_keys, bond_models = np.unique(first[in_range] * len(cys_sorted) + second[in_range],
+                                       return_counts=True)
+    first, second = np.divmod(bond_keys, max(len(cys_sorted), 1))
+    true_cys_bonds_list = np.column_stack((cys_sorted[second], cys_sorted[first]))
+    stats.count("pairs_found", len(model))
 
-    # To loop through the sorted Cysteine list of residues,
-    # and if residues are sequential, then calculate the potential bond distances and
-    # store in a new list, cys_dist_list
-    # pylint: disable=consider-using-enumerate
-    for i in range(len(cys_sorted)):
-        for j in range(i):
-            cys_dist_list.append(calcdistance(extractxyz(cys_sorted[i]), extractxyz(cys_sorted[j])))
+    # To print out the Cysteine RESN to Cysteine RESN combinations
+    stats.start("print")
+    print("There are", len(true_cys_bonds_list), "disulfide bonds\n")
+    print("DISULFDE BONDS ( 2 ± 0.05 Å )")
+    for (atom1, atom2), found in zip(true_cys_bonds_list, bond_models):
+        if structure.model_count > 1:
+            print(structure.residue_label(atom1), "---", structure.residue_label(atom2),
+                  "  occupancy {:.2f} ({}/{} models)".format(
+                      found / structure.model_count, found, structure.model_count))
+        else:
+            print(structure.residue_label(atom1), "---", structure.residue_label(atom2))
+    if structure.model_count > 1:
+        print_model_counts(structure, model, "disulfide bonds")
+    print("\nThanks for using me!")
 
-    # To provide the the potential S-S bond interactions")
-    potential_disulfide_list=[]
-    atom_to_atom(cys_sorted, potential_disulfide_list)
+    report_progress(progress, 0.8, "Writing PyMOL script")
+    stats.start("emit")
+    script = PymolScript() if script is None else script
+    commands = len(script)
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    for atom1, atom2 in true_cys_bonds_list:
+        script.dist("disulfide_bond", structure.atom_selection(atom1),
+                    structure.atom_selection(atom2))
+    # One named selection of the bonded residues, reused by the show and color calls
+    if len(true_cys_bonds_list):
+        cysteines = structure.object_name + "_disulfide"
+        script.select(cysteines, structure.residue_ranges(true_cys_bonds_list.ravel()))
+        script.show("sticks", cysteines)
+        script.color("atomic", cysteines)
+    #Additional changes to alter pymol image
+    script.hide("labels", "disulfide_bond")
+    script.set("dash_length", "0.2500")
+    script.set("dash_gap", "0.4")
+    script.set("dash_radius", ".15")
+    stats.count("commands", len(script) - commands)
+    if pml_file is not None:
+        stats.start("write")
+        script.write(pml_file)
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("disulfide", structure.object_name, interaction_records(
+        structure, "disulfide", true_cys_bonds_list,
+        occupancy=bond_models / structure.model_count),
+                          {"cysteines": len(cys_sorted), "bonds": len(true_cys_bonds_list)})
 
-    # To make list of Cysteine-Cysteine distances
-    for i in cys_dist_list:
-        cysvalues.append(i)
+############################################################
+#############  WC and Non-WC Nucleic Acid Interactions  ####
+############################################################
 
-    # To make list of Cysteine-Cysteine combinations
-    for i in potential_disulfide_list:
-        cyskeys.append(i)
+# Distance ranges in angstroms of the WC and of the non-WC hydrogen bonds
+WC_RANGE = (-1.0, 3.2)
+NWC_RANGE = (2.5, 3.2)
+
+# Distance range of each kind of base pair rule, in the order the kinds are reported
+BASE_PAIR_RANGES = OrderedDict((("WC", WC_RANGE), ("nWC", NWC_RANGE)))
+
+# Atom types of the base pair rules as (residue name suffix, atom name),
+# e.g. GO6 is the O6 atom of G. A suffix matches RNA and DNA residues alike
+# (G matches G and DG), and an atom may have several types (DG O6 is GO6 and DGO6)
+BASE_ATOM_TYPES = OrderedDict((
+    # WC RNA atoms
+    ("GO6", ("G", "O6")),
+    ("GN1", ("G", "N1")),
+    ("GN2", ("G", "N2")),
+
+    ("CN4", ("C", "N4")),
+    ("CN3", ("C", "N3")),
+    ("CO2", ("C", "O2")),
+
+    ("AN6", ("A", "N6")),
+    ("AN1", ("A", "N1")),
+
+    ("UO4", ("U", "O4")),
+    ("UN3", ("U", "N3")),
+
+    # WC DNA atoms
+    ("DGO6", ("DG", "O6")),
+    ("DGN1", ("DG", "N1")),
+    ("DGN2", ("DG", "N2")),
+
+    ("DCN4", ("DC", "N4")),
+    ("DCN3", ("DC", "N3")),
+    ("DCO2", ("DC", "O2")),
+
+    ("DAN6", ("DA", "N6")),
+    ("DAN1", ("DA", "N1")),
+
+    ("DTO4", ("DT", "O4")),
+    ("DTN3", ("DT", "N3")),
+
+    # Non-WC RNA atoms
+    ("GN3", ("G", "N3")),
+    ("GN7", ("G", "N7")),
+
+    ("AN7", ("A", "N7")),
+    ("AN9", ("A", "N9")),
+    ("AN3", ("A", "N3")),
+
+    ("UO2", ("U", "O2")),
+))
+
+# The hydrogen bond rules as (kind, atom type, atom type), reported in this
+# order. New rules are new rows and cost no extra pass over the structure
+BASE_PAIR_RULES = (
+    # WC RNA
+    ("WC", "GO6", "CN4"),
+    ("WC", "GN1", "CN3"),
+    ("WC", "GN2", "CO2"),
+
+    ("WC", "AN6", "UO4"),
+    ("WC", "AN1", "UN3"),
+
+    # WC DNA
+    ("WC", "DGO6", "DCN4"),
+    ("WC", "DGN1", "DCN3"),
+    ("WC", "DGN2", "DCO2"),
+
+    ("WC", "DAN6", "DTO4"),
+    ("WC", "DAN1", "DTN3"),
+
+    # Non-WC distances
+    # Series of all the atoms tested for hydrogen bond (these are all non-WC)
+
+    # Hoogsteen
+    ("nWC", "AN7", "UN3"),
+    ("nWC", "AN6", "UO4"),
+    ("nWC", "GN7", "CN3"),
+    # GO6
+    ("nWC", "GO6", "CO2"),
+    ("nWC", "GO6", "AN6"),
+    ("nWC", "GO6", "AN1"),
+    ("nWC", "GO6", "AN7"),
+    ("nWC", "GO6", "UN3"),
+    # GN1
+    ("nWC", "GN1", "GN3"),
+    ("nWC", "GN1", "GN7"),
+    ("nWC", "GN1", "AN1"),
+    ("nWC", "GN1", "AN3"),
+    ("nWC", "GN1", "AN7"),
+    ("nWC", "GN1", "UO4"),
+    ("nWC", "GN1", "UN3"),
+    # GN2
+    ("nWC", "GN2", "GN7"),
+    ("nWC", "GN2", "AN6"),
+    ("nWC", "GN2", "AN1"),
+    ("nWC", "GN2", "AN3"),
+    ("nWC", "GN2", "AN7"),
+    ("nWC", "GN2", "UO4"),
+    ("nWC", "GN2", "UN3"),
+    # GN3
+    ("nWC", "GN3", "GO6"),
+    ("nWC", "GN3", "CN3"),
+    ("nWC", "GN3", "CO2"),
+    ("nWC", "GN3", "AN6"),
+    ("nWC", "GN3", "AN1"),
+    ("nWC", "GN3", "AN3"),
+    ("nWC", "GN3", "UO4"),
+    ("nWC", "GN3", "UN3"),
+    # GN7
+    ("nWC", "GN7", "GN1"),
+    ("nWC", "GN7", "GN2"),
+    ("nWC", "GN7", "GN7"),
+    ("nWC", "GN7", "CN3"),
+    ("nWC", "GN7", "CO2"),
+    ("nWC", "GN7", "AN6"),
+    ("nWC", "GN7", "AN1"),
+    ("nWC", "GN7", "AN3"),
+    ("nWC", "GN7", "AN7"),
+    ("nWC", "GN7", "UO4"),
+    ("nWC", "GN7", "UN3"),
+    # AN6
+    ("nWC", "AN6", "GO6"),
+    ("nWC", "AN6", "GN2"),
+    ("nWC", "AN6", "GN3"),
+    ("nWC", "AN6", "GN7"),
+    ("nWC", "AN6", "CN3"),
+    ("nWC", "AN6", "CO2"),
+    ("nWC", "AN6", "UN3"),
+    # AN1
+    ("nWC", "AN1", "GO6"),
+    ("nWC", "AN1", "GN1"),
+    ("nWC", "AN1", "GN2"),
+    ("nWC", "AN1", "GN3"),
+    ("nWC", "AN1", "GN7"),
+    ("nWC", "AN1", "CN3"),
+    ("nWC", "AN1", "CO2"),
+    ("nWC", "AN1", "AN6"),
+    ("nWC", "AN1", "AN1"),
+    ("nWC", "AN1", "AN3"),
+    ("nWC", "AN1", "AN7"),
+    ("nWC", "AN1", "UO4"),
+    # AN7
+    ("nWC", "AN7", "GO6"),
+    ("nWC", "AN7", "GN1"),
+    ("nWC", "AN7", "GN2"),
+    ("nWC", "AN7", "GN7"),
+    ("nWC", "AN7", "CN3"),
+    ("nWC", "AN7", "CO2"),
+    ("nWC", "AN7", "AN1"),
+    ("nWC", "AN7", "AN3"),
+    ("nWC", "AN7", "UO4"),
+    ("nWC", "AN7", "UN3"),
+    # AN3
+    ("nWC", "AN3", "GO6"),
+    ("nWC", "AN3", "GN1"),
+    ("nWC", "AN3", "GN2"),
+    ("nWC", "AN3", "GN3"),
+    ("nWC", "AN3", "GN7"),
+    ("nWC", "AN3", "CN3"),
+    ("nWC", "AN3", "CO2"),
+    ("nWC", "AN3", "AN6"),
+    ("nWC", "AN3", "AN7"),
+    ("nWC", "AN3", "AN9"),
+    ("nWC", "AN3", "UO4"),
+    ("nWC", "AN3", "UN3"),
+    # UO4
+    ("nWC", "UO4", "GN1"),
+    ("nWC", "UO4", "GN2"),
+    ("nWC", "UO4", "GN3"),
+    ("nWC", "UO4", "GN7"),
+    ("nWC", "UO4", "CN3"),
+    ("nWC", "UO4", "CO2"),
+    ("nWC", "UO4", "AN1"),
+    ("nWC", "UO4", "AN3"),
+    ("nWC", "UO4", "AN7"),
+    # UN3
+    ("nWC", "UN3", "GO6"),
+    ("nWC", "UN3", "GN1"),
+    ("nWC", "UN3", "GN2"),
+    ("nWC", "UN3", "GN3"),
+    ("nWC", "UN3", "GN7"),
+    ("nWC", "UN3", "CN3"),
+    ("nWC", "UN3", "CO2"),
+    ("nWC", "UN3", "AN6"),
+    ("nWC", "UN3", "AN3"),
+    ("nWC", "UN3", "AN7"),
+    ("nWC", "UN3", "UO4"),
+    ("nWC", "UO4", "UO2"),
+    # CN4
+    ("nWC", "CN4", "GN3"),
+    ("nWC", "CN4", "GN7"),
+    ("nWC", "CN4", "AN1"),
+    ("nWC", "CN4", "AN3"),
+    ("nWC", "CN4", "AN7"),
+    ("nWC", "CN4", "UO4"),
+    ("nWC", "CN4", "UN3"),
+    # CN3
+    ("nWC", "CN3", "GN3"),
+    ("nWC", "CN3", "GN7"),
+    ("nWC", "CN3", "AN6"),
+    ("nWC", "CN3", "AN1"),
+    ("nWC", "CN3", "AN3"),
+    ("nWC", "CN3", "AN7"),
+    ("nWC", "CN3", "UO4"),
+    ("nWC", "CN3", "UN3"),
+    # CO2
+    ("nWC", "CO2", "GO6"),
+    ("nWC", "CO2", "GN3"),
+    ("nWC", "CO2", "GN7"),
+    ("nWC", "CO2", "AN6"),
+    ("nWC", "CO2", "AN1"),
+    ("nWC", "CO2", "AN3"),
+    ("nWC", "CO2", "AN7"),
+    ("nWC", "CO2", "UO4"),
+    ("nWC", "CO2", "UN3"),
+)
+
+class BasePairRules:
+    '''
+    This class compiles the base pair rule table for one structure. Every atom
+    gets the set of atom types it has, each type looked up in the atom index
+    of the structure, and a lookup table lists the rules each pair of type sets
+    satisfies, so all rules are matched against the neighbor pairs of any
+    number of models or trajectory frames in one vectorized pass
 
-    # To make a dictionary matching the residue combination to the bond distance
-    # pylint: disable=consider-using-enumerate
-    for i in range(len(cyskeys)):
-        cysdict[cyskeys[i]] = cysvalues[i]
+    **Attributes**
 
-    # To detect if a potential disulfide bond is within
-    # the accpetable 2.00 angstroms plus or minus 0.05
+    atoms: *numpy.ndarray*
+        Array of the indices of the atoms having any atom type, to pair with a neighbor search
 
-    # pylint: disable=consider-using-dict-items
-    cys_vtk = {i for i in cysdict if 2.05 >cysdict[i] > 1.95}
-    true_cys_bonds_list = list(cys_vtk)
-    true_cys_dist_list = list()
-    for i in cysdict.values():
-        if 2.05 > i> 1.95:
-            true_cys_dist_list.append(i)
+    kinds: *numpy.ndarray*
+        The kind (WC or nWC) of each rule
 
+    cutoff: *float*
+        The largest bond distance of any rule in angstroms
+    '''
+    def __init__(self, structure, rules=BASE_PAIR_RULES, atom_types=BASE_ATOM_TYPES):
+        bits = {name: bit for bit, name in enumerate(atom_types)}
+        # Each atom type is one lookup in the atom index of the structure, its
+        # residue name suffix matched against the distinct residue names only
+        resn_values = structure.index.values["resn"].tolist()
+        atom_bits = np.zeros(len(structure), dtype=np.int64)
+        for bit, (suffix, atom) in enumerate(atom_types.values()):
+            residues = [resn for resn in resn_values if resn.endswith(suffix)]
+            atom_bits[structure.select(resn=residues, name=atom, record="ATOM")] |= 1 << bit
+        self.atoms = np.flatnonzero(atom_bits)
+
+        # Atoms with the same set of types share one row and column of the lookup table
+        combos, combo = np.unique(atom_bits[self.atoms], return_inverse=True)
+        self._combo = np.full(len(structure), -1, dtype=np.int64)
+        self._combo[self.atoms] = combo.ravel()
+        self._combos = len(combos)
+
+        self.kinds = np.array([kind for kind, _, _ in rules])
+        first = np.array([bits[type1] for _, type1, _ in rules], dtype=np.int64)
+        second = np.array([bits[type2] for _, _, type2 in rules], dtype=np.int64)
+        lower_upper = np.array([BASE_PAIR_RANGES[kind] for kind in self.kinds]).reshape(-1, 2)
+        self.lower, self.upper = lower_upper[:, 0], lower_upper[:, 1]
+        self.cutoff = float(self.upper.max()) if len(rules) else 0.0
+        has_first = (combos[:, np.newaxis] >> first) & 1
+        has_second = (combos[:, np.newaxis] >> second) & 1
+        matches = has_first[:, np.newaxis, :] & has_second[np.newaxis, :, :]
+        keys, self._rules = np.nonzero(matches.reshape(self._combos ** 2, len(rules)))
+        self._starts = np.searchsorted(keys, np.arange(self._combos ** 2 + 1))
+
+    def __repr__(self):
+        return "<BasePairRules {} rules over {} atoms>".format(len(self.kinds), len(self.atoms))
+
+    def match(self, pair_atoms, pair_distance, pair_model):
+        '''
+        This function will find the rules every neighbor pair satisfies, in
+        both directions, and keep the bonds within the distance range of their rule
 
-    # To print out the Cysteine RESN to Cysteine RESN combinations
-    print("There are", len(true_cys_dist_list), "disulfide bonds\n")
-    print("DISULFDE BONDS ( 2 ± 0.05 Å )")
+        **Parameters**
 
-    # To print the joined_list
-    for i in true_cys_bonds_list:
-        print(i[17:27], "---", i[97:107],)
-    print("\nThanks for using me!")
+        pair_atoms: *numpy.ndarray*
+            Integer array of shape (pairs, 2) of neighboring atom indices
 
-    for line in true_cys_bonds_list:
-        # pylint: disable=line-too-long
-        #print("dist disulfide_bond, /{}//{}/{}`{}/{},/{}//{}/{}`{}/{}\n".format(extract_pdb_path(filename), line[21:22],line[17:20],remove(line[23:26]),line[13:16], extract_pdb_path(filename),line[102:103],remove(line[98:102]),remove(line[103:107]),line[94:96]))
-        bondfile.write("dist disulfide_bond, /{}//{}/{}`{}/{},/{}//{}/{}`{}/{}\n".format(extract_pdb_path(filename), line[21:22],line[17:20],remove(line[23:26]),line[13:16], extract_pdb_path(filename),line[102:103],remove(line[98:102]),remove(line[103:107]),line[94:96]))
-        bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename), line[21:22],line[17:20],remove(line[23:26])))
-        bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename),line[102:103],remove(line[98:102]),remove(line[103:107])))
-        bondfile.write("color atomic, /{}//{}/{}`{}\n".format(extract_pdb_path(filename), line[21:22],line[17:20],remove(line[23:26])))
-        bondfile.write("color atomic, /{}//{}/{}`{}\n".format(extract_pdb_path(filename),line[102:103],remove(line[98:102]),remove(line[103:107])))
-        bondfile.write("color atomic, disulfide")
-        bondfile.write("show sticks, disulfide")
-#Additional changes to alter pymol image
-    bondfile.write("\nhide labels, disulfide_bond\n")
-    bondfile.write("set dash_length, 0.2500\n")
-    bondfile.write("set dash_gap, 0.4\n")
-    bondfile.write("set dash_radius, .15\n")
+        pair_distance: *numpy.ndarray*
+            The distance of each pair
 
-############################################################
-#############  WC and Non-WC Nucleic Acid Interactions  ####
-############################################################
+        pair_model: *numpy.ndarray*
+            The model or frame of each pair
+
+        **Returns**
 
-def calc_wc_nwc(filename=str):
+            OrderedDict of each kind (WC, nWC) to the array of the rule of every
+            bond, the integer array of shape (bonds, 2) of its atoms and the
+            array of its model, ordered by rule, direction and pair
+        '''
+        rule, direction, pair = [], [], []
+        for reverse, (atom1, atom2) in enumerate(((0, 1), (1, 0))):
+            keys = (self._combo[pair_atoms[:, atom1]] * self._combos
+                    + self._combo[pair_atoms[:, atom2]])
+            counts = self._starts[keys + 1] - self._starts[keys]
+            owner = np.repeat(np.arange(len(keys)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            satisfied = self._rules[self._starts[keys][owner] + offsets]
+            distance = pair_distance[owner]
+            keep = (distance > self.lower[satisfied]) & (distance < self.upper[satisfied])
+            rule.append(satisfied[keep])
+            direction.append(np.full(np.count_nonzero(keep), reverse))
+            pair.append(owner[keep])
+        rule, direction, pair = (np.concatenate(rule), np.concatenate(direction),
+                                 np.concatenate(pair))
+        order = np.lexsort((pair, direction, rule))
+        rule, direction, pair = rule[order], direction[order], pair[order]
+        bonds = np.where(direction[:, np.newaxis] == 1, pair_atoms[pair][:, ::-1],
+                         pair_atoms[pair]).reshape(-1, 2)
+        found = OrderedDict()
+        for kind in BASE_PAIR_RANGES:
+            of_kind = self.kinds[rule] == kind
+            found[kind] = (rule[of_kind], bonds[of_kind], pair_model[pair][of_kind])
+        return found
+
+def calc_wc_nwc(filename=str, pml_file="get_bonds.pml", progress=None,
+                script=None, stats=None):
     '''
-    This function calculate all Watson-Crick 
+    This function calculate all Watson-Crick
     and Non Watson-Crick bonds in a nucleic acid PDB file
 
     **Parameters**
 
-    filename: *str*
-        A string of the input PDB file
+    filename: *str or Structure*
+        A string of the input PDB file, or an already parsed Structure
 
-    **Returns*
-    
-        Appended list an fasta sequecne of given peptide in PDB file
-    '''
-    # To write a pml file
-    bondfile=open("get_bonds.pml", "w", encoding="utf8")
-    # pylint: disable=consider-using-f-string
-    bondfile.write("load {:}\n".format((filename)))
-    bondfile.write("remove resn hoh\n")
-    #bondfile.write("color green")
+    pml_file: *str*
+        The PyMOL script to write, or None to skip writing it
 
-    rawfile = open(filename, "r", encoding="utf8")
-    pdblist=rawfile.readlines()
-    rawfile.close()
+    script: *PymolScript*
+        A script to add the PyMOL commands to, e.g. to apply them through
+        the pymol cmd API, or None to start a new one
 
-    def wc_dist(list1=list, list2=list):
-        '''
-        This function will calc distance between two lists of WC atoms and write .pml
-
-        **Parameters**
+    progress: *callable*
+        A function taking the fraction done and a message, or None (see report_progress)
 
-        list1: *list*
-            First list of atoms
+    stats: *AnalysisStats*
+        Collects the time of each stage and the atoms and pairs counted, or None
 
-        list2: *list*
-            Second list of atoms
+    **Returns*
 
-        **Returns*
-        
-            Sorted list by acsending resiue number position
-        '''
-        for line in list1:
-            dist1=extractxyz(line)
-            for i in list2:
-                dist2=extractxyz(i)
-                distance = calcdistance(dist1, dist2)
-                if distance < 3.2:
-                    # pylint: disable=line-too-long
-                    bondfile.write("dist WC_hbond, /{}//{}/{}`{}/{} ,/{}//{}/{}`{}/{} , 3.2 \n".format(extract_pdb_path(filename), remove(line[21:22]),remove(line[18:20]),remove(line[23:26]),remove(line[13:16]), extract_pdb_path(filename),i[21:22],remove(i[18:20]),remove(i[23:26]),remove(i[13:15])))
-
-    def nwc_dist(list1=list, list2=list):
+        AnalysisResult with one WC or nWC record per pair of atoms bonded in
+        any model, with its distance in the first model and the fraction of
+        models having it
+        Text of the bonds per model and their occupancy for an ensemble
+        PyMOL script `get_bonds.pml` with the WC and non-WC hydrogen bonds
+    '''
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("calc_wc_nwc") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    stats.start("filter")
+    def merge_models(found):
         '''
-        This function will calc distance between two lists of non-WC atoms and write .pml
+        This function will merge the pairs every rule found in every model into
+        one list in the order they were first found
 
         **Parameters**
 
-        list1: *list*
-            First list of atoms
+        found: *tuple*
+            The rule, atom pair and model arrays of BasePairRules.match
 
-        list2: *list*
-            Second list of atoms
+        **Returns**
 
-        **Returns*
-        
-            Sorted list by acsending resiue number position
+            Integer array of shape (bonds, 2) of atom index pairs
         '''
-        for line in list1:
-            dist1=extractxyz(line)
-            for i in list2:
-                dist2=extractxyz(i)
-                distance = calcdistance(dist1, dist2)
-                if 2.5 < distance < 3.2:
-                    # pylint: disable=line-too-long
-                    bondfile.write("dist Non_WC_hbond, /{}//{}/{}`{}/{},/{}//{}/{}`{}/{} , 3.2\n".format(extract_pdb_path(filename),line[21:22],line[19:20],remove(line[23:26]),line[13:16], extract_pdb_path(filename),i[21:22],i[19:20],i[23:26],i[13:15]))
-    #lists of WC RNA bonding atoms
+        rule, pairs, _ = found
+        keys = (rule * len(structure) + pairs[:, 0]) * len(structure) + pairs[:, 1]
+        _, first = np.unique(keys, return_index=True)
+        return pairs[np.sort(first)]
 
-    #Guanine
-    #pylint: disable=invalid-name
-    GO6=[]
-    GN1=[]
-    GN2=[]
-
-    #Cytosine
-    CN4=[]
-    CN3=[]
-    CO2=[]
+    def occupancy(found):
+        '''
+        This function will count the models each bonded atom pair is found in by any rule
 
-    #Adenine
-    AN6=[]
-    AN1=[]
+        **Parameters**
 
-    #Uracil
-    UO4=[]
-    UN3=[]
+        found: *tuple*
+            The rule, atom pair and model arrays of BasePairRules.match
 
-    #lists of WC DNA bonding atoms
+        **Returns**
 
-    #Guanine
-    #pylint: disable=invalid-name
-    DGO6=[]
-    DGN1=[]
-    DGN2=[]
-
-    #Cytosine
-    DCN4=[]
-    DCN3=[]
-    DCO2=[]
-
-    #Adenine
-    DAN6=[]
-    DAN1=[]
-
-    #Uracil
-    DTO4=[]
-    DTN3=[]
-
-    #lists of Non-WC bonding atoms
-
-    #Guanine
-    GN3=[]
-    GN9=[]
-    GN7=[]
-
-    #Adenine
-    AN7=[]
-    AN9=[]
-    AN3=[]
-
-    #Uracil
-    UO2=[]
-
-    #WC RNA atoms
-    (rna_atom_finder(pdblist,"G","O6 ",GO6))
-    (rna_atom_finder(pdblist,"G","N1 ",GN1))
-    (rna_atom_finder(pdblist,"G","N2 ",GN2))
-
-    (rna_atom_finder(pdblist,"C","N4 ",CN4))
-    (rna_atom_finder(pdblist,"C","N3 ",CN3))
-    (rna_atom_finder(pdblist,"C","O2 ",CO2))
-
-    (rna_atom_finder(pdblist,"A","N6 ",AN6))
-    (rna_atom_finder(pdblist,"A","N1 ",AN1))
-
-    (rna_atom_finder(pdblist,"U","O4 ",UO4))
-    (rna_atom_finder(pdblist,"U","N3 ",UN3))
-
-    #WC DNA atoms
-    (dna_atom_finder(pdblist,"DG","O6 ",DGO6))
-    (dna_atom_finder(pdblist,"DG","N1 ",DGN1))
-    (dna_atom_finder(pdblist,"DG","N2 ",DGN2))
-
-    (dna_atom_finder(pdblist,"DC","N4 ",DCN4))
-    (dna_atom_finder(pdblist,"DC","N3 ",DCN3))
-    (dna_atom_finder(pdblist,"DC","O2 ",DCO2))
-
-    (dna_atom_finder(pdblist,"DA","N6 ",DAN6))
-    (dna_atom_finder(pdblist,"DA","N1 ",DAN1))
-
-    (dna_atom_finder(pdblist,"DT","O4 ",DTO4))
-    (dna_atom_finder(pdblist,"DT","N3 ",DTN3))
-
-
-
-    #Non-WC RNA atoms
-    (rna_atom_finder(pdblist,"G","N3 ",GN3))
-    (rna_atom_finder(pdblist,"G","N9 ",GN9))
-    (rna_atom_finder(pdblist,"G","N7 ",GN7))
-
-
-    (rna_atom_finder(pdblist,"A","N7 ",AN7))
-    (rna_atom_finder(pdblist,"A","N9 ",AN9))
-    (rna_atom_finder(pdblist,"A","N3 ",AN3))
-
-    (rna_atom_finder(pdblist,"U","O2 ",UO2))
-
-    # WC RNA write .pml
-    wc_dist(GO6, CN4)
-    wc_dist(GN1, CN3)
-    wc_dist(GN2, CO2)
-
-    wc_dist(AN6, UO4)
-    wc_dist(AN1, UN3)
-
-    # WC DNA write .pml
-    wc_dist(DGO6, DCN4)
-    wc_dist(DGN1, DCN3)
-    wc_dist(DGN2, DCO2)
-
-    wc_dist(DAN6, DTO4)
-    wc_dist(DAN1, DTN3)
-    bondfile.write("set dash_color, yellow, WC_hbond")
-
-    #Non-WC distances
-    #Series of all the atoms tested for hydrogen bond (these are all non-WC)
-
-    #Hoogsteen
-    nwc_dist(AN7,UN3)
-    nwc_dist(AN6,UO4)
-    nwc_dist(GN7,CN3)
-    #GO6
-    nwc_dist(GO6,CO2)
-    nwc_dist(GO6,AN6)
-    nwc_dist(GO6,AN1)
-    nwc_dist(GO6,AN7)
-    nwc_dist(GO6,UN3)
-    #GN1
-    nwc_dist(GN1,GN3)
-    nwc_dist(GN1,GN7)
-    nwc_dist(GN1,AN1)
-    nwc_dist(GN1,AN3)
-    nwc_dist(GN1,AN7)
-    nwc_dist(GN1,UO4)
-    nwc_dist(GN1,UN3)
-    #GN2
-    nwc_dist(GN2,GN7)
-    nwc_dist(GN2,AN6)
-    nwc_dist(GN2,AN1)
-    nwc_dist(GN2,AN3)
-    nwc_dist(GN2,AN7)
-    nwc_dist(GN2,UO4)
-    nwc_dist(GN2,UN3)
-    #GN3
-    nwc_dist(GN3,GO6)
-    nwc_dist(GN3,CN3)
-    nwc_dist(GN3,CO2)
-    nwc_dist(GN3,AN6)
-    nwc_dist(GN3,AN1)
-    nwc_dist(GN3,AN3)
-    nwc_dist(GN3,UO4)
-    nwc_dist(GN3,UN3)
-    #GN7
-    nwc_dist(GN7,GN1)
-    nwc_dist(GN7,GN2)
-    nwc_dist(GN7,GN7)
-    nwc_dist(GN7,CN3)
-    nwc_dist(GN7,CO2)
-    nwc_dist(GN7,AN6)
-    nwc_dist(GN7,AN1)
-    nwc_dist(GN7,AN3)
-    nwc_dist(GN7,AN7)
-    nwc_dist(GN7,UO4)
-    nwc_dist(GN7,UN3)
-    #AN6
-    nwc_dist(AN6,GO6)
-    nwc_dist(AN6,GN2)
-    nwc_dist(AN6,GN3)
-    nwc_dist(AN6,GN7)
-    nwc_dist(AN6,CN3)
-    nwc_dist(AN6,CO2)
-    nwc_dist(AN6,UN3)
-    #AN1
-    nwc_dist(AN1,GO6)
-    nwc_dist(AN1,GN1)
-    nwc_dist(AN1,GN2)
-    nwc_dist(AN1,GN3)
-    nwc_dist(AN1,GN7)
-    nwc_dist(AN1,CN3)
-    nwc_dist(AN1,CO2)
-    nwc_dist(AN1,AN6)
-    nwc_dist(AN1,AN1)
-    nwc_dist(AN1,AN3)
-    nwc_dist(AN1,AN7)
-    nwc_dist(AN1,UO4)
-    #AN7
-    nwc_dist(AN7,GO6)
-    nwc_dist(AN7,GN1)
-    nwc_dist(AN7,GN2)
-    nwc_dist(AN7,GN7)
-    nwc_dist(AN7,CN3)
-    nwc_dist(AN7,CO2)
-    nwc_dist(AN7,AN1)
-    nwc_dist(AN7,AN3)
-    nwc_dist(AN7,UO4)
-    nwc_dist(AN7,UN3)
-    #AN3
-    nwc_dist(AN3,GO6)
-    nwc_dist(AN3,GN1)
-    nwc_dist(AN3,GN2)
-    nwc_dist(AN3,GN3)
-    nwc_dist(AN3,GN7)
-    nwc_dist(AN3,CN3)
-    nwc_dist(AN3,CO2)
-    nwc_dist(AN3,AN6)
-    nwc_dist(AN3,AN7)
-    nwc_dist(AN3,AN9)
-    nwc_dist(AN3,UO4)
-    nwc_dist(AN3,UN3)
-    #UO4
-    nwc_dist(UO4,GN1)
-    nwc_dist(UO4,GN2)
-    nwc_dist(UO4,GN3)
-    nwc_dist(UO4,GN7)
-    nwc_dist(UO4,CN3)
-    nwc_dist(UO4,CO2)
-    nwc_dist(UO4,AN1)
-    nwc_dist(UO4,AN3)
-    nwc_dist(UO4,AN7)
-    #UN3
-    nwc_dist(UN3,GO6)
-    nwc_dist(UN3,GN1)
-    nwc_dist(UN3,GN2)
-    nwc_dist(UN3,GN3)
-    nwc_dist(UN3,GN7)
-    nwc_dist(UN3,CN3)
-    nwc_dist(UN3,CO2)
-    nwc_dist(UN3,AN6)
-    nwc_dist(UN3,AN3)
-    nwc_dist(UN3,AN7)
-    nwc_dist(UN3,UO4)
-    nwc_dist(UO4,UO2)
-    #CN4
-    nwc_dist(CN4,GN3)
-    nwc_dist(CN4,GN7)
-    nwc_dist(CN4,AN1)
-    nwc_dist(CN4,AN3)
-    nwc_dist(CN4,AN7)
-    nwc_dist(CN4,UO4)
-    nwc_dist(CN4,UN3)
-    #CN3
-    nwc_dist(CN3,GN3)
-    nwc_dist(CN3,GN7)
-    nwc_dist(CN3,AN6)
-    nwc_dist(CN3,AN1)
-    nwc_dist(CN3,AN3)
-    nwc_dist(CN3,AN7)
-    nwc_dist(CN3,UO4)
-    nwc_dist(CN3,UN3)
-    #CO2
-    nwc_dist(CO2,GO6)
-    nwc_dist(CO2,GN3)
-    nwc_dist(CO2,GN7)
-    nwc_dist(CO2,AN6)
-    nwc_dist(CO2,AN1)
-    nwc_dist(CO2,AN3)
-    nwc_dist(CO2,AN7)
-    nwc_dist(CO2,UO4)
-    nwc_dist(CO2,UN3)
+            Integer array of shape (bonds, 2) of atom index pairs and array of model counts
+        '''
+        _, pairs, model = found
+        keys = np.unique((pairs[:, 0] * len(structure) + pairs[:, 1])
+                         * structure.model_count + model)
+        pair_keys, counts = np.unique(keys // structure.model_count, return_counts=True)
+        return np.column_stack(np.divmod(pair_keys, len(structure))), counts
 
+    def occupancy_of(found, pairs):
+        '''
+        This function will return the fraction of models having each merged atom pair
+        '''
+        occupied, counts = occupancy(found)
+        keys = occupied[:, 0] * len(structure) + occupied[:, 1]
+        position = np.searchsorted(keys, pairs[:, 0] * len(structure) + pairs[:, 1])
+        return counts[position] / structure.model_count if len(pairs) else np.zeros(0)
+
+    rules = BasePairRules(structure)
+
+    report_progress(progress, 0.3, "Searching base pairs")
+    # To find every base atom pair within 3.2 angstroms in one pass over a cell list
+    # and match every rule against the pairs in one more pass
+    base_atom_list = rules.atoms
+    stats.count("atoms_selected", len(base_atom_list))
+    stats.start("distance")
+    pair_model, first, second, pair_distance = model_pairs(
+        structure, base_atom_list, rules.cutoff, stats, scaled_progress(progress, 0.3, 0.8))
+    pair_atoms = np.column_stack((base_atom_list[first], base_atom_list[second]))
+
+    wc_found, nwc_found = rules.match(pair_atoms, pair_distance, pair_model).values()
+    stats.count("pairs_found", len(wc_found[0]) + len(nwc_found[0]))
+
+    if structure.model_count > 1:
+        stats.start("print")
+        for label, found in (("WC bonds", wc_found), ("non-WC bonds", nwc_found)):
+            print_model_counts(structure, found[2], label)
+        print("\nOCCUPANCY (fraction of models with the bond)")
+        for label, found in (("WC", wc_found), ("non-WC", nwc_found)):
+            for (atom1, atom2), models in zip(*occupancy(found)):
+                print("{:<6} {} {:<4} --- {} {:<4} {:.2f}".format(
+                    label, structure.residue_label(atom1), structure.name[atom1],
+                    structure.residue_label(atom2), structure.name[atom2],
+                    models / structure.model_count))
+    wc_pairs = merge_models(wc_found)
+    nwc_pairs = merge_models(nwc_found)
+
+    report_progress(progress, 0.8, "Writing PyMOL script")
+    stats.start("emit")
+    script = PymolScript() if script is None else script
+    commands = len(script)
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    for atom1, atom2 in wc_pairs:
+        script.dist("WC_hbond", structure.atom_selection(atom1),
+                    structure.atom_selection(atom2), 3.2)
+    script.set("dash_color", "yellow", "WC_hbond")
+    for atom1, atom2 in nwc_pairs:
+        script.dist("Non_WC_hbond", structure.atom_selection(atom1),
+                    structure.atom_selection(atom2), 3.2)
     #Additional changes to alter pymol image
-    bondfile.write("\n")
-    bondfile.write("set dash_color, red, Non_WC_hbond")
-    bondfile.write("\n")
-    bondfile.write("set cartoon_ring_mode,3")
-    bondfile.write("\n")
-    bondfile.write("hide labels, Non_WC_hbond")
-    bondfile.write("\n")
-    bondfile.write("hide labels, WC_hbond")
-    bondfile.write("\n")
-    bondfile.write("show sticks, sidechain extend 1")
-    bondfile.write("\n")
-    bondfile.write("color grey, sidechain")
-    bondfile.write("\n")
-    bondfile.write("color atomic, (not elem C)")
-    bondfile.write("\n")
-    bondfile.write("set dash_length, 0.2500")
-    bondfile.write("\n")
-    bondfile.write("set dash_gap, 0.4")
-    bondfile.write("\n")
-    bondfile.write("set dash_radius, .15")
+    script.set("dash_color", "red", "Non_WC_hbond")
+    script.set("cartoon_ring_mode", 3)
+    script.hide("labels", "Non_WC_hbond")
+    script.hide("labels", "WC_hbond")
+    script.show("sticks", "sidechain extend 1")
+    script.color("grey", "sidechain")
+    script.color("atomic", "(not elem C)")
+    script.set("dash_length", "0.2500")
+    script.set("dash_gap", "0.4")
+    script.set("dash_radius", ".15")
+    stats.count("commands", len(script) - commands)
+    if pml_file is not None:
+        stats.start("write")
+        script.write(pml_file)
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    records = [interaction_records(structure, kind, pairs, occupancy=occupancy_of(found, pairs))
+               for kind, found, pairs in (("WC", wc_found, wc_pairs),
+                                          ("nWC", nwc_found, nwc_pairs))]
+    return AnalysisResult("wc_nwc", structure.object_name, np.concatenate(records),
+                          {"wc": len(wc_pairs), "nwc": len(nwc_pairs)})
 
 ############################################################
 ###################  Detect Alpha Helice  ##################
 ############################################################
 
-def alpha_helice(filename=str):
+def alpha_helice(filename=str, pml_file="helix_bonds.pml", progress=None,
+                 script=None, stats=None):
     '''
-        This function will detect any potential alpha helical seconday structure in polypeptides
+        This function will detect alpha helical seconday structure in polypeptides
+        from DSSP-style backbone H-bond energies (see dssp_miv)
 
         **Parameters**
 
-        filename: *string*
-            A string with the PDB file name (e.g. 1fdl.pdb)
+        filename: *str or Structure*
+            A string with the PDB file name (e.g. 1fdl.pdb), or an already parsed Structure
+
+        pml_file: *str*
+            The PyMOL script to write, or None to skip writing it
+
+        script: *PymolScript*
+            A script to add the PyMOL commands to, e.g. to apply them through
+            the pymol cmd API, or None to start a new one
+
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see report_progress)
+
+        stats: *AnalysisStats*
+            Collects the time of each stage and the atoms and pairs counted, or None
         **Returns**
 
-            Text of residues with alpha helical structure
+            AnalysisResult with one dssp record per residue with a complete
+            backbone holding its DSSP code, and the string of "H" and "-"
+            marking the alpha helical residues in its values
+            Text of residues with alpha helical structure and their DSSP codes
             PyMOL Viewer Structure with alpha helices highlighted and bonds drawn
         '''
-    # To write a pml file
-    bondfile=open("helix_bonds.pml", "w", encoding="utf8")
-    # pylint: disable=consider-using-f-string
-    bondfile.write("load {:}\n".format((filename)))
-    bondfile.write("remove resn hoh\n")
-    bondfile.write("color white\n")
-
-    aminoacid={}
-    aminoacid["ALA"]="A"
-    aminoacid["CYS"]="C"
-    aminoacid["ASP"]="D"
-    aminoacid["GLU"]="E"
-    aminoacid["PHE"]="F"
-    aminoacid["GLY"]="G"
-    aminoacid["HIS"]="H"
-    aminoacid["ILE"]="I"
-    aminoacid["LYS"]="K"
-    aminoacid["LEU"]="L"
-    aminoacid["MET"]="M"
-    aminoacid["MSE"]="M"
-    aminoacid["ASN"]="N"
-    aminoacid["PRO"]="P"
-    aminoacid["GLN"]="Q"
-    aminoacid["ARG"]="R"
-    aminoacid["SER"]="S"
-    aminoacid["THR"]="T"
-    aminoacid["VAL"]="V"
-    aminoacid["TRP"]="W"
-    aminoacid["UNK"]="X"
-    aminoacid["TYR"]="Y"
-
-    #to put all the carbonly oxygen ATOM lines in a list
-    oxy_atom_list=[]
-    nitro_atom_list=[]
-
     # To read into PDB file
     print("Alpha-helical structure detector\n")
-    rawfile=open(filename,"r", encoding="utf8")
-    pdblist=rawfile.readlines()
-    rawfile.close()
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("alpha_helice") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    report_progress(progress, 0.4, "Assigning backbone hydrogen bonds")
+
+    # To assign secondary structure from the backbone H-bonds of every residue,
+    # across all chains and gaps
+    stats.start("distance")
+    secondary = assign_secondary_structure(structure, scaled_progress(progress, 0.4, 0.8))
+    stats.count("atoms_selected", 4 * len(secondary))
+    stats.count("pairs_found", len(secondary.donors))
+    if len(secondary) == 0:
+        print("Please enter a valid protein PDB file")
+    is_helix = secondary.mask(ALPHA_HELIX)
+    helix_atoms = secondary.atoms[is_helix]
 
+    #Make a list of the single letter amino acid FASTA sequence
+    single_aa_list=[AMINO_ACIDS.get(resn, "x") for resn in structure.resn[secondary.atoms]]
 
-    oxygen_finder(pdblist,"O  ", oxy_atom_list)
-    #print(oxy_atom_list)
+    #Make a list of the "-" and "H" for the single amino acid FASTA seqeuence
+    h_bond_list=["H" if helix else "-" for helix in is_helix]
 
-    nitrogen_finder(pdblist,"N  ", nitro_atom_list)
-    #print(nitro_atom_list)
+    stats.start("print")
+    print([structure.residue_label(i) for i in helix_atoms])
 
-    # To remove the extraneous last 4 nitrogens that cannot participate in alpha helix
-    try:
-        nitro_atom_list.pop(0)
-        nitro_atom_list.pop(0)
-        nitro_atom_list.pop(0)
-        nitro_atom_list.pop(0)
-    except IndexError:
-        print("Please enter a valid protein PDB file")
+    print("\n\n'H' = alpha helical structure")
+    print("'-' = non-alpha helical structure")
+    print("DSSP codes: H alpha helix, G 3-10 helix, I pi helix, E strand, "
+          "B bridge, T turn, S bend")
+    print("\n>"+structure.filename)
+
+    report_progress(progress, 0.8, "Writing PyMOL script")
+    stats.start("emit")
+    script = PymolScript() if script is None else script
+    commands = len(script)
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    script.color("white", structure.object_name)
+    # One named selection with the helices as residue ranges per chain
+    if len(helix_atoms):
+        helices = structure.object_name + "_helix"
+        script.select(helices, structure.residue_ranges(helix_atoms))
+        script.color("pink", helices)
+    stats.count("commands", len(script) - commands)
+    if pml_file is not None:
+        stats.start("write")
+        script.write(pml_file)
+
+    # To print the sequence, the helix marks and the DSSP codes aligned in
+    # blocks of 40 residues, for any number of residues
+    stats.start("print")
+    for start in range(0, len(single_aa_list), 40):
+        print(*single_aa_list[start:start + 40], sep = "")
+        print(*h_bond_list[start:start + 40], sep = "")
+        print(*secondary.codes[start:start + 40], sep = "")
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("alpha_helix", structure.object_name, residue_records(
+        structure, "dssp", secondary.atoms, secondary.codes),
+                          {"helix": "".join(h_bond_list),
+                           "helical_residues": int(np.count_nonzero(is_helix))})
 
+############################################################
+###################  Interface Hydrogen Bonds  #############
+############################################################
 
-    dist_list=[]
-    # pylint: disable=consider-using-enumerate
-    for i in range(len(nitro_atom_list)):
-        dist_list.append(calcdistance(extractxyz(oxy_atom_list[i]), extractxyz(nitro_atom_list[i])))
-    aalist=[]
-    for line in oxy_atom_list:
-        aalist.append(line[17:20])
+def calc_hbonds(filename=str, pml_file="interface_hbonds.pml", progress=None,
+                script=None, stats=None, distance=HBOND_DISTANCE, angle=HBOND_ANGLE,
+                interchain=True):
+    '''
+        This function will find the H-bonds between the chains of a protein or
+        protein-nucleic acid complex from distance and angle criteria on
+        implicit hydrogens (see hbond_miv), and display them in PyMOL
 
-    # To output the protein sequence in FASTA format
-    single_aa_list=[]
+        **Parameters**
 
-    #Make a list of the single letter amino acid FASTA sequence
-    for letter in aalist:
-        if letter in aminoacid:
-            single_aa_list.append(aminoacid[letter])
-        else:
-            single_aa_list.append("x")
+        filename: *str or Structure*
+            A string with the PDB file name (e.g. 1kx5.pdb), or an already parsed Structure
 
-    #Make a list of the "-" and "H" for the single amino acid FASTA seqeuence
-    h_bond_list=[]
-    for i in range(len(dist_list)):
-        if 0.5 < dist_list[i] < 4.7:
-            h_bond_list.append("H")
-        else:
-            h_bond_list.append("-")
-    helix_line_list_n=[]
-    helix_line_list_o=[]
-    for i in range(len(nitro_atom_list)):
-        if 0.5 < (calcdistance(extractxyz(oxy_atom_list[i]), extractxyz(nitro_atom_list[i]))) < 4.7:
-            helix_line_list_n.append(nitro_atom_list[i])
-            helix_line_list_o.append(oxy_atom_list[i])
-
-    print(helix_line_list_n)
-    print("\n\n\n")
-    print(helix_line_list_o)
-
-    # To account for the 4 i+4 Hydorgen bonding between carbonyl oxygen and amine
-    h_bond_list.append("-")
-    h_bond_list.append("-")
-    h_bond_list.append("-")
-    h_bond_list.append("-")
+        pml_file: *str*
+            The PyMOL script to write, or None to skip writing it
 
-    print("\n\n'H' = alpha helical structure")
-    print("'-' = non-alpha helical structure")
-    print("\n>"+filename)
+        script: *PymolScript*
+            A script to add the PyMOL commands to, e.g. to apply them through
+            the pymol cmd API, or None to start a new one
 
-    #Here is a method to print the fasta sequence and alpha helical structure
-    #in an alinged manner, coded up to 531 characters, so this method works for aa < 531, and
-    #can be coded for higher MW proteins if necessary
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see report_progress)
 
-    for line in helix_line_list_n:
-        # pylint: disable=line-too-long
-        #bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename),line[102:103],remove(line[98:102]),remove(line[103:107])))
-        bondfile.write("color pink, /{}//{}/{}`{}\n".format(extract_pdb_path(filename), line[21:22],line[17:20],remove(line[23:26])))
+        stats: *AnalysisStats*
+            Collects the time of each stage and the atoms and pairs counted, or None
 
+        distance: *float*
+            The largest donor to acceptor distance in angstroms
 
-    for line in helix_line_list_o:
-        # pylint: disable=line-too-long
-        #bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename),line[102:103],remove(line[98:102]),remove(line[103:107])))
-        bondfile.write("color pink, /{}//{}/{}`{}\n".format(extract_pdb_path(filename), line[21:22],line[17:20],remove(line[23:26])))
-#Additional changes to alter pymol image
+        angle: *float*
+            The smallest donor-hydrogen...acceptor angle in degrees
 
-    print(*single_aa_list[0:40], sep = "")
-    print(*h_bond_list[0:40], sep = "")
+        interchain: *bool*
+            Only find H-bonds between different chains, or False for every H-bond
+        **Returns**
 
-    print(*single_aa_list[41:81], sep = "")
-    print(*h_bond_list[41:81], sep = "")
+            AnalysisResult with one hbond record per H-bond from donor to
+            acceptor atom, with its distance and angle
+            Text of the H-bonds per chain pair and of every H-bond
+            PyMOL Viewer Structure with the H-bonds drawn and the bonded residues shown
+        '''
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("calc_hbonds") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    report_progress(progress, 0.4, "Searching donor and acceptor pairs")
+
+    stats.start("distance")
+    hbonds = find_hbonds(structure, distance, angle, interchain,
+                         scaled_progress(progress, 0.4, 0.8))
+    stats.count("pairs_found", len(hbonds))
+
+    stats.start("print")
+    print("\nThere are", len(hbonds), "interface H-bonds" if interchain else "H-bonds")
+    chain_pairs, chain_counts = np.unique(np.column_stack(
+        (structure.chain[hbonds.donors], structure.chain[hbonds.acceptors])).reshape(-1, 2),
+                                          axis=0, return_counts=True)
+    for (donor_chain, acceptor_chain), count in zip(chain_pairs, chain_counts):
+        print("Chain {} -> chain {}: {} H-bonds".format(donor_chain, acceptor_chain, count))
+    print("\nDONOR --- ACCEPTOR ( donor-acceptor < {:.2f} Å, "
+          "donor-H...acceptor > {:.0f}° )".format(distance, angle))
+    for donor, acceptor, bond_distance, bond_angle in zip(
+            hbonds.donors, hbonds.acceptors, hbonds.distances, hbonds.angles):
+        print("{} {:<4} --- {} {:<4}   {:.2f} Å  {:5.1f}°".format(
+            structure.residue_label(donor), structure.name[donor],
+            structure.residue_label(acceptor), structure.name[acceptor],
+            bond_distance, bond_angle))
+
+    report_progress(progress, 0.8, "Writing PyMOL script")
+    stats.start("emit")
+    script = PymolScript() if script is None else script
+    commands = len(script)
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    for donor, acceptor in hbonds.pairs():
+        script.dist("interface_hbond", structure.atom_selection(donor),
+                    structure.atom_selection(acceptor))
+    # One named selection of the bonded residues, reused by the show and color calls
+    if len(hbonds):
+        residues = structure.object_name + "_hbond"
+        script.select(residues, structure.residue_ranges(hbonds.pairs().ravel()))
+        script.show("sticks", residues)
+        script.color("atomic", residues)
+    script.hide("labels", "interface_hbond")
+    script.color("yellow", "interface_hbond")
+    stats.count("commands", len(script) - commands)
+    if pml_file is not None:
+        stats.start("write")
+        script.write(pml_file)
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("hbonds", structure.object_name, interaction_records(
+        structure, "hbond", hbonds.pairs(), hbonds.distances, hbonds.angles),
+                          {"hbonds": len(hbonds)})
 
-    print(*single_aa_list[82:122], sep = "")
-    print(*h_bond_list[82:122], sep = "")
+############################################################
+###################  Contact Profile  ######################
+############################################################
 
-    print(*single_aa_list[163:203], sep = "")
-    print(*h_bond_list[163:203], sep = "")
+# Heading and PyMOL color of the distance object of each contact type
+CONTACT_STYLES = OrderedDict((
+    ("salt_bridge", ("SALT BRIDGES", "blue")),
+    ("pi_stacking", ("AROMATIC STACKING", "green")),
+    ("hydrophobic", ("HYDROPHOBIC CONTACTS", "gray70")),
+    ("metal", ("METAL COORDINATION", "violet")),
+))
 
-    print(*single_aa_list[204:244], sep = "")
-    print(*h_bond_list[204:244], sep = "")
+def calc_contacts(filename=str, pml_file="contacts.pml", progress=None,
+                  script=None, stats=None, interchain=True):
+    '''
+        This function will profile the salt bridges, aromatic stacking,
+        hydrophobic contacts and metal coordination of a structure from one
+        shared neighbor search (see contact_miv), and display every contact
+        type as its own PyMOL object
 
-    print(*single_aa_list[245:285], sep = "")
-    print(*h_bond_list[245:285], sep = "")
+        **Parameters**
 
-    print(*single_aa_list[286:326], sep = "")
-    print(*h_bond_list[286:326], sep = "")
+        filename: *str or Structure*
+            A string with the PDB file name (e.g. 1kx5.pdb), or an already parsed Structure
 
-    print(*single_aa_list[327:367], sep = "")
-    print(*h_bond_list[327:367], sep = "")
+        pml_file: *str*
+            The PyMOL script to write, or None to skip writing it
 
-    print(*single_aa_list[368:408], sep = "")
-    print(*h_bond_list[368:408], sep = "")
+        script: *PymolScript*
+            A script to add the PyMOL commands to, e.g. to apply them through
+            the pymol cmd API, or None to start a new one
 
-    print(*single_aa_list[409:449], sep = "")
-    print(*h_bond_list[409:449], sep = "")
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see report_progress)
 
-    print(*single_aa_list[450:490], sep = "")
-    print(*h_bond_list[450:490], sep = "")
+        stats: *AnalysisStats*
+            Collects the time of each stage and the atoms and pairs counted, or None
 
-    print(*single_aa_list[491:531], sep = "")
-    print(*h_bond_list[491:531], sep = "")
+        interchain: *bool*
+            Only profile contacts between different chains, or False for every contact
+        **Returns**
 
-    print(*single_aa_list[532:572], sep = "")
-    print(*h_bond_list[532:572], sep = "")
+            AnalysisResult with one record per contact named by its type, with
+            its distance, and the number of contacts of each type in its values
+            Text of the number of contacts of each type and of every contact
+            PyMOL Viewer Structure with one distance object and one residue
+            selection per contact type
+        '''
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("calc_contacts") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    report_progress(progress, 0.4, "Searching contacts")
+
+    stats.start("distance")
+    contacts = find_contacts(structure, interchain, progress=scaled_progress(progress, 0.4, 0.8))
+    stats.count("pairs_found", len(contacts))
+
+    stats.start("print")
+    print("\nContacts between chains" if interchain else "\nContacts")
+    for kind, count in contacts.counts().items():
+        print("{:<22}{}".format(CONTACT_STYLES[kind][0].capitalize(), count))
+    for kind, (heading, _) in CONTACT_STYLES.items():
+        found = contacts.of_kind(kind)
+        if not len(found):
+            continue
+        print("\n{} ( < {:.1f} Å )".format(heading, CONTACT_CUTOFFS[kind]))
+        for (atom1, atom2), contact_distance in zip(contacts.atoms[found],
+                                                     contacts.distances[found]):
+            if kind == "pi_stacking":
+                print(structure.residue_label(atom1), "---", structure.residue_label(atom2),
+                      "  {:.2f} Å".format(contact_distance))
+            else:
+                print("{} {:<4} --- {} {:<4}  {:.2f} Å".format(
+                    structure.residue_label(atom1), structure.name[atom1],
+                    structure.residue_label(atom2), structure.name[atom2], contact_distance))
+
+    report_progress(progress, 0.8, "Writing PyMOL script")
+    stats.start("emit")
+    script = PymolScript() if script is None else script
+    commands = len(script)
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    # Stacked rings are drawn between pseudoatoms at their centroids
+    rings = structure.object_name + "_rings"
+    stacked = np.unique(contacts.rings[contacts.of_kind("pi_stacking")])
+    for ring in stacked:
+        ring_atoms = contacts.ring_atoms[ring][contacts.ring_atoms[ring] >= 0]
+        script.pseudoatom(rings, "{}/{}".format(structure.residue_selection(ring_atoms[0]),
+                                                "+".join(structure.name[ring_atoms])), ring)
+    for kind, (_, color) in CONTACT_STYLES.items():
+        found = contacts.of_kind(kind)
+        if not len(found):
+            continue
+        for contact in found:
+            if kind == "pi_stacking":
+                ring1, ring2 = contacts.rings[contact]
+                script.dist(kind, "{} and resi {}".format(rings, ring1),
+                            "{} and resi {}".format(rings, ring2))
+            else:
+                atom1, atom2 = contacts.atoms[contact]
+                script.dist(kind, structure.atom_selection(atom1),
+                            structure.atom_selection(atom2))
+        # One named selection of the residues of each contact type
+        residues = "{}_{}".format(structure.object_name, kind)
+        script.select(residues, structure.residue_ranges(contacts.atoms[found].ravel()))
+        script.show("sticks", residues)
+        script.hide("labels", kind)
+        script.color(color, kind)
+    if len(stacked):
+        script.hide("everything", rings)
+    stats.count("commands", len(script) - commands)
+    if pml_file is not None:
+        stats.start("write")
+        script.write(pml_file)
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("contacts", structure.object_name, interaction_records(
+        structure, contacts.kinds, contacts.atoms, contacts.distances), contacts.counts())
 
 ############################################################
 #####################  End to End Distance  ################
 ############################################################
 
-def end_to_end_dist(filename=str):
+def end_to_end_dist(filename=str, pml_file="end_to_end.pml", progress=None,
+                    script=None, stats=None):
     '''
-        This function will calculate the molecular weight of a peptide
+        This function will calculate the end to end distance of a peptide
 
         **Parameters**
 
-        filename: *string*
-            A string with the PDB file name (e.g. 1fdl.pdb)
+        filename: *str or Structure*
+            A string with the PDB file name (e.g. 1fdl.pdb), or an already parsed Structure
+
+        pml_file: *str*
+            The PyMOL script to write, or None to skip writing it
+
+        script: *PymolScript*
+            A script to add the PyMOL commands to, e.g. to apply them through
+            the pymol cmd API, or None to start a new one
+
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see report_progress)
+
+        stats: *AnalysisStats*
+            Collects the time of each stage and the atoms and pairs counted, or None
         **Returns**
 
-            Text of molecular weight of a peptide 
+            AnalysisResult with one end_to_end record per model, and the distance
+            in angstroms in the first model in its values (None for a file
+            without C-alpha atoms)
+            Text of the distance between the first and last C-alpha atoms, per model
+            for an ensemble
+            PyMOL Viewer Structure with the end to end distance drawn
         '''
-
-    # To write a pml file
-    bondfile=open("end_to_end.pml", "w", encoding="utf8")
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("end_to_end_dist") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    stats.start("filter")
+    ca_atoms = structure.select(name="CA", record="ATOM")
+    stats.count("atoms_selected", len(ca_atoms))
+    if len(ca_atoms) == 0:
+        stats.stop()
+        print("Enter a valid PDB File")
+        return AnalysisResult("end_to_end", structure.object_name, [], {"distance": None})
+
+    #extract the first and last atoms from CA atoms
+    first, last = ca_atoms[0], ca_atoms[-1]
+
+    report_progress(progress, 0.8, "Writing PyMOL script")
+    stats.start("emit")
+    script = PymolScript() if script is None else script
+    commands = len(script)
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    script.show("sticks", structure.residue_selection(last))
+    script.dist("end_to_end", structure.atom_selection(first), structure.atom_selection(last))
+    script.show("sticks", structure.residue_selection(first))
+    script.show("sticks", structure.residue_selection(last))
+    script.set("dash_color", "pink", "end_to_end")
+    script.set("dash_length", "0.2500")
+    script.set("dash_gap", "0.4")
+    script.set("dash_radius", ".15")
+    stats.count("commands", len(script) - commands)
+    if pml_file is not None:
+        stats.start("write")
+        script.write(pml_file)
+
+    # To measure the distance in every model at once
+    stats.start("distance")
+    distances = np.sqrt(((structure.models[:, last].astype(np.float64)
+                          - structure.models[:, first]) ** 2).sum(axis=1))
+    distance = calcdistance(structure.coords[first], structure.coords[last])
+    stats.count("pairs_evaluated", structure.model_count)
+
+    # Print Statments
+    stats.start("print")
+    print("\nFirst Residue:",structure.resn[first])
+    print("Last Residue:", structure.resn[last])
     # pylint: disable=consider-using-f-string
-    bondfile.write("load {:}\n".format((filename)))
-    bondfile.write("remove resn hoh\n")
-
-    while True:
-    #will read into file if ".pdb"
-        try:
-            rawfile=open(filename,"r", encoding="utf8")
-            pdblist=rawfile.readlines()
-            rawfile.close()
-            rawfile=open(filename,"r", encoding="utf8")
-            pdblist=rawfile.readlines()
-            rawfile.close()
-
-            #Generate a file name to store CA atoms
-            outputfile= "outputMWFile"
-            ca_atoms=open(outputfile,"w", encoding="utf8")
-
-
-            # pylint: disable= unused-variable
-            ca_only=strip_ca_atoms(pdblist, ca_atoms)
-
-            ca_atoms.close()
-            #extract the first and last atoms from CA atoms file
-            with open(outputfile, "r",  encoding="utf8") as file:
-                first_line = file.readline()
-                for last_line in file:
-                    pass
-            # pylint: disable=undefined-loop-variable
-            ca_only = [first_line, last_line]
-
-            # Writing to end_to_end.pml
-            #pylint: disable=line-too-long
-            bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename),last_line[21:22],last_line[17:20],last_line[23:26]))
-            bondfile.write("dist end_to_end, /{}//{}/{}`{}/{},/{}//{}/{}`{}/{}\n".format(extract_pdb_path(filename), first_line[21:22],first_line[17:20],remove(first_line[23:26]),first_line[13:16], extract_pdb_path(filename),last_line[21:22],last_line[17:20],last_line[23:26],last_line[13:15]))
-            bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename), first_line[21:22],first_line[17:20],remove(first_line[23:26])))
-            bondfile.write("show sticks, /{}//{}/{}`{}\n".format(extract_pdb_path(filename),last_line[21:22],last_line[17:20],last_line[23:26]))
-            bondfile.write("set dash_color, pink, end_to_end\n")
-            #bondfile.write("hide labels, Non_WC_hbond")
-            #bondfile.write("color atomic, (not elem C), /{}//{}/{}`{}/{}\n".format(extract_pdb_path(filename), first_line[21:22],first_line[19:20],remove(first_line[23:26]),first_line[13:16]))
-            #bondfile.write("color atomic, (not elem C), /{}//{}/{}`{}/{}\n".format(extract_pdb_path(filename),last_line[21:22],last_line[19:20],last_line[23:26],last_line[13:15]))
-            bondfile.write("set dash_length, 0.2500\n")
-            bondfile.write("set dash_gap, 0.4\n")
-            bondfile.write("set dash_radius, .15\n")
-
-            # Print Statments
-            print("\nFirst Residue:",first_line[17:20])
-            print("Last Residue:", last_line[17:20])
-            # pylint: disable=consider-using-f-string
-            #pylint: disable=line-too-long
-            print("Distance between Cα atoms of first and last residue: {:.2f} Å".format((calcdistance(extractxyz(first_line), extractxyz(last_line)))))
-            return None
-        except TypeError:
-            print("Enter a valid PDB File")
-            break
+    #pylint: disable=line-too-long
+    print("Distance between Cα atoms of first and last residue: {:.2f} Å".format(distance))
+    if structure.model_count > 1:
+        print("\nDistance per model:")
+        for number, model_distance in enumerate(distances, 1):
+            print("Model {}: {:.2f} Å".format(number, model_distance))
+        print("Mean {:.2f} Å, standard deviation {:.2f} Å".format(distances.mean(),
+                                                                   distances.std()))
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("end_to_end", structure.object_name, interaction_records(
+        structure, "end_to_end", np.tile([first, last], (structure.model_count, 1)), distances,
+        models=np.arange(structure.model_count)), {"distance": distance})
 
 ############################################################
 ###################  Calculate Peptide MW  #################
 ############################################################
 
-def calc_peptide_mw(filename):
+def calc_peptide_mw(filename, progress=None, stats=None):
     '''
         This function will calculate the molecular weight of a peptide
 
         **Parameters**
 
-        filename: *string*
-            A string with the PDB file name (e.g. 1fdl.pdb)
+        filename: *str or Structure*
+            A string with the PDB file name (e.g. 1fdl.pdb), or an already parsed Structure
+
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see report_progress)
+
+        stats: *AnalysisStats*
+            Collects the time of each stage and the atoms and pairs counted, or None
         **Returns**
 
-            Text of molecular weight of a peptide 
+            AnalysisResult with one mass record and the molecular weight of the
+            peptide in Daltons in its values
+            Text of molecular weight of a peptide
         '''
-# To read into a PDB file and then outputs the protein sequence in FASTA format
-
-    aminoacid={}
-    aminoacid["ALA"]="A"
-    aminoacid["CYS"]="C"
-    aminoacid["ASP"]="D"
-    aminoacid["GLU"]="E"
-    aminoacid["PHE"]="F"
-    aminoacid["GLY"]="G"
-    aminoacid["HIS"]="H"
-    aminoacid["ILE"]="I"
-    aminoacid["LYS"]="K"
-    aminoacid["LEU"]="L"
-    aminoacid["MET"]="M"
-    aminoacid["MSE"]="M"
-    aminoacid["ASN"]="N"
-    aminoacid["PRO"]="P"
-    aminoacid["GLN"]="Q"
-    aminoacid["ARG"]="R"
-    aminoacid["SER"]="S"
-    aminoacid["THR"]="T"
-    aminoacid["VAL"]="V"
-    aminoacid["TRP"]="W"
-    aminoacid["UNK"]="X"
-    aminoacid["TYR"]="Y"
-
-    # read in a pdb file from command line:
-
-    pdbfileraw=open(filename,"r",  encoding="utf8")
-    pdbfilelist=pdbfileraw.readlines()
-
-    # make a list for storing amino acids
-    aalist=[]
-
-    for line in pdbfilelist:
-        if line[0:4]=="ATOM":
-            # here only look at CA lines
-            if line[13:15]=="CA":
-            #copy residue type into list
-                aalist.append(line[17:20])
-
-    # here output in FASTA format, with first line beginning with ">" and having info about sequence
-    counter=0 # for printing out nicely
-    fasta_seq_list=[]
-    print(">"+filename)
-    for letter in aalist:
-        if letter in aminoacid:
-            fasta_seq_list.append(aminoacid[letter])
-        else:
-            fasta_seq_list.append("X")
-    if (counter+1)%40==0:
-        print()
-    counter+=1
+    # To read into a PDB file and then outputs the protein sequence in FASTA format
+    report_progress(progress, 0.0, "Reading structure")
+    stats = AnalysisStats("calc_peptide_mw") if stats is None else stats
+    stats.start("parse")
+    structure = load_structure(filename)
+    stats.count("atoms_scanned", len(structure))
+    stats.start("filter")
+    fasta_seq_list=one_letter_sequence(structure)
+    stats.count("residues", len(fasta_seq_list))
+    stats.start("print")
+    print(">"+structure.filename)
 
     #Amino Acid Molecular Weight dictionary
     aa_mw={}
@@ -1199,18 +1583,8 @@ def calc_peptide_mw(filename):
     aa_mw["V"]=117.15
     aa_mw["W"]=204.23
     aa_mw["Y"]=181.19
-    aa_mw["["]=0
-    aa_mw["]"]=0
-    aa_mw["\n"]=0
-    aa_mw[","]=0
-    aa_mw[" "]=0
-    aa_mw["'"]=0
-    aa_mw["_"]=0
     aa_mw["X"]=0
 
-    #water molecular weight
-    aa_mw["HOH"]=18.02
-
     # To print the amino acid sequence from fasta file
 
     total=0
@@ -1222,3 +1596,7 @@ def calc_peptide_mw(filename):
     peptide_mass=total - loss_of_water
     # pylint: disable=consider-using-f-string
     print("Peptide Mass: {:.2f} Daltons".format(peptide_mass))
+    stats.stop()
+    report_progress(progress, 1.0, "Done")
+    return AnalysisResult("mw", structure.object_name, value_records("mass", [peptide_mass]),
+                          {"mass": peptide_mass, "residues": len(fasta_seq_list)})
@@ -0,0 +1,354 @@
+from collections import OrderedDict
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .neighbor_miv import CellList
+    from .hbond_miv import PROTEIN_RESIDUES, NUCLEIC_RESIDUES, select_table
+except ImportError:
+    from neighbor_miv import CellList
+    from hbond_miv import PROTEIN_RESIDUES, NUCLEIC_RESIDUES, select_table
+
+############################################################
+###################  Contact Atoms  ########################
+############################################################
+
+# Largest distance in angstroms of each contact type, between atoms or,
+# for aromatic stacking, between ring centroids
+CONTACT_CUTOFFS = OrderedDict((
+    ("salt_bridge", 4.0),
+    ("pi_stacking", 5.5),
+    ("hydrophobic", 4.0),
+    ("metal", 3.0),
+))
+
+# Charged atoms of salt bridges as (residue names, atom names)
+CATIONS = (
+    (("LYS",), ("NZ",)),
+    (("ARG",), ("NE", "NH1", "NH2")),
+    (("HIS",), ("ND1", "NE2")),
+)
+ANIONS = (
+    (("ASP",), ("OD1", "OD2")),
+    (("GLU",), ("OE1", "OE2")),
+    (PROTEIN_RESIDUES, ("OXT",)),
+    (NUCLEIC_RESIDUES, ("OP1", "OP2", "O1P", "O2P")),
+)
+
+# Carbon (and methionine sulfur or selenium) atoms bonded only to carbon and hydrogen
+HYDROPHOBIC_ATOMS = (
+    (("ALA",), ("CB",)),
+    (("VAL",), ("CB", "CG1", "CG2")),
+    (("LEU",), ("CB", "CG", "CD1", "CD2")),
+    (("ILE",), ("CB", "CG1", "CG2", "CD1")),
+    (("MET",), ("CG", "SD", "CE")),
+    (("MSE",), ("CG", "SE", "CE")),
+    (("PHE",), ("CB", "CG", "CD1", "CD2", "CE1", "CE2", "CZ")),
+    (("TRP",), ("CB", "CG", "CD2", "CE3", "CZ2", "CZ3", "CH2")),
+    (("TYR",), ("CB", "CG", "CD1", "CD2", "CE1", "CE2")),
+    (("PRO",), ("CB", "CG")),
+    (("LYS",), ("CB", "CG", "CD")),
+    (("ARG",), ("CB", "CG")),
+    (("THR",), ("CG2",)),
+    (("DT",), ("C7", "C5M")),
+)
+
+# Aromatic rings as (residue names, ring atom names)
+AROMATIC_RINGS = (
+    (("PHE", "TYR"), ("CG", "CD1", "CD2", "CE1", "CE2", "CZ")),
+    (("TRP",), ("CD2", "CE2", "CE3", "CZ2", "CZ3", "CH2")),
+    (("TRP",), ("CG", "CD1", "NE1", "CE2", "CD2")),
+    (("HIS",), ("CG", "ND1", "CD2", "CE1", "NE2")),
+    (("A", "G", "DA", "DG"), ("N1", "C2", "N3", "C4", "C5", "C6")),
+    (("A", "G", "DA", "DG"), ("C4", "C5", "N7", "C8", "N9")),
+    (("C", "U", "DC", "DT"), ("N1", "C2", "N3", "C4", "C5", "C6")),
+)
+
+# Metal ion elements, and the elements of the atoms they coordinate
+METAL_ELEMENTS = ("LI", "NA", "K", "MG", "CA", "MN", "FE", "CO", "NI", "CU", "ZN", "CD", "HG")
+METAL_LIGAND_ELEMENTS = ("N", "O", "S")
+
+# Ring pairs stack face to face below this angle between their normals in
+# degrees, and edge to face (T-shaped) above the second one, with the
+# centroid of each ring at most the offset in angstroms from the axis of the other
+_PARALLEL_ANGLE = 30.0
+_T_SHAPED_ANGLE = 60.0
+_STACKING_OFFSET = 2.0
+
+# Role bits of the atoms and ring centroids of the shared index
+_CATION, _ANION, _HYDROPHOBIC, _METAL, _LIGAND, _RING = (1 << bit for bit in range(6))
+
+class Contacts:
+    '''
+    This class holds the non-covalent contacts found in a structure, ordered by contact type
+
+    **Attributes**
+
+    kinds: *numpy.ndarray*
+        The type of each contact (a key of CONTACT_CUTOFFS)
+
+    atoms: *numpy.ndarray*
+        Integer array of shape (contacts, 2) of the atoms in contact, the first
+        atom of each ring for aromatic stacking
+
+    rings: *numpy.ndarray*
+        Integer array of shape (contacts, 2) of the rings of an aromatic
+        stacking (rows of ring_atoms), -1 for the other contacts
+
+    distances: *numpy.ndarray*
+        The distance of each contact in angstroms, between ring centroids for aromatic stacking
+
+    ring_atoms: *numpy.ndarray*
+        Integer array of shape (rings, 6) of the atoms of every aromatic ring, padded with -1
+
+    ring_centroids: *numpy.ndarray*
+        Float array of shape (rings, 3) of the center of every aromatic ring
+    '''
+    def __init__(self, kinds, atoms, rings, distances, ring_atoms, ring_centroids):
+        self.kinds = kinds
+        self.atoms = atoms
+        self.rings = rings
+        self.distances = distances
+        self.ring_atoms = ring_atoms
+        self.ring_centroids = ring_centroids
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __repr__(self):
+        return "<Contacts {}>".format(", ".join(
+            "{} {}".format(count, kind) for kind, count in self.counts().items()))
+
+    def counts(self):
+        '''
+        This function will count the contacts of every type
+
+        **Returns**
+
+            OrderedDict of each contact type to its number of contacts
+        '''
+        return OrderedDict((kind, int(np.count_nonzero(self.kinds == kind)))
+                           for kind in CONTACT_CUTOFFS)
+
+    def of_kind(self, kind):
+        '''
+        This function will return the positions of the contacts of one type
+
+        **Parameters**
+
+        kind: *str*
+            The contact type (e.g. salt_bridge)
+
+        **Returns**
+
+            Array of contact positions
+        '''
+        return np.flatnonzero(self.kinds == kind)
+
+def residue_ids(structure):
+    '''
+    This function will number the residues of a structure, a new residue
+    starting wherever the chain, residue identifier or residue name changes
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    **Returns**
+
+        Integer array of the residue number of each atom, counted from 0
+    '''
+    starts = np.ones(len(structure), dtype=bool)
+    starts[1:] = ((structure.chain[1:] != structure.chain[:-1])
+                  | (structure.resi[1:] != structure.resi[:-1])
+                  | (structure.resn[1:] != structure.resn[:-1]))
+    return np.cumsum(starts) - 1
+
+def aromatic_rings(structure, residue):
+    '''
+    This function will find the complete aromatic rings of a structure
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    residue: *numpy.ndarray*
+        The residue number of each atom from residue_ids
+
+    **Returns**
+
+        Integer array of shape (rings, 6) of the ring atoms padded with -1,
+        float array of shape (rings, 3) of the ring centroids and float array
+        of shape (rings, 3) of the unit ring normals
+    '''
+    coords = structure.coords.astype(np.float64)
+    nresidues = int(residue[-1]) + 1 if len(residue) else 0
+    ring_atoms, centroids, normals = [], [], []
+    for residues, names in AROMATIC_RINGS:
+        # The first atom of each name in every residue, e.g. the first alternate location
+        table = np.full((nresidues, len(names)), -1, dtype=np.int64)
+        for column, name in enumerate(names):
+            atoms = structure.select(resn=list(residues), name=name, record="ATOM")
+            owners, first = np.unique(residue[atoms], return_index=True)
+            table[owners, column] = atoms[first]
+        table = table[np.all(table >= 0, axis=1)]
+        if not len(table):
+            continue
+        xyz = coords[table]
+        center = xyz.mean(axis=1)
+        # The ring normal is the direction of least spread of its atoms
+        normal = np.linalg.svd(xyz - center[:, np.newaxis, :])[2][:, -1]
+        ring_atoms.append(np.pad(table, ((0, 0), (0, 6 - len(names))), constant_values=-1))
+        centroids.append(center)
+        normals.append(normal)
+    if not ring_atoms:
+        return np.zeros((0, 6), dtype=np.int64), np.zeros((0, 3)), np.zeros((0, 3))
+    return np.concatenate(ring_atoms), np.concatenate(centroids), np.concatenate(normals)
+
+############################################################
+###################  Contact Profile  ######################
+############################################################
+
+def _closest_per_residue_pair(keep, first_residue, second_residue, distance):
+    '''
+    This function will keep only the closest of the kept pairs between each pair of residues
+
+    **Parameters**
+
+    keep: *numpy.ndarray*
+        Boolean array of the pairs that have the contact
+
+    first_residue, second_residue: *numpy.ndarray*
+        The residue number of both ends of every pair
+
+    distance: *numpy.ndarray*
+        The distance of every pair
+
+    **Returns**
+
+        Array of the positions of the closest pair of each residue pair
+    '''
+    kept = np.flatnonzero(keep)
+    low = np.minimum(first_residue[kept], second_residue[kept]).astype(np.int64)
+    high = np.maximum(first_residue[kept], second_residue[kept]).astype(np.int64)
+    keys = low * (int(max(first_residue.max(initial=0), second_residue.max(initial=0))) + 1) + high
+    order = np.lexsort((distance[kept], keys))
+    _, first = np.unique(keys[order], return_index=True)
+    return np.sort(kept[order[first]])
+
+def find_contacts(structure, interchain=True, cutoffs=CONTACT_CUTOFFS, progress=None):
+    '''
+    This function will find the salt bridges, aromatic stacking, hydrophobic
+    contacts and metal coordination of a structure in one pass. The charged,
+    hydrophobic, metal and metal binding atoms and the aromatic ring
+    centroids all go into one shared grid, each point tagged with its roles,
+    and a single neighbor search at the largest cutoff finds every candidate
+    pair, which is then sorted into contact types by the roles of its ends.
+    Salt bridges, stacking and hydrophobic contacts keep the closest pair of
+    each residue pair, and residues next to each other in a chain are not
+    counted as hydrophobic contacts. The first model of an ensemble is used
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    interchain: *bool*
+        Only keep salt bridges, stacking and hydrophobic contacts between
+        different chains. Metal ions are counted with every atom they coordinate
+
+    cutoffs: *OrderedDict*
+        The largest distance in angstroms of each contact type (see CONTACT_CUTOFFS)
+
+    progress: *callable*
+        A function taking the fraction done and a message, or None. It may
+        raise to stop the search, e.g. when the analysis is cancelled
+
+    **Returns**
+
+        Contacts of the structure
+    '''
+    coords = structure.coords.astype(np.float64)
+    residue = residue_ids(structure)
+
+    # The role bits of every atom that takes part in any contact type
+    roles = np.zeros(len(structure), dtype=np.int64)
+    for bit, table in ((_CATION, CATIONS), (_ANION, ANIONS), (_HYDROPHOBIC, HYDROPHOBIC_ATOMS)):
+        roles[select_table(structure, table)[0]] |= bit
+    roles[structure.select(element=list(METAL_ELEMENTS), record="HETATM")] |= _METAL
+    ligands = structure.select(element=list(METAL_LIGAND_ELEMENTS))
+    roles[ligands[~np.isin(structure.resn[ligands], ("HOH", "WAT", "DOD"))]] |= _LIGAND
+    atoms = np.flatnonzero(roles)
+
+    # Ring centroids join the atoms as extra points of the same grid
+    if progress is not None:
+        progress(0.0, "Finding aromatic rings")
+    ring_atoms, centroids, normals = aromatic_rings(structure, residue)
+    point_xyz = np.concatenate((coords[atoms], centroids))
+    point_roles = np.concatenate((roles[atoms], np.full(len(centroids), _RING)))
+    point_atom = np.concatenate((atoms, ring_atoms[:, 0]))
+    point_residue = residue[point_atom] if len(point_atom) else point_atom
+    point_ring = np.concatenate((np.full(len(atoms), -1), np.arange(len(centroids))))
+
+    empty = Contacts(np.zeros(0, dtype="U11"), np.zeros((0, 2), dtype=np.int64),
+                     np.zeros((0, 2), dtype=np.int64), np.zeros(0), ring_atoms, centroids)
+    if len(point_xyz) < 2:
+        return empty
+    first, second, distance = CellList(point_xyz, max(cutoffs.values())).query_pairs(
+        progress=progress)
+    apart = point_residue[first] != point_residue[second]
+    first, second, distance = first[apart], second[apart], distance[apart]
+    role1, role2 = point_roles[first], point_roles[second]
+    interface = np.ones(len(first), dtype=bool)
+    if interchain:
+        interface = structure.chain[point_atom[first]] != structure.chain[point_atom[second]]
+
+    def both(bit1, bit2):
+        '''
+        This function will test for pairs with one end of each role, either way round
+        '''
+        return (((role1 & bit1) > 0) & ((role2 & bit2) > 0)
+                | ((role1 & bit2) > 0) & ((role2 & bit1) > 0))
+
+    found = OrderedDict()
+    found["salt_bridge"] = _closest_per_residue_pair(
+        both(_CATION, _ANION) & interface & (distance <= cutoffs["salt_bridge"]),
+        point_residue[first], point_residue[second], distance)
+
+    # Stacking needs the ring planes parallel or perpendicular, with each
+    # centroid close to the axis of the other ring
+    stacking = both(_RING, _RING) & interface & (distance <= cutoffs["pi_stacking"])
+    ring1, ring2 = point_ring[first[stacking]], point_ring[second[stacking]]
+    cosine = np.abs((normals[ring1] * normals[ring2]).sum(axis=1))
+    plane_angle = np.degrees(np.arccos(np.clip(cosine, 0.0, 1.0)))
+    between = centroids[ring2] - centroids[ring1]
+    offset = np.minimum(
+        np.linalg.norm(between - (between * normals[ring1]).sum(axis=1)[:, np.newaxis]
+                       * normals[ring1], axis=1),
+        np.linalg.norm(between - (between * normals[ring2]).sum(axis=1)[:, np.newaxis]
+                       * normals[ring2], axis=1))
+    stacking[stacking] = (((plane_angle <= _PARALLEL_ANGLE) | (plane_angle >= _T_SHAPED_ANGLE))
+                          & (offset <= _STACKING_OFFSET))
+    found["pi_stacking"] = _closest_per_residue_pair(
+        stacking, point_residue[first], point_residue[second], distance)
+
+    # Side chains of residues next to each other in a chain always touch
+    adjacent = ((np.abs(point_residue[first] - point_residue[second]) == 1)
+                & (structure.chain[point_atom[first]] == structure.chain[point_atom[second]]))
+    found["hydrophobic"] = _closest_per_residue_pair(
+        both(_HYDROPHOBIC, _HYDROPHOBIC) & interface & ~adjacent
+        & (distance <= cutoffs["hydrophobic"]),
+        point_residue[first], point_residue[second], distance)
+    found["metal"] = np.flatnonzero(both(_METAL, _LIGAND) & (distance <= cutoffs["metal"]))
+
+    kinds = np.concatenate([np.full(len(pairs), kind, dtype="U11")
+                            for kind, pairs in found.items()])
+    pairs = np.concatenate(list(found.values()))
+    contact_atoms = np.column_stack((point_atom[first[pairs]], point_atom[second[pairs]]))
+    contact_rings = np.column_stack((point_ring[first[pairs]], point_ring[second[pairs]]))
+    # Metal contacts list the ion first
+    swap = (kinds == "metal") & ((point_roles[second[pairs]] & _METAL) > 0)
+    contact_atoms[swap] = contact_atoms[swap][:, ::-1]
+    return Contacts(kinds, contact_atoms.reshape(-1, 2), contact_rings.reshape(-1, 2),
+                    distance[pairs], ring_atoms, centroids)
@@ -0,0 +1,319 @@
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .neighbor_miv import CellList
+except ImportError:
+    from neighbor_miv import CellList
+
+############################################################
+###################  Backbone Hydrogen Bonds  ##############
+############################################################
+
+# Electrostatic constant of the DSSP H-bond energy, 0.42 e * 0.20 e * 332 kcal/mol
+_HBOND_FACTOR = 0.084 * 332.0
+
+# Energies in kcal/mol below which an N-H...O=C pair counts as an H-bond,
+# and the lowest energy any pair is given
+_HBOND_MAX_ENERGY = -0.5
+_HBOND_MIN_ENERGY = -9.9
+
+# Residues whose C-alpha atoms are further apart than this never H-bond
+_CA_CUTOFF = 9.0
+
+# A peptide bond longer than this is a chain break
+_PEPTIDE_BOND = 2.5
+
+# Bends are C-alpha chain angles over this many degrees
+_BEND_ANGLE = 70.0
+
+# Secondary structure codes in order of priority, as DSSP writes them
+ALPHA_HELIX = "H"
+BRIDGE = "B"
+STRAND = "E"
+HELIX_3 = "G"
+HELIX_5 = "I"
+TURN = "T"
+BEND = "S"
+LOOP = " "
+
+class SecondaryStructure:
+    '''
+    This class holds the DSSP-style secondary structure of the amino acid
+    residues of a structure and the backbone H-bonds it was assigned from
+
+    **Attributes**
+
+    atoms: *numpy.ndarray*
+        The C-alpha atom index of each residue in the structure
+
+    codes: *numpy.ndarray*
+        The secondary structure code of each residue (H, B, E, G, I, T, S or a space)
+
+    segments: *numpy.ndarray*
+        An integer per residue that changes at every chain break
+
+    donors, acceptors: *numpy.ndarray*
+        Residue indices of the N-H donor and C=O acceptor of each backbone H-bond
+
+    energies: *numpy.ndarray*
+        The energy in kcal/mol of each backbone H-bond
+    '''
+    def __init__(self, atoms, codes, segments, donors, acceptors, energies):
+        self.atoms = atoms
+        self.codes = codes
+        self.segments = segments
+        self.donors = donors
+        self.acceptors = acceptors
+        self.energies = energies
+
+    def __len__(self):
+        return len(self.atoms)
+
+    def __repr__(self):
+        return "<SecondaryStructure of {} residues: {} helical, {} strand>".format(
+            len(self), int((self.codes == ALPHA_HELIX).sum()), int((self.codes == STRAND).sum()))
+
+    def __str__(self):
+        return "".join(self.codes)
+
+    def mask(self, *codes):
+        '''
+        This function will return a boolean mask of the residues with any of the given codes
+
+        **Parameters**
+
+        codes: *tuple*
+            Secondary structure codes (e.g. H, or G, H and I for any helix)
+
+        **Returns**
+
+            Boolean array with one entry per residue
+        '''
+        return np.isin(self.codes, codes)
+
+def backbone(structure):
+    '''
+    This function will collect the N, C-alpha, C and O coordinates of every
+    residue that has all four backbone atoms, in file order
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    **Returns**
+
+        Array of C-alpha atom indices and a dictionary of (residues, 3)
+        coordinate arrays keyed by atom name
+    '''
+    count = len(structure)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), {name: np.zeros((0, 3)) for name in "N CA C O".split()}
+    # A residue starts wherever the chain, residue identifier or residue name changes
+    starts = np.ones(count, dtype=bool)
+    starts[1:] = ((structure.chain[1:] != structure.chain[:-1])
+                  | (structure.resi[1:] != structure.resi[:-1])
+                  | (structure.resn[1:] != structure.resn[:-1]))
+    residue = np.cumsum(starts) - 1
+    nresidues = residue[-1] + 1
+    first_atom = {}
+    for name in ("N", "CA", "C", "O"):
+        atoms = structure.select(name=name)
+        # keep the first atom of each residue, e.g. the first alternate location
+        owners, first = np.unique(residue[atoms], return_index=True)
+        table = np.full(nresidues, -1, dtype=np.int64)
+        table[owners] = atoms[first]
+        first_atom[name] = table
+    complete = np.all([first_atom[name] >= 0 for name in first_atom], axis=0)
+    coords = structure.coords.astype(np.float64)
+    atoms = {name: coords[table[complete]] for name, table in first_atom.items()}
+    return first_atom["CA"][complete], atoms
+
+def hbond_energy(donor_n, donor_h, acceptor_c, acceptor_o):
+    '''
+    This function will compute the DSSP electrostatic energy of N-H...O=C pairs
+
+    **Parameters**
+
+    donor_n, donor_h: *numpy.ndarray*
+        Arrays of shape (pairs, 3) of the donor amide N and H coordinates
+
+    acceptor_c, acceptor_o: *numpy.ndarray*
+        Arrays of shape (pairs, 3) of the acceptor carbonyl C and O coordinates
+
+    **Returns**
+
+        Array of energies in kcal/mol
+    '''
+    def distance(first, second):
+        return np.sqrt(((first - second) ** 2).sum(axis=1))
+    r_on = distance(acceptor_o, donor_n)
+    r_ch = distance(acceptor_c, donor_h)
+    r_oh = distance(acceptor_o, donor_h)
+    r_cn = distance(acceptor_c, donor_n)
+    too_close = np.minimum(np.minimum(r_on, r_ch), np.minimum(r_oh, r_cn)) < 0.5
+    with np.errstate(divide="ignore"):
+        energy = _HBOND_FACTOR * (1 / r_on + 1 / r_ch - 1 / r_oh - 1 / r_cn)
+    energy[too_close] = _HBOND_MIN_ENERGY
+    return np.maximum(np.round(energy, 3), _HBOND_MIN_ENERGY)
+
+############################################################
+###################  Secondary Structure  ##################
+############################################################
+
+def assign_secondary_structure(structure, progress=None):
+    '''
+    This function will assign DSSP-style secondary structure to every amino
+    acid residue from backbone H-bond energies. Candidate donor and acceptor
+    residues come from one neighbor search over the C-alpha atoms and all
+    energies are computed in one vectorized pass, so there is no limit on
+    the number of residues or chains
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    progress: *callable*
+        A function taking the fraction done and a message, or None. It may
+        raise to stop the search, e.g. when the analysis is cancelled
+
+    **Returns**
+
+        SecondaryStructure of the residues with a complete backbone
+    '''
+    atoms, backbone_xyz = backbone(structure)
+    n_xyz, ca_xyz, c_xyz, o_xyz = (backbone_xyz[name] for name in ("N", "CA", "C", "O"))
+    count = len(atoms)
+    chain = structure.chain[atoms]
+
+    # A chain break is a change of chain or a missing peptide bond
+    breaks = np.zeros(count, dtype=bool)
+    if count > 1:
+        peptide = np.sqrt(((c_xyz[:-1] - n_xyz[1:]) ** 2).sum(axis=1))
+        breaks[1:] = (chain[1:] != chain[:-1]) | (peptide > _PEPTIDE_BOND)
+    segments = np.cumsum(breaks)
+
+    # The amide H lies along the C=O direction of the previous residue, and
+    # the first residue of a segment and prolines have no H to donate
+    has_h = ~breaks & (structure.resn[atoms] != "PRO")
+    has_h[:1] = False
+    h_xyz = n_xyz.copy()
+    if count > 1:
+        carbonyl = c_xyz[:-1] - o_xyz[:-1]
+        carbonyl /= np.maximum(np.linalg.norm(carbonyl, axis=1), 1e-9)[:, np.newaxis]
+        h_xyz[1:] += carbonyl
+
+    # Every residue pair with C-alpha atoms in range is a candidate both ways,
+    # except the acceptor right before its donor as in DSSP
+    first, second, _ = CellList(ca_xyz, _CA_CUTOFF).query_pairs(progress=progress)
+    donors = np.concatenate((first, second))
+    acceptors = np.concatenate((second, first))
+    keep = has_h[donors] & (donors != acceptors + 1)
+    donors, acceptors = donors[keep], acceptors[keep]
+    energies = hbond_energy(n_xyz[donors], h_xyz[donors], c_xyz[acceptors], o_xyz[acceptors])
+
+    # Each donor keeps its two best acceptors below the H-bond energy
+    order = np.lexsort((energies, donors))
+    donors, acceptors, energies = donors[order], acceptors[order], energies[order]
+    group_start = np.searchsorted(donors, donors, side="left")
+    keep = (np.arange(len(donors)) - group_start < 2) & (energies < _HBOND_MAX_ENERGY)
+    donors, acceptors, energies = donors[keep], acceptors[keep], energies[keep]
+    bond_keys = np.sort(donors.astype(np.int64) * count + acceptors)
+
+    def bonded(donor, acceptor):
+        '''
+        This function will test for an H-bond from the N-H of each donor
+        residue to the C=O of each acceptor residue, False out of range
+        '''
+        donor, acceptor = np.asarray(donor), np.asarray(acceptor)
+        inside = (donor >= 0) & (donor < count) & (acceptor >= 0) & (acceptor < count)
+        keys = np.where(inside, donor, 0).astype(np.int64) * count + np.where(inside, acceptor, 0)
+        position = np.minimum(np.searchsorted(bond_keys, keys), max(len(bond_keys) - 1, 0))
+        return inside & (len(bond_keys) > 0) & (bond_keys[position] == keys)
+
+    def same_segment(first, last):
+        '''
+        This function will test that residues first to last have no chain break between them
+        '''
+        first, last = np.asarray(first), np.asarray(last)
+        inside = (first >= 0) & (last < count)
+        return inside & (segments[np.clip(first, 0, count - 1)]
+                         == segments[np.clip(last, 0, count - 1)])
+
+    codes = np.full(count, LOOP, dtype="U1")
+    residues = np.arange(count)
+
+    # n-turns: the C=O of residue i bonds the N-H of residue i+n
+    turns = {n: bonded(residues + n, residues) & same_segment(residues, residues + n)
+             for n in (3, 4, 5)}
+
+    # Bridges between residue pairs at least three apart
+    pair = second - first >= 3
+    i, j = first[pair], second[pair]
+    ends = same_segment(i - 1, i + 1) & same_segment(j - 1, j + 1)
+    parallel = ends & ((bonded(i + 1, j) & bonded(j, i - 1))
+                       | (bonded(j + 1, i) & bonded(i, j - 1)))
+    antiparallel = ends & ~parallel & ((bonded(i + 1, j - 1) & bonded(j + 1, i - 1))
+                                       | (bonded(j, i) & bonded(i, j)))
+    bridge_keys = {}
+    for kind, found in (("parallel", parallel), ("antiparallel", antiparallel)):
+        bridge_keys[kind] = (np.sort(i[found].astype(np.int64) * count + j[found]),
+                             i[found], j[found])
+
+    def has_bridge(kind, first, second):
+        '''
+        This function will test for a bridge of a kind between residue pairs
+        '''
+        keys = bridge_keys[kind][0]
+        if not len(keys):
+            return np.zeros(len(first), dtype=bool)
+        query = first.astype(np.int64) * count + second
+        position = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        return keys[position] == query
+
+    # Bridges next to a bridge of the same kind form a ladder (strand E),
+    # the others stay isolated bridges (B)
+    for kind, step in (("parallel", 1), ("antiparallel", -1)):
+        _, bridge_i, bridge_j = bridge_keys[kind]
+        ladder = (has_bridge(kind, bridge_i + 1, bridge_j + step)
+                  | has_bridge(kind, bridge_i - 1, bridge_j - step))
+        for code, members in ((BRIDGE, ~ladder), (STRAND, ladder)):
+            for side in (bridge_i[members], bridge_j[members]):
+                codes[side] = np.where(codes[side] == STRAND, STRAND, code)
+
+    def helix_starts(n):
+        '''
+        This function will find the residues i where n-turns start at i-1 and i
+        '''
+        starts = turns[n].copy()
+        starts[1:] &= turns[n][:-1]
+        starts[:1] = False
+        return np.flatnonzero(starts)
+
+    # Alpha helices take priority over strands, 3-10 and pi helices fill only loops
+    for start in helix_starts(4):
+        codes[start:start + 4] = ALPHA_HELIX
+    for n, code in ((3, HELIX_3), (5, HELIX_5)):
+        for start in helix_starts(n):
+            span = slice(start, start + n)
+            if np.all((codes[span] == LOOP) | (codes[span] == code)):
+                codes[span] = code
+
+    # Turns and bends only mark residues that are still loops
+    turn = np.zeros(count, dtype=bool)
+    for n in (3, 4, 5):
+        for offset in range(1, min(n, count)):
+            turn[offset:] |= turns[n][:count - offset]
+    codes[turn & (codes == LOOP)] = TURN
+    if count > 4:
+        before = ca_xyz[2:-2] - ca_xyz[:-4]
+        after = ca_xyz[4:] - ca_xyz[2:-2]
+        cosine = (before * after).sum(axis=1) / np.maximum(
+            np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1), 1e-9)
+        kappa = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+        bend = np.zeros(count, dtype=bool)
+        bend[2:-2] = (kappa > _BEND_ANGLE) & same_segment(residues[:-4], residues[4:])
+        codes[bend & (codes == LOOP)] = BEND
+
+    return SecondaryStructure(atoms, codes, segments, donors, acceptors, energies)
@@ -0,0 +1,231 @@
+############################################################
+###################  PyMOL Command Emitter  ################
+############################################################
+
+# Commands whose consecutive calls with the same first argument
+# can be merged into one call over the joined selections
+_MERGEABLE = ("show", "hide", "color")
+
+class PymolScript:
+    '''
+    This class records the PyMOL commands of an analysis, so they can either be
+    applied in-process through the pymol cmd API or exported as a .pml script
+
+    **Attributes**
+
+    commands: *list*
+        List of (command, arguments) tuples in the order they were added
+    '''
+    def __init__(self):
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, command, *args):
+        '''
+        This function will record one PyMOL command
+
+        **Parameters**
+
+        command: *str*
+            The PyMOL command name as written in a .pml script (e.g. dist, color)
+
+        args: *tuple*
+            The command arguments
+
+        **Returns**
+
+            None
+        '''
+        self.commands.append((command, args))
+
+    def load(self, filename, object_name):
+        '''
+        This function will record loading a structure file as an object
+        '''
+        self.add("load", filename, object_name)
+
+    def remove(self, selection):
+        '''
+        This function will record removing the atoms of a selection
+        '''
+        self.add("remove", selection)
+
+    def dist(self, name, selection1, selection2, cutoff=None):
+        '''
+        This function will record a distance object between two selections
+        '''
+        if cutoff is None:
+            self.add("dist", name, selection1, selection2)
+        else:
+            self.add("dist", name, selection1, selection2, cutoff)
+
+    def select(self, name, selection):
+        '''
+        This function will record naming a selection, without enabling it, so
+        later commands reuse it instead of evaluating the selection again
+        '''
+        self.add("select", name, selection, 0)
+
+    def pseudoatom(self, object_name, selection, resi=1):
+        '''
+        This function will record adding a pseudoatom at the center of a
+        selection to an object, numbered resi so later commands can select it
+        '''
+        self.add("pseudoatom", object_name, selection, "CEN", "PSD", resi)
+
+    def show(self, representation, selection):
+        '''
+        This function will record showing a representation of a selection
+        '''
+        self.add("show", representation, selection)
+
+    def hide(self, representation, selection):
+        '''
+        This function will record hiding a representation of a selection
+        '''
+        self.add("hide", representation, selection)
+
+    def color(self, color, selection):
+        '''
+        This function will record coloring a selection
+        '''
+        self.add("color", color, selection)
+
+    def set(self, setting, value, selection=None):
+        '''
+        This function will record changing a PyMOL setting, optionally for one object
+        '''
+        if selection is None:
+            self.add("set", setting, value)
+        else:
+            self.add("set", setting, value, selection)
+
+    def alter(self, selection, expression, space=None):
+        '''
+        This function will record changing atom properties with a Python
+        expression, e.g. b = coverage.get(int(resv), 0.0), whose names may
+        come from the space dictionary
+        '''
+        if space is None:
+            self.add("alter", selection, expression)
+        else:
+            self.add("alter", selection, expression, space)
+
+    def spectrum(self, expression, palette, selection, minimum=None, maximum=None):
+        '''
+        This function will record coloring a selection by a property along a color palette
+        '''
+        if minimum is None or maximum is None:
+            self.add("spectrum", expression, palette, selection)
+        else:
+            self.add("spectrum", expression, palette, selection, minimum, maximum)
+
+    def to_pml(self):
+        '''
+        This function will write the recorded commands as PyMOL script text
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+            String of the .pml script
+        '''
+        lines = []
+        for command, args in self.commands:
+            if command == "load":
+                # The object name follows from the file name, as when the script is run
+                args = args[:1]
+            elif command == "alter" and len(args) == 3:
+                # A Python block passes the space dictionary in the same single call
+                lines.append("python\ncmd.alter({!r}, {!r}, space={!r})\npython end".format(
+                    *args))
+                continue
+            lines.append("{} {}".format(command, ", ".join(str(arg) for arg in args)))
+        return "\n".join(lines) + "\n"
+
+    def write(self, pml_file):
+        '''
+        This function will export the recorded commands as a .pml script
+
+        **Parameters**
+
+        pml_file: *str*
+            The file name of the script to write
+
+        **Returns**
+
+            None
+        '''
+        with open(pml_file, "w", encoding="utf8") as bondfile:
+            bondfile.write(self.to_pml())
+
+    def batched(self):
+        '''
+        This function will merge runs of show, hide and color commands with the
+        same representation or color into one command over the joined selections
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+            List of (command, arguments) tuples
+        '''
+        batches = []
+        for command, args in self.commands:
+            if (command in _MERGEABLE and batches and batches[-1][0] == command
+                    and batches[-1][1][0] == args[0]):
+                batches[-1][1][1].append(args[1])
+                continue
+            if command in _MERGEABLE:
+                batches.append((command, (args[0], [args[1]])))
+            else:
+                batches.append((command, args))
+        merged = []
+        for command, args in batches:
+            if command in _MERGEABLE:
+                selections = args[1]
+                if len(selections) > 1:
+                    selections = ["({})".format(selection) for selection in selections]
+                args = (args[0], " or ".join(selections))
+            merged.append((command, args))
+        return merged
+
+    def apply(self, cmd):
+        '''
+        This function will apply the recorded commands through the pymol cmd API,
+        loading each object only if it is not loaded yet and suspending screen
+        updates until every command is applied
+
+        **Parameters**
+
+        cmd: *module*
+            The pymol cmd module
+
+        **Returns**
+
+            None
+        '''
+        loaded = set(cmd.get_names("objects"))
+        cmd.set("suspend_updates", 1)
+        try:
+            for command, args in self.batched():
+                if command == "load":
+                    if args[1] not in loaded:
+                        cmd.load(args[0], args[1])
+                        loaded.add(args[1])
+                elif command == "dist":
+                    cmd.distance(*args)
+                elif command == "set":
+                    cmd.set(*args)
+                elif command == "alter" and len(args) == 3:
+                    cmd.alter(args[0], args[1], space=args[2])
+                else:
+                    getattr(cmd, command)(*args)
+        finally:
+            cmd.set("suspend_updates", 0)
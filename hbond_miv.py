@@ -0,0 +1,336 @@
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .neighbor_miv import CellList
+except ImportError:
+    from neighbor_miv import CellList
+
+############################################################
+###################  Donors and Acceptors  #################
+############################################################
+
+# Residue names of the amino acids and of the RNA and DNA nucleotides
+PROTEIN_RESIDUES = ("ALA", "ARG", "ASN", "ASP", "CYS", "GLN", "GLU", "GLY", "HIS", "ILE",
+                    "LEU", "LYS", "MET", "MSE", "PHE", "PRO", "SER", "THR", "TRP", "TYR", "VAL")
+NUCLEIC_RESIDUES = ("A", "C", "G", "U", "DA", "DC", "DG", "DT")
+
+# Hydrogen geometry of a donor: SP2 hydrogens lie in the plane of the donor's
+# neighbors and are placed exactly, SP3 hydrogens rotate about the bond to
+# the donor's neighbor and are turned toward each acceptor
+SP2 = "sp2"
+SP3 = "sp3"
+
+# Donor atoms as (residue names, atom name, hydrogen geometry). Backbone
+# amides of proline have no hydrogen and are left out
+HBOND_DONORS = (
+    (tuple(resn for resn in PROTEIN_RESIDUES if resn != "PRO"), "N", SP2),
+    (("ARG",), "NE", SP2),
+    (("ARG",), "NH1", SP2),
+    (("ARG",), "NH2", SP2),
+    (("ASN",), "ND2", SP2),
+    (("GLN",), "NE2", SP2),
+    (("HIS",), "ND1", SP2),
+    (("HIS",), "NE2", SP2),
+    (("TRP",), "NE1", SP2),
+    (("LYS",), "NZ", SP3),
+    (("SER",), "OG", SP3),
+    (("THR",), "OG1", SP3),
+    (("TYR",), "OH", SP3),
+    (("CYS",), "SG", SP3),
+    (("G", "DG"), "N1", SP2),
+    (("G", "DG"), "N2", SP2),
+    (("A", "DA"), "N6", SP2),
+    (("C", "DC"), "N4", SP2),
+    (("U",), "N3", SP2),
+    (("DT",), "N3", SP2),
+    (("A", "C", "G", "U"), "O2'", SP3),
+)
+
+# Acceptor atoms as (residue names, atom names)
+HBOND_ACCEPTORS = (
+    (PROTEIN_RESIDUES, ("O", "OXT")),
+    (("ASP",), ("OD1", "OD2")),
+    (("GLU",), ("OE1", "OE2")),
+    (("ASN",), ("OD1",)),
+    (("GLN",), ("OE1",)),
+    (("HIS",), ("ND1", "NE2")),
+    (("SER",), ("OG",)),
+    (("THR",), ("OG1",)),
+    (("TYR",), ("OH",)),
+    (("MET",), ("SD",)),
+    (("MSE",), ("SE",)),
+    (NUCLEIC_RESIDUES, ("OP1", "OP2", "O1P", "O2P", "O3'", "O4'", "O5'")),
+    (("A", "C", "G", "U"), ("O2'",)),
+    (("G", "DG"), ("O6", "N3", "N7")),
+    (("A", "DA"), ("N1", "N3", "N7")),
+    (("C", "DC"), ("O2", "N3")),
+    (("U", "DT"), ("O2", "O4")),
+)
+
+# Default largest donor to acceptor distance in angstroms and smallest
+# donor-hydrogen...acceptor angle in degrees of an H-bond
+HBOND_DISTANCE = 3.5
+HBOND_ANGLE = 120.0
+
+# Length in angstroms of the implicit N-H and O-H bonds
+_HYDROGEN_BOND_LENGTH = 1.0
+
+# Heavy atoms closer than this are taken as covalently bonded
+_COVALENT_CUTOFF = 1.9
+
+# The angle between a rotating hydrogen and the extension of the bond to
+# the donor's neighbor, 180 degrees less the tetrahedral angle
+_SP3_CONE = np.radians(180.0 - 109.5)
+
+class HydrogenBonds:
+    '''
+    This class holds the H-bonds found in a structure, ordered by donor and acceptor atom
+
+    **Attributes**
+
+    donors, acceptors: *numpy.ndarray*
+        Atom indices of the donor and acceptor of each H-bond
+
+    hydrogens: *numpy.ndarray*
+        A float array of shape (bonds, 3) of the implicit hydrogen placed on the donor
+
+    distances: *numpy.ndarray*
+        The donor to acceptor distance of each H-bond in angstroms
+
+    angles: *numpy.ndarray*
+        The donor-hydrogen...acceptor angle of each H-bond in degrees
+    '''
+    def __init__(self, donors, acceptors, hydrogens, distances, angles):
+        self.donors = donors
+        self.acceptors = acceptors
+        self.hydrogens = hydrogens
+        self.distances = distances
+        self.angles = angles
+
+    def __len__(self):
+        return len(self.donors)
+
+    def __repr__(self):
+        return "<HydrogenBonds {} bonds>".format(len(self))
+
+    def pairs(self):
+        '''
+        This function will return the donor and acceptor atoms of every H-bond
+
+        **Returns**
+
+            Integer array of shape (bonds, 2) of the donor and acceptor atom indices
+        '''
+        return np.column_stack((self.donors, self.acceptors))
+
+def select_table(structure, table):
+    '''
+    This function will select the atoms of a table of residue and atom names,
+    such as the donor and acceptor tables, through the atom index. HETATM
+    records are included, as modified residues such as selenomethionine
+    (MSE) are usually written as HETATM
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    table: *tuple*
+        Rows starting with the residue names and the atom name or names
+
+    **Returns**
+
+        Sorted array of atom indices and the array of the table row of each atom
+    '''
+    atoms, rows = [], []
+    for row, entry in enumerate(table):
+        found = structure.select(resn=list(entry[0]), name=entry[1])
+        atoms.append(found)
+        rows.append(np.full(len(found), row, dtype=np.int64))
+    atoms, rows = np.concatenate(atoms), np.concatenate(rows)
+    # An atom listed in two rows keeps the first
+    atoms, first = np.unique(atoms, return_index=True)
+    return atoms, rows[first]
+
+def _unit(vectors):
+    '''
+    This function will scale vectors of shape (n, 3) to unit length
+    '''
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1), 1e-9)[:, np.newaxis]
+
+############################################################
+###################  Hydrogen Bond Search  #################
+############################################################
+
+def place_hydrogens(structure, donors, geometry):
+    '''
+    This function will place the implicit hydrogens of SP2 donors from their
+    covalently bonded heavy atoms: one hydrogen on the outer bisector of a
+    donor with two neighbors, and two hydrogens at 120 degrees in the plane of
+    the neighbor's own neighbors for a donor with one neighbor (an NH2
+    group). Backbone amides without a preceding residue are N termini and
+    get rotating SP3 hydrogens instead
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    donors: *numpy.ndarray*
+        Atom indices of the donors
+
+    geometry: *numpy.ndarray*
+        The hydrogen geometry (SP2 or SP3) of each donor, updated in place for N termini
+
+    **Returns**
+
+        Float array of shape (donors, 2, 3) of the hydrogens, NaN where a donor
+        has fewer than two placed hydrogens, and integer array of the first
+        bonded neighbor of each donor (-1 for none)
+    '''
+    coords = structure.coords.astype(np.float64)
+    heavy = np.flatnonzero(~np.isin(structure.element, ("H", "D")))
+    first, second, _ = CellList(coords[heavy], _COVALENT_CUTOFF).query_pairs()
+    # Bonds in both directions sorted by atom, as a compact adjacency list
+    bonded_from = heavy[np.concatenate((first, second))]
+    bonded_to = heavy[np.concatenate((second, first))]
+    order = np.argsort(bonded_from, kind="stable")
+    bonded_from, bonded_to = bonded_from[order], bonded_to[order]
+    starts = np.searchsorted(bonded_from, np.arange(len(structure) + 1))
+    counts = starts[donors + 1] - starts[donors]
+    padded = np.append(bonded_to, -1)
+
+    def neighbor(atoms, skip=None):
+        '''
+        This function will return the first bonded neighbor of each atom other
+        than the skipped atom of each, -1 where there is none
+        '''
+        atom_counts = starts[atoms + 1] - starts[atoms]
+        first_to = np.where(atom_counts > 0, padded[starts[atoms]], -1)
+        if skip is None:
+            return first_to
+        second_to = np.where(atom_counts > 1,
+                             padded[np.minimum(starts[atoms] + 1, len(bonded_to))], -1)
+        return np.where(first_to == skip, second_to, first_to)
+
+    first_neighbor = neighbor(donors)
+    second_neighbor = neighbor(donors, first_neighbor)
+    geometry[(structure.name[donors] == "N") & (counts == 1)] = SP3
+
+    hydrogens = np.full((len(donors), 2, 3), np.nan)
+    donor_xyz = coords[donors]
+    # Two neighbors: one hydrogen opposite the sum of the bond directions
+    two = (geometry == SP2) & (counts >= 2)
+    if two.any():
+        bisector = (_unit(coords[first_neighbor[two]] - donor_xyz[two])
+                    + _unit(coords[second_neighbor[two]] - donor_xyz[two]))
+        hydrogens[two, 0] = donor_xyz[two] - _HYDROGEN_BOND_LENGTH * _unit(bisector)
+    # One neighbor X bonded to Y: two hydrogens at 120 degrees in the D-X-Y
+    # plane, or one along the D-X bond when X has no other neighbor
+    one = np.flatnonzero((geometry == SP2) & (counts == 1))
+    if len(one):
+        anchor = first_neighbor[one]
+        plane_atom = neighbor(anchor, donors[one])
+        along = _unit(coords[anchor] - donor_xyz[one])
+        across = coords[np.where(plane_atom >= 0, plane_atom, anchor)] - coords[anchor]
+        across = _unit(across - (across * along).sum(axis=1)[:, np.newaxis] * along)
+        planar = plane_atom >= 0
+        for side, sign in enumerate((1.0, -1.0)):
+            direction = -0.5 * along + sign * np.sqrt(0.75) * across
+            hydrogens[one[planar], side] = (donor_xyz[one[planar]]
+                                            + _HYDROGEN_BOND_LENGTH * direction[planar])
+        hydrogens[one[~planar], 0] = (donor_xyz[one[~planar]]
+                                      - _HYDROGEN_BOND_LENGTH * along[~planar])
+    return hydrogens, first_neighbor
+
+def find_hbonds(structure, distance=HBOND_DISTANCE, angle=HBOND_ANGLE, interchain=True,
+                progress=None):
+    '''
+    This function will find the H-bonds of a structure from the geometry of
+    its heavy atoms. Donors and acceptors are selected from tables through
+    the atom index, implicit hydrogens are placed on the donors, and one grid
+    neighbor search pairs every donor with the acceptors in range, keeping
+    only the pairs whose donor-hydrogen...acceptor angle is wide enough.
+    Rotating hydrogens (hydroxyls, lysine and N-terminal amines) are turned
+    toward each acceptor on their tetrahedral cone. The first model of an
+    ensemble is used
+
+    **Parameters**
+
+    structure: *Structure*
+        A parsed structure from load_structure
+
+    distance: *float*
+        The largest donor to acceptor distance in angstroms
+
+    angle: *float*
+        The smallest donor-hydrogen...acceptor angle in degrees
+
+    interchain: *bool*
+        Only keep H-bonds between atoms of different chains, e.g. across the
+        interfaces of a complex
+
+    progress: *callable*
+        A function taking the fraction done and a message, or None. It may
+        raise to stop the search, e.g. when the analysis is cancelled
+
+    **Returns**
+
+        HydrogenBonds of the structure
+    '''
+    donors, donor_rows = select_table(structure, HBOND_DONORS)
+    acceptors, _ = select_table(structure, HBOND_ACCEPTORS)
+    empty = HydrogenBonds(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                          np.zeros((0, 3)), np.zeros(0), np.zeros(0))
+    if len(donors) == 0 or len(acceptors) == 0:
+        return empty
+    coords = structure.coords.astype(np.float64)
+    geometry = np.array([HBOND_DONORS[row][2] for row in donor_rows])
+    if progress is not None:
+        progress(0.0, "Placing hydrogens")
+    hydrogens, anchors = place_hydrogens(structure, donors, geometry)
+
+    donor_pair, acceptor_pair, pair_distance = CellList(coords[acceptors], distance).query(
+        coords[donors], progress=progress)
+    keep = donors[donor_pair] != acceptors[acceptor_pair]
+    if interchain:
+        keep &= structure.chain[donors[donor_pair]] != structure.chain[acceptors[acceptor_pair]]
+    donor_pair, acceptor_pair = donor_pair[keep], acceptor_pair[keep]
+    pair_distance = pair_distance[keep]
+    donor_xyz = coords[donors[donor_pair]]
+    acceptor_xyz = coords[acceptors[acceptor_pair]]
+
+    # SP2 donors: the better of their placed hydrogens
+    placed = hydrogens[donor_pair]
+    to_hydrogen = placed - donor_xyz[:, np.newaxis, :]
+    to_acceptor = acceptor_xyz[:, np.newaxis, :] - placed
+    with np.errstate(invalid="ignore"):
+        cosine = -(to_hydrogen * to_acceptor).sum(axis=2) / (
+            np.linalg.norm(to_hydrogen, axis=2) * np.maximum(
+                np.linalg.norm(to_acceptor, axis=2), 1e-9))
+    cosine = np.where(np.isnan(cosine), np.inf, cosine)
+    best = np.argmin(cosine, axis=1)
+    hydrogen_xyz = placed[np.arange(len(placed)), best]
+    cosine = cosine[np.arange(len(placed)), best]
+
+    # SP3 donors: the hydrogen on the cone about the bond from the neighbor,
+    # in the plane of that bond and the acceptor
+    rotating = (geometry[donor_pair] == SP3) & (anchors[donor_pair] >= 0)
+    if rotating.any():
+        axis = _unit(donor_xyz[rotating] - coords[anchors[donor_pair[rotating]]])
+        toward = acceptor_xyz[rotating] - donor_xyz[rotating]
+        toward = toward - (toward * axis).sum(axis=1)[:, np.newaxis] * axis
+        direction = np.cos(_SP3_CONE) * axis + np.sin(_SP3_CONE) * _unit(toward)
+        hydrogen_xyz[rotating] = donor_xyz[rotating] + _HYDROGEN_BOND_LENGTH * direction
+        to_hydrogen = hydrogen_xyz[rotating] - donor_xyz[rotating]
+        to_acceptor = acceptor_xyz[rotating] - hydrogen_xyz[rotating]
+        cosine[rotating] = -(to_hydrogen * to_acceptor).sum(axis=1) / (
+            np.linalg.norm(to_hydrogen, axis=1)
+            * np.maximum(np.linalg.norm(to_acceptor, axis=1), 1e-9))
+
+    pair_angle = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+    keep = np.isfinite(cosine) & (pair_angle >= angle)
+    order = np.lexsort((acceptors[acceptor_pair[keep]], donors[donor_pair[keep]]))
+    return HydrogenBonds(donors[donor_pair[keep]][order], acceptors[acceptor_pair[keep]][order],
+                         hydrogen_xyz[keep][order], pair_distance[keep][order],
+                         pair_angle[keep][order])
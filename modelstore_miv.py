@@ -0,0 +1,398 @@
+import hashlib
+import http.client
+import json
+import os
+import queue
+import shutil
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+############################################################
+###################  AlphaFold Model Store  ################
+############################################################
+
+# Where AlphaFold DB serves its model files, and the model version fetched
+ALPHAFOLD_URL = "https://alphafold.ebi.ac.uk/files/"
+DATABASE_VERSION = "v4"
+
+def model_files(alphafold_id, version=DATABASE_VERSION, pae=True):
+    '''
+    This function will return the AlphaFold DB file names of a model
+
+    **Parameters**
+
+    alphafold_id: *str*
+        The AlphaFold ID (e.g. AF-P22626-F1)
+
+    version: *str*
+        The AlphaFold DB model version
+
+    pae: *bool*
+        Also name the predicted aligned error JSON file
+
+    **Returns**
+
+        List of the PDB file name and, with pae, the PAE file name
+    '''
+    names = ["{}-model_{}.pdb".format(alphafold_id, version)]
+    if pae:
+        names.append("{}-predicted_aligned_error_{}.json".format(alphafold_id, version))
+    return names
+
+def _check_content(name, data):
+    '''
+    This function will check that downloaded bytes hold the file they are named
+    for, so an error page or a cut off transfer is never stored
+
+    **Parameters**
+
+    name: *str*
+        The file name
+
+    data: *bytes*
+        The file contents
+
+    **Returns**
+
+        None
+    '''
+    lowered = name.lower()
+    if not data:
+        raise ValueError("{} is empty".format(name))
+    if lowered.endswith((".pdb", ".ent")):
+        if b"\nATOM  " not in data and not data.startswith(b"ATOM  "):
+            raise ValueError("{} has no ATOM records".format(name))
+        if b"\nEND" not in data:
+            raise ValueError("{} is truncated".format(name))
+    elif lowered.endswith((".cif", ".mmcif")):
+        if b"_atom_site." not in data:
+            raise ValueError("{} has no _atom_site loop".format(name))
+    elif lowered.endswith(".json"):
+        try:
+            json.loads(data.decode("utf8"))
+        except ValueError as error:
+            raise ValueError("{} is not valid JSON".format(name)) from error
+
+class _ConnectionPool:
+    '''
+    This class lends out at most a fixed number of keep-alive HTTP connections
+    to one server, so concurrent downloads reuse connections instead of
+    opening one per file
+
+    **Attributes**
+
+    size: *int*
+        The largest number of open connections
+    '''
+    def __init__(self, url, size=8, timeout=30.0):
+        parts = urllib.parse.urlsplit(url)
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == "https"
+                                  else http.client.HTTPConnection)
+        self._host = parts.netloc
+        self._timeout = timeout
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def request(self, path):
+        '''
+        This function will GET a path on a pooled connection, waiting for a
+        free connection when all of them are in use
+
+        **Parameters**
+
+        path: *str*
+            The URL path of the file
+
+        **Returns**
+
+            The HTTP status, the response headers and the body bytes
+        '''
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connection_class(self._host, timeout=self._timeout)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._idle.put(connection)
+            return response.status, response.headers, body
+
+    def close(self):
+        '''
+        This function will close every idle connection
+        '''
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class ModelStore:
+    '''
+    This class keeps downloaded model files in a local content-addressed
+    cache: each file is stored once under the SHA-256 of its contents, and a
+    small reference file maps its name to that hash. Missing files are
+    fetched concurrently over a bounded pool of keep-alive connections,
+    checked, and written atomically so an interrupted download never leaves a
+    partial file in the cache
+
+    **Attributes**
+
+    cache_dir: *str*
+        The cache folder, with objects/ holding the contents and refs/ the names
+
+    base_url: *str*
+        The URL the file names are fetched under
+
+    max_connections: *int*
+        The largest number of concurrent downloads
+
+    retries: *int*
+        How many more times a failed download is tried
+    '''
+    def __init__(self, cache_dir="alphafold_models", base_url=ALPHAFOLD_URL,
+                 max_connections=8, timeout=30.0, retries=2):
+        self.cache_dir = cache_dir
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.max_connections = max_connections
+        self.retries = retries
+        self._pool = _ConnectionPool(self.base_url, max_connections, timeout)
+        for folder in ("objects", "refs", "tmp"):
+            os.makedirs(os.path.join(cache_dir, folder), exist_ok=True)
+
+    def __repr__(self):
+        return "<ModelStore {} from {}>".format(self.cache_dir, self.base_url)
+
+    def _object_path(self, digest, name):
+        '''
+        This function will return the cache path of the contents with a given
+        hash, keeping the extension of the name so readers can tell the format
+        '''
+        return os.path.join(self.cache_dir, "objects", digest[:2],
+                            digest + os.path.splitext(name)[1])
+
+    def _ref_path(self, name):
+        '''
+        This function will return the cache path of the reference of a file name
+        '''
+        return os.path.join(self.cache_dir, "refs", os.path.basename(name))
+
+    def _write_atomic(self, path, data):
+        '''
+        This function will write a file through a temporary file in the cache
+        and move it into place in one step
+        '''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = os.path.join(self.cache_dir, "tmp", "{}.{}.{}".format(
+            os.path.basename(path), os.getpid(), threading.get_ident()))
+        with open(temporary, "wb") as tmpfile:
+            tmpfile.write(data)
+            tmpfile.flush()
+            os.fsync(tmpfile.fileno())
+        os.replace(temporary, path)
+
+    def path(self, name):
+        '''
+        This function will return the cached file of a name
+
+        **Parameters**
+
+        name: *str*
+            The file name (e.g. AF-P22626-F1-model_v4.pdb)
+
+        **Returns**
+
+            String of the cached file path, or None when it is not cached
+        '''
+        try:
+            with open(self._ref_path(name), "r", encoding="utf8") as reffile:
+                digest = reffile.read().strip()
+        except FileNotFoundError:
+            return None
+        path = self._object_path(digest, name)
+        return path if os.path.exists(path) else None
+
+    def verify(self, name):
+        '''
+        This function will check that a cached file still has the contents it was stored with
+
+        **Parameters**
+
+        name: *str*
+            The file name
+
+        **Returns**
+
+            True if the file is cached and its contents match its hash
+        '''
+        path = self.path(name)
+        if path is None:
+            return False
+        digest = hashlib.sha256()
+        with open(path, "rb") as cachedfile:
+            for block in iter(lambda: cachedfile.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest() == os.path.splitext(os.path.basename(path))[0]
+
+    def put(self, name, data):
+        '''
+        This function will check the contents of a file and store them in the cache
+
+        **Parameters**
+
+        name: *str*
+            The file name
+
+        data: *bytes*
+            The file contents
+
+        **Returns**
+
+            String of the cached file path
+        '''
+        _check_content(name, data)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest, name)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        self._write_atomic(self._ref_path(name), digest.encode("ascii"))
+        return path
+
+    def _download(self, name):
+        '''
+        This function will download one file into the cache, trying again
+        after connection errors and server errors
+
+        **Parameters**
+
+        name: *str*
+            The file name
+
+        **Returns**
+
+            String of the cached file path
+        '''
+        path = urllib.parse.urlsplit(self.base_url).path + urllib.parse.quote(name)
+        for attempt in range(self.retries + 1):
+            try:
+                status, headers, body = self._pool.request(path)
+            except (OSError, http.client.HTTPException):
+                if attempt == self.retries:
+                    raise
+                continue
+            if status == 200:
+                expected = headers.get("Content-Length")
+                if expected is not None and int(expected) != len(body):
+                    if attempt == self.retries:
+                        raise ValueError("{} is truncated".format(name))
+                    continue
+                return self.put(name, body)
+            if status < 500 or attempt == self.retries:
+                raise ValueError("{} returned HTTP {}".format(name, status))
+        raise ValueError("{} could not be downloaded".format(name))
+
+    def fetch(self, names):
+        '''
+        This function will return the cached files of many names, downloading
+        the missing ones concurrently
+
+        **Parameters**
+
+        names: *list*
+            File names (e.g. from model_files)
+
+        **Returns**
+
+            Dictionary of every name found to its cached file path, and
+            dictionary of every name that failed to its error message
+        '''
+        paths, errors = {}, {}
+        missing = []
+        for name in dict.fromkeys(names):
+            path = self.path(name)
+            if path is None:
+                missing.append(name)
+            else:
+                paths[name] = path
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_connections, len(missing))) as pool:
+                futures = [(name, pool.submit(self._download, name)) for name in missing]
+                for name, future in futures:
+                    try:
+                        paths[name] = future.result()
+                    # pylint: disable=broad-except
+                    except Exception as error:
+                        errors[name] = str(error)
+        return paths, errors
+
+    def fetch_models(self, alphafold_ids, pae=True, version=DATABASE_VERSION):
+        '''
+        This function will return the cached PDB (and PAE) files of many
+        AlphaFold models, downloading the missing ones concurrently
+
+        **Parameters**
+
+        alphafold_ids: *list*
+            AlphaFold IDs (e.g. AF-P22626-F1)
+
+        pae: *bool*
+            Also fetch the predicted aligned error JSON files
+
+        version: *str*
+            The AlphaFold DB model version
+
+        **Returns**
+
+            Dictionary of every AlphaFold ID to its list of cached file paths
+            (None for a file that failed), and dictionary of every failed file
+            name to its error message
+        '''
+        names = {alphafold_id: model_files(alphafold_id, version, pae)
+                 for alphafold_id in alphafold_ids}
+        paths, errors = self.fetch([name for files in names.values() for name in files])
+        return {alphafold_id: [paths.get(name) for name in files]
+                for alphafold_id, files in names.items()}, errors
+
+    def export(self, name, destination):
+        '''
+        This function will link a cached file out of the store, e.g. to load
+        it in PyMOL under its own name, copying it where links are not possible
+
+        **Parameters**
+
+        name: *str*
+            The file name
+
+        destination: *str*
+            The file to write
+
+        **Returns**
+
+            String of the destination
+        '''
+        path = self.path(name)
+        if path is None:
+            raise FileNotFoundError("{} is not in {}".format(name, self.cache_dir))
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(path, destination)
+        except OSError:
+            shutil.copyfile(path, destination)
+        return destination
+
+    def close(self):
+        '''
+        This function will close the pooled connections
+        '''
+        self._pool.close()
@@ -0,0 +1,341 @@
+import numpy as np
+
+############################################################
+###################  Cell List Neighbor Search  ############
+############################################################
+
+# The 27 cell offsets around and including a grid cell
+_CELL_OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1)
+                          for dy in (-1, 0, 1) for dz in (-1, 0, 1)], dtype=np.int64)
+
+# The cell itself and the 13 offsets of one half of its neighbors, which
+# visit every pair of neighboring cells exactly once
+_HALF_CELL_OFFSETS = _CELL_OFFSETS[13:]
+
+# Grids up to this many cells always get a dense cell start table
+_DENSE_CELL_LIMIT = 1 << 22
+
+def _expand_ranges(starts, ends):
+    '''
+    This function will expand a set of [start, end) ranges into one flat array of positions
+
+    **Parameters**
+
+    starts: *numpy.ndarray*
+        The first position of every range
+
+    ends: *numpy.ndarray*
+        One past the last position of every range
+
+    **Returns**
+
+        Array of the range owner for every position, and array of the positions
+    '''
+    counts = ends - starts
+    owner = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, starts[owner] + offsets
+
+class CellList:
+    '''
+    This class bins atom coordinates into a grid of cubic cells with an
+    edge of at least the cutoff, so that every atom pair within the cutoff
+    is found by looking only at the 27 cells around an atom. The grid is
+    built once and every query is answered in one vectorized pass, which
+    scales near-linearly with the number of atoms
+
+    **Attributes**
+
+    coords: *numpy.ndarray*
+        A float array of shape (atoms, 3) of the indexed coordinates
+
+    cutoff: *float*
+        The largest distance in angstroms the grid can answer
+
+    candidates: *int*
+        The number of atom pairs whose distance the queries have computed
+    '''
+    def __init__(self, coords, cutoff):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.cutoff = float(cutoff)
+        # The cells are cutoff wide, so a zero, negative or NaN cutoff has no grid
+        if not self.cutoff > 0 or not np.isfinite(self.cutoff):
+            raise ValueError("The cell list cutoff must be a positive distance, got {}"
+                             .format(cutoff))
+        self.candidates = 0
+        if len(self.coords):
+            self.origin = self.coords.min(axis=0)
+            extent = self.coords.max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(3)
+            extent = np.zeros(3)
+        self.shape = np.floor(extent / self.cutoff).astype(np.int64) + 1
+        keys = self._cell_keys(self._cells(self.coords))
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+        # A dense start table answers cell lookups directly, unless the grid is
+        # so sparse that binary search over the sorted keys is cheaper in memory
+        ncells = int(np.prod(self.shape))
+        if ncells <= max(4 * len(self.coords), _DENSE_CELL_LIMIT):
+            counts = np.bincount(keys, minlength=ncells)
+            self.cell_starts = np.concatenate(([0], np.cumsum(counts)))
+        else:
+            self.cell_starts = None
+
+    def _cells(self, coords):
+        '''
+        This function will return the integer grid cell of every coordinate
+
+        **Parameters**
+
+        coords: *numpy.ndarray*
+            A float array of shape (atoms, 3)
+
+        **Returns**
+
+            Integer array of shape (atoms, 3) of grid cells
+        '''
+        return np.floor((coords - self.origin) / self.cutoff).astype(np.int64)
+
+    def _cell_keys(self, cells):
+        '''
+        This function will flatten grid cells into one integer key per cell,
+        with -1 for cells that fall outside the grid
+
+        **Parameters**
+
+        cells: *numpy.ndarray*
+            Integer array of shape (atoms, 3) of grid cells
+
+        **Returns**
+
+            Integer array of cell keys
+        '''
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        keys = (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+        return np.where(inside, keys, -1)
+
+    def _search(self, coords, cutoff, offsets, same=False, progress=None):
+        '''
+        This function will find the (query, indexed) atom pairs closer than the
+        cutoff, looking only at the grid cells the given offsets point to
+
+        **Parameters**
+
+        coords: *numpy.ndarray*
+            A float array of shape (atoms, 3) of the query coordinates
+
+        cutoff: *float*
+            The distance in angstroms, no larger than the grid cutoff
+
+        offsets: *numpy.ndarray*
+            Integer array of shape (offsets, 3) of the cells to visit
+
+        same: *bool*
+            True when the query atoms are the indexed atoms, so that pairs
+            within one cell are kept only once
+
+        progress: *callable*
+            A function taking the fraction done and a message, called before
+            the cells of each offset are searched, or None. It may raise to
+            stop the search, e.g. when the analysis is cancelled
+
+        **Returns**
+
+            Array of query atom indices, array of indexed atom indices and array of distances
+        '''
+        cells = self._cells(coords)
+        query, indexed, distance = [], [], []
+        for done, offset in enumerate(offsets):
+            if progress is not None:
+                progress(done / len(offsets), "Searching neighbor cells")
+            keys = self._cell_keys(cells + offset)
+            if self.cell_starts is not None:
+                starts = self.cell_starts[keys]
+                ends = self.cell_starts[keys + 1]
+            else:
+                starts = np.searchsorted(self.sorted_keys, keys, side="left")
+                ends = np.searchsorted(self.sorted_keys, keys, side="right")
+            ends[keys < 0] = starts[keys < 0]
+            owner, positions = _expand_ranges(starts, ends)
+            other = self.order[positions]
+            self.candidates += len(other)
+            pair_distance = np.sqrt(((coords[owner] - self.coords[other]) ** 2).sum(axis=1))
+            keep = pair_distance < cutoff
+            if same and not offset.any():
+                keep &= owner < other
+            query.append(owner[keep])
+            indexed.append(other[keep])
+            distance.append(pair_distance[keep])
+        query, indexed, distance = (np.concatenate(query), np.concatenate(indexed),
+                                    np.concatenate(distance))
+        order = np.lexsort((indexed, query))
+        return query[order], indexed[order], distance[order]
+
+    def query(self, coords, cutoff=None, progress=None):
+        '''
+        This function will find every pair between query coordinates and the
+        indexed coordinates closer than the cutoff
+
+        **Parameters**
+
+        coords: *numpy.ndarray*
+            A float array of shape (atoms, 3) of the query coordinates
+
+        cutoff: *float*
+            The distance in angstroms, no larger than the grid cutoff
+
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see _search)
+
+        **Returns**
+
+            Array of query atom indices, array of indexed atom indices and array of distances
+        '''
+        cutoff = self.cutoff if cutoff is None else min(float(cutoff), self.cutoff)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        return self._search(coords, cutoff, _CELL_OFFSETS, progress=progress)
+
+    def query_pairs(self, cutoff=None, progress=None):
+        '''
+        This function will find every unordered pair of indexed atoms closer than the cutoff
+
+        **Parameters**
+
+        cutoff: *float*
+            The distance in angstroms, no larger than the grid cutoff
+
+        progress: *callable*
+            A function taking the fraction done and a message, or None (see _search)
+
+        **Returns**
+
+            Array of first atom indices, array of second atom indices
+            (always greater than the first) and array of distances
+        '''
+        cutoff = self.cutoff if cutoff is None else min(float(cutoff), self.cutoff)
+        first, second, distance = self._search(self.coords, cutoff, _HALF_CELL_OFFSETS,
+                                               same=True, progress=progress)
+        swap = first > second
+        first[swap], second[swap] = second[swap], first[swap]
+        order = np.lexsort((second, first))
+        return first[order], second[order], distance[order]
+
+def find_pairs(coords1, coords2=None, cutoff=3.2):
+    '''
+    This function will find atom pairs closer than a cutoff with a cell list
+
+    **Parameters**
+
+    coords1: *numpy.ndarray*
+        A float array of shape (atoms, 3)
+
+    coords2: *numpy.ndarray*
+        A second float array of shape (atoms, 3), or None to pair coords1 with itself
+
+    cutoff: *float*
+        The distance in angstroms
+
+    **Returns**
+
+        Array of indices into coords1, array of indices into coords2
+        (or coords1) and array of distances
+    '''
+    if coords2 is None:
+        return CellList(coords1, cutoff).query_pairs()
+    return CellList(coords2, cutoff).query(coords1)
+
+def spread_models(models, cutoff):
+    '''
+    This function will lay the models of an ensemble side by side along x,
+    further apart than the cutoff, so one cell list over all of them finds
+    the pairs of every model in one pass and never a pair across models.
+    Atom i of model m becomes row m * atoms + i of the result
+
+    **Parameters**
+
+    models: *numpy.ndarray*
+        A float array of shape (models, atoms, 3)
+
+    cutoff: *float*
+        The largest pair distance in angstroms that will be searched
+
+    **Returns**
+
+        Float array of shape (models * atoms, 3)
+    '''
+    models = np.asarray(models, dtype=np.float64)
+    if len(models) == 1 or models.shape[1] == 0:
+        return models.reshape(-1, 3)
+    width = np.ptp(models[..., 0]) + 2 * float(cutoff)
+    shift = np.zeros((len(models), 1, 3))
+    shift[:, 0, 0] = np.arange(len(models)) * width
+    return (models + shift).reshape(-1, 3)
+
+class VerletList:
+    '''
+    This class keeps the atom pairs closer than the cutoff plus a skin
+    distance, found once with a cell list, and for every new frame of
+    coordinates only computes the distances of those candidate pairs. The
+    candidates are searched again only after some atom has moved more than
+    half the skin since the last search, because until then no pair left
+    out of the list can have come within the cutoff
+
+    **Attributes**
+
+    cutoff: *float*
+        The pair distance in angstroms
+
+    skin: *float*
+        The extra distance in angstroms the candidate pairs are searched with
+
+    builds: *int*
+        The number of cell list searches, the first one included
+
+    candidates: *int*
+        The number of atom pairs whose distance has been computed
+    '''
+    def __init__(self, coords, cutoff, skin=2.0):
+        self.cutoff = float(cutoff)
+        self.skin = float(skin)
+        self.builds = 0
+        self.candidates = 0
+        self._build(np.asarray(coords, dtype=np.float64).reshape(-1, 3))
+
+    def _build(self, coords):
+        '''
+        This function will search the candidate pairs around the given coordinates
+        '''
+        cell_list = CellList(coords, self.cutoff + self.skin)
+        self.first, self.second, _ = cell_list.query_pairs()
+        self.reference = coords.copy()
+        self.builds += 1
+        self.candidates += cell_list.candidates
+
+    def update(self, coords):
+        '''
+        This function will find the atom pairs closer than the cutoff in a new
+        frame of the same atoms, searching the candidates again when needed
+
+        **Parameters**
+
+        coords: *numpy.ndarray*
+            A float array of shape (atoms, 3) of the new coordinates
+
+        **Returns**
+
+            Array of first atom indices, array of second atom indices
+            (always greater than the first) and array of distances, in the
+            order of CellList.query_pairs
+        '''
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        if len(coords) != len(self.reference):
+            raise ValueError("Expected {} atoms, got {}".format(len(self.reference), len(coords)))
+        if len(coords):
+            moved = ((coords - self.reference) ** 2).sum(axis=1).max()
+            if moved > (self.skin / 2) ** 2:
+                self._build(coords)
+        self.candidates += len(self.first)
+        distance = np.sqrt(((coords[self.first] - coords[self.second]) ** 2).sum(axis=1))
+        keep = distance < self.cutoff
+        return self.first[keep], self.second[keep], distance[keep]
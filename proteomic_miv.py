@@ -1,9 +1,31 @@
+import argparse
+import hashlib
 import os
+import re
+import shutil
+import sys
 import urllib
 import urllib.parse
 import urllib.request
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
-from pandas import *
+import pandas as pd
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .structure_miv import load_structure, object_name
+    from .emit_miv import PymolScript
+    from .batch_miv import expand_inputs
+    from .accession_miv import accession_index
+    from .modelstore_miv import ModelStore, model_files
+    from .calc_miv import report_progress
+except ImportError:
+    from structure_miv import load_structure, object_name
+    from emit_miv import PymolScript
+    from batch_miv import expand_inputs
+    from accession_miv import accession_index
+    from modelstore_miv import ModelStore, model_files
+    from calc_miv import report_progress
 
 def get_uniprot (query='',query_type='PDB_ID'):
     '''
@@ -36,105 +58,550 @@ def get_uniprot (query='',query_type='PDB_ID'):
         page=page.splitlines()
     return page
 
-def uniprot_to_alphafold(accession_id):
+def uniprot_to_alphafold(accession_id, accession_file="accession_ids.txt"):
     '''
-    This function will read into the AlphaFold 'accessions_ids.csv' using the readlines command
+    This function will look up the AlphaFold ID of a UniProt accession in an
+    SQLite index of the AlphaFold 'accession_ids.csv', built on first use
 
     **Parameters**
 
-    accession_id: *string*
-        A string of the UniProt accession ID
+    accession_id: *string or list*
+        A string of the UniProt accession ID, or a list of them to look up at once
+
+    accession_file: *string*
+        The AlphaFold accession table
+
     **Returns**
 
-        AlphaFold ID corresponding to the the input UniProt accession ID
+        AlphaFold ID corresponding to the the input UniProt accession ID, or None,
+        or for a list a dictionary of every found accession to its AlphaFold ID
         '''
-    accession_contents = open('accession_ids.txt', 'r').readlines()
-    accession_dict = {}
-    for i in accession_contents:
-        accession_dict[i.split(',')[0]] = i.split(',')[3]
+    index = accession_index(accession_file)
+    if isinstance(accession_id, str):
+        return index.get(accession_id)
+    return {accession: alphafold_ids[0]
+            for accession, alphafold_ids in index.lookup(accession_id).items()}
+
+def download_af_pdb(alphafold_id, output_dir=".", cache_dir="alphafold_models"):
+    '''
+    This function will fetch AlphaFold PDB and PAE files through the local
+    model store, downloading only the models not cached yet, several at a time,
+    and copy them out as <alphafold_id>.pdb and <alphafold_id>.json
+
+    **Parameters**
 
-    accession_id = 'P14618'
-    alphafold_id = None
+    alphafold_id: *string or list*
+        The string of the AlphaFold ID (e.g. AF-P22626-F1), or a list of them
 
-    if accession_id in accession_dict:
-        alphafold_id = accession_dict[accession_id]
+    output_dir: *string*
+        The folder to copy the files to
 
+    cache_dir: *string*
+        The model store cache folder
 
+    **Returns**
+
+        Download of AlphaFold PDB file
+        Dictionary of every AlphaFold ID that failed to its error messages
+    '''
+    alphafold_ids = [alphafold_id] if isinstance(alphafold_id, str) else list(alphafold_id)
+    store = ModelStore(cache_dir)
+    try:
+        models, errors = store.fetch_models(alphafold_ids)
+    finally:
+        store.close()
+    failed = {}
+    for name, paths in models.items():
+        for path, extension in zip(paths, (".pdb", ".json")):
+            if path is not None:
+                shutil.copyfile(path, os.path.join(output_dir, name + extension))
+        messages = [errors[filename] for filename in model_files(name) if filename in errors]
+        if messages:
+            failed[name] = messages
+            print("Could not download {}: {}".format(name, "; ".join(messages)))
+    return failed
+
+# PSM columns read from a psm csv file, and their types; Protein.ID and
+# Peptide repeat over many PSMs so they are read as categories
+PSM_COLUMNS = {
+    "Protein.ID": "category",
+    "Protein.Start": "Int32",
+    "Protein.End": "Int32",
+    "Peptide": "category",
+}
+
+# Rows of a psm csv file parsed at a time
+_PSM_CHUNK_ROWS = 500000
+
+def _file_digest(filename):
+    '''
+    This function will return the SHA-256 of a file, read a block at a time
+    '''
+    digest = hashlib.sha256()
+    with open(filename, "rb") as rawfile:
+        for block in iter(lambda: rawfile.read(1 << 22), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-def download_af_pdb(alphafold_id):
+def read_psms(site_file, cache_dir=None, chunk_rows=_PSM_CHUNK_ROWS):
     '''
-    This function will read into the AlphaFold 'accessions_ids.csv' using the readlines command
+    This function will read the Protein.ID, Protein.Start, Protein.End and
+    Peptide columns of a psm csv file in chunks of rows with explicit types,
+    dropping PSMs without a protein site. The result is cached as a Parquet
+    file named after the hash of the csv file, so reading the same file again
+    takes a fraction of the time and memory. The cache needs the pyarrow
+    package and is skipped without it
 
     **Parameters**
 
-    alphafold_id: *list*
-        The string of the AlphaFold ID
+    site_file: *string*
+        The string of the filename for the csv file containing the proteomic site PSMs
+
+    cache_dir: *string*
+        The folder of the Parquet cache, or None for .psm_cache next to the csv file
+
+    chunk_rows: *int*
+        The number of rows parsed at a time
 
     **Returns**
 
-        Download of AlphaFold PDB file
+        pandas DataFrame of the PSM columns, with Protein.ID as a category
+        sorted by name
+    '''
+    try:
+        # pylint: disable=import-outside-toplevel,unused-import
+        import pyarrow
+    except ImportError:
+        pyarrow = None
+    cache_file = None
+    if pyarrow is not None:
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(site_file)), ".psm_cache")
+        cache_file = os.path.join(cache_dir, "{}.{}.parquet".format(
+            os.path.basename(site_file), _file_digest(site_file)[:32]))
+        if os.path.exists(cache_file):
+            return pd.read_parquet(cache_file)
+
+    header = pd.read_csv(site_file, nrows=0).columns
+    dtypes = {column: dtype for column, dtype in PSM_COLUMNS.items() if column in header}
+    chunks = [chunk.dropna(subset=["Protein.ID", "Protein.Start", "Protein.End"])
+              for chunk in pd.read_csv(site_file, usecols=list(dtypes), dtype=dtypes,
+                                       chunksize=chunk_rows)]
+    if chunks:
+        # Chunks read different categories, so they are joined into one sorted set
+        data = pd.DataFrame({
+            column: (pd.api.types.union_categoricals([chunk[column] for chunk in chunks],
+                                                     sort_categories=True)
+                     if dtype == "category" else
+                     pd.concat([chunk[column] for chunk in chunks], ignore_index=True))
+            for column, dtype in dtypes.items()})
+    else:
+        data = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        building = "{}.{}.tmp".format(cache_file, os.getpid())
+        data.to_parquet(building, index=False)
+        os.replace(building, cache_file)
+    return data
+
+def merge_intervals(protein_ids, starts, ends):
+    '''
+    This function will merge the overlapping site intervals of every protein,
+    sorting all PSMs once by protein and start instead of looping per protein
+
+    **Parameters**
+
+    protein_ids: *numpy.ndarray*
+        The Protein.ID, or an integer code of it, of every PSM
+
+    starts: *numpy.ndarray*
+        The Protein.Start residue number of every PSM
+
+    ends: *numpy.ndarray*
+        The Protein.End residue number of every PSM
+
+    **Returns**
+
+        Arrays of the protein, start, end and number of PSMs of every merged
+        interval, ordered by protein and start
+    '''
+    protein_ids = np.asarray(protein_ids)
+    if protein_ids.dtype == object:
+        protein_ids = protein_ids.astype(str)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        return protein_ids, starts, ends, np.zeros(0, dtype=np.int64)
+    order = np.lexsort((starts, protein_ids))
+    protein_ids, starts, ends = protein_ids[order], starts[order], ends[order]
+    new_protein = np.ones(len(starts), dtype=bool)
+    new_protein[1:] = protein_ids[1:] != protein_ids[:-1]
+    # The running maximum end within each protein, lifted by a per-protein
+    # offset so one accumulate never carries an end over to the next protein
+    span = int(ends.max() - ends.min()) + 1
+    offset = (np.cumsum(new_protein) - 1) * span
+    reach = np.maximum.accumulate(ends - ends.min() + offset) - offset + ends.min()
+    first = new_protein.copy()
+    first[1:] |= starts[1:] > reach[:-1]
+    first = np.flatnonzero(first)
+    last = np.append(first[1:], len(starts)) - 1
+    return protein_ids[first], starts[first], reach[last], np.diff(np.append(first, len(starts)))
+
+# AlphaFold model names, AF-<accession>-F<fragment> with an optional model version
+_ALPHAFOLD_NAME = re.compile(r"^AF-([A-Za-z0-9]+)-F\d+")
+
+def residue_coverage(starts, ends):
+    '''
+    This function will count the PSMs covering every residue of a protein with
+    one sweep over the interval starts and ends instead of a loop per PSM
+
+    **Parameters**
+
+    starts: *numpy.ndarray*
+        The Protein.Start residue number of every PSM of the protein
+
+    ends: *numpy.ndarray*
+        The Protein.End residue number of every PSM of the protein
+
+    **Returns**
+
+        Array of the covered residue numbers and array of the number of PSMs covering each
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        return starts, starts
+    low = starts.min()
+    size = int(ends.max() - low) + 2
+    # +1 where a PSM starts and -1 after where it ends, summed up along the sequence
+    change = (np.bincount(starts - low, minlength=size)
+              - np.bincount(ends - low + 1, minlength=size))
+    depth = np.cumsum(change)[:-1]
+    covered = np.flatnonzero(depth > 0)
+    return covered + low, depth[covered]
+
+def structure_accession(filename):
+    '''
+    This function will return the UniProt accession a structure file models,
+    from an AlphaFold file name (e.g. AF-P22626-F1-model_v4.pdb) or a file
+    named after the accession itself (e.g. P22626.pdb)
+
+    **Parameters**
+
+    filename: *str*
+        A string with the structure file name
+
+    **Returns**
+
+        String of the UniProt accession
+    '''
+    name = object_name(filename)
+    alphafold = _ALPHAFOLD_NAME.match(name)
+    return alphafold.group(1) if alphafold else name
+
+# Columns of the mapped site table
+SITE_COLUMNS = ["protein", "start", "end", "psms", "residues", "structure", "status"]
+
+def map_protein(protein_id, intervals, coverage, filename, output_dir=".", script=None):
+    '''
+    This function will map the PSM sites of one protein on its structure and
+    record the PyMOL commands that store the PSM coverage of every residue as
+    its B-factor in one alter call and color the protein by it
+
+    **Parameters**
+
+    protein_id: *str*
+        The Protein.ID of the PSMs
+
+    intervals: *numpy.ndarray*
+        Integer array of shape (intervals, 3) of the start, end and number of PSMs of each site
+
+    coverage: *tuple*
+        Array of the covered residue numbers and array of the PSMs covering each,
+        from residue_coverage
+
+    filename: *str or Structure*
+        The structure file of the protein, or an already parsed Structure
+
+    output_dir: *str*
+        The folder to write <structure>_mapped_site.pml to, or None to skip writing it
+
+    script: *PymolScript*
+        A script to add the PyMOL commands to, e.g. to apply them through
+        the pymol cmd API, or None to start a new one
+
+    **Returns**
+
+        List of site table rows, one per interval
+    '''
+    try:
+        structure = load_structure(filename)
+    # pylint: disable=broad-except
+    except Exception as error:
+        return [[protein_id, start, end, psms, 0, filename, "error: {}".format(error)]
+                for start, end, psms in intervals]
+    filename = structure.filename
+    residues = np.unique(structure.resv[structure.select(name="CA", record="ATOM")])
+    script = PymolScript() if script is None else script
+    script.load(structure.filename, structure.object_name)
+    script.remove("resn hoh")
+    covered, depth = coverage
+    script.alter(structure.object_name, "b = coverage.get(int(resv), 0.0)",
+                 {"coverage": dict(zip(covered.tolist(), depth.astype(float).tolist()))})
+    script.spectrum("b", "white_red", structure.object_name, 0,
+                    int(depth.max()) if len(depth) else 1)
+    rows = []
+    for start, end, psms in intervals:
+        found = np.count_nonzero((residues >= start) & (residues <= end))
+        rows.append([protein_id, start, end, psms, found, filename,
+                     "ok" if found else "no residues"])
+    if output_dir is not None:
+        script.write(os.path.join(output_dir, structure.object_name + "_mapped_site.pml"))
+    return rows
+
+def _map_protein_job(job):
     '''
-    #print("Please enter an AlphaFold ID")
-    #alphafold_id = input()
-    database_version = 'v4'
-    model_url = f'https://alphafold.ebi.ac.uk/files/{alphafold_id}-model_{database_version}.pdb'
-    error_url = f'https://alphafold.ebi.ac.uk/files/{alphafold_id}-predicted_aligned_error_{database_version}.json'
+    This function will unpack a pool job and run it with map_protein
 
-    os.system(f'curl {model_url} -o {alphafold_id}.pdb')
-    os.system(f'curl {error_url} -o {alphafold_id}.json')
+    **Parameters**
+
+    job: *tuple*
+        The (protein_id, intervals, coverage, filename, output_dir) arguments of map_protein
+
+    **Returns**
+
+        List of site table rows, one per interval
+    '''
+    return map_protein(*job)
 
-def map_site(site_file, filename=str):
+def _fetch_models(protein_ids, store, accession_file, output_dir):
     '''
-    This function will read into an csv file and convert the columns of protein. 
-    Protein ID, residue start and end site number are extracted from site_file
-    This function will map proteomic PSM sites in a PDB file and display in PyMOL 
+    This function will fetch the AlphaFold models of many proteins through a
+    model store and link them into the output folder under their own names
+
+    **Parameters**
+
+    protein_ids: *list*
+        The Protein.IDs without a structure
+
+    store: *ModelStore*
+        The model store to fetch from
+
+    accession_file: *string*
+        The AlphaFold accession table, or a file name that does not exist
+
+    output_dir: *str*
+        The folder to link the models into
 
+    **Returns**
+
+        Dictionary of every protein fetched to its PDB file
+    '''
+    if os.path.exists(accession_file):
+        alphafold_ids = uniprot_to_alphafold(protein_ids, accession_file)
+    else:
+        alphafold_ids = {protein_id: "AF-{}-F1".format(protein_id) for protein_id in protein_ids}
+    models, errors = store.fetch_models(list(alphafold_ids.values()), pae=False)
+    print("Fetched {} of {} AlphaFold models".format(
+        sum(paths[0] is not None for paths in models.values()), len(models)))
+    fetched = {}
+    for protein_id, alphafold_id in alphafold_ids.items():
+        name = model_files(alphafold_id, pae=False)[0]
+        if models[alphafold_id][0] is not None:
+            fetched[protein_id] = store.export(name, os.path.join(output_dir, name))
+        elif name in errors:
+            print("Could not fetch {}: {}".format(name, errors[name]))
+    return fetched
+
+def map_site(site_file, structures, output_dir=".", jobs=None, site_table="mapped_sites.tsv",
+             store=None, accession_file="accession_ids.txt"):
+    '''
+    This function will read the PSMs of a FragPipe psm csv file, merge the
+    overlapping Protein.Start to Protein.End sites of each Protein.ID and map
+    the PSM coverage of every residue on the structure of every protein found
+    among the given structures, one protein per worker process. With a model store, the AlphaFold models of
+    the proteins without a structure are fetched first, all at once
 
     **Parameters**
 
     site_file: *string*
         The string of the filename for the csv file containing the proteomic site PSMs
 
-    filename: *string*
-        The string of the filename for pdb file to load into PyMOL
+    structures: *str or list*
+        Structure files, directories or glob patterns, matched to proteins by
+        accession (e.g. AF-P22626-F1.pdb models P22626)
+
+    output_dir: *str*
+        The folder for the PyMOL script of each protein and the site table
+
+    jobs: *int*
+        Number of worker processes, or None for one per CPU
+
+    site_table: *str*
+        The file name of the tab separated site table inside output_dir
+
+    store: *ModelStore*
+        The model store to fetch missing AlphaFold models from, or None to
+        map only the given structures
+
+    accession_file: *string*
+        The AlphaFold accession table naming the model of each accession; when
+        it does not exist the model AF-<accession>-F1 is fetched
 
     **Returns**
 
-        Text of residues with site of PSM
-        PyMOL Viewer Structure with site PSM highlighted
+        Text of the merged sites of each protein with a structure
+        List of site table rows, one per merged interval
+        PyMOL script <structure>_mapped_site.pml of each protein colored by PSM coverage
     '''
-    # reading CSV file
-    site_file = "231017_PAR15map_nuclear_PSMs.csv"
-    data = read_csv(site_file)
+    data = read_psms(site_file)
+    # Sorting the integer codes of the sorted categories sorts the proteins by name
+    codes = data["Protein.ID"].cat.codes.to_numpy()
+    categories = np.asarray(data["Protein.ID"].cat.categories, dtype=str)
+    psm_starts = data["Protein.Start"].to_numpy(np.int64)
+    psm_ends = data["Protein.End"].to_numpy(np.int64)
+    protein_codes, starts, ends, psms = merge_intervals(codes, psm_starts, psm_ends)
+    protein_ids = categories[protein_codes]
+    proteins, first = np.unique(protein_ids, return_index=True)
+    bounds = np.append(first[1:], len(protein_ids))
+    # The PSMs of every protein, grouped by one sort of the codes
+    by_protein = np.argsort(codes, kind="stable")
+    psm_bounds = np.searchsorted(codes[by_protein], np.arange(len(categories) + 1))
+    print("{} PSMs of {} proteins merged into {} sites".format(
+        len(data), len(proteins), len(protein_ids)))
+
+    if isinstance(structures, str):
+        structures = [structures]
+    available = {}
+    for filename in expand_inputs(structures):
+        available.setdefault(structure_accession(filename), filename)
+
+    os.makedirs(output_dir, exist_ok=True)
+    if store is not None:
+        available.update(_fetch_models(
+            [protein_id for protein_id in proteins if protein_id not in available],
+            store, accession_file, output_dir))
+    work, rows = [], []
+    for protein_id, begin, stop in zip(proteins, first, bounds):
+        intervals = np.column_stack((starts[begin:stop], ends[begin:stop], psms[begin:stop]))
+        if protein_id in available:
+            code = protein_codes[begin]
+            psm_rows = by_protein[psm_bounds[code]:psm_bounds[code + 1]]
+            coverage = residue_coverage(psm_starts[psm_rows], psm_ends[psm_rows])
+            work.append((protein_id, intervals, coverage, available[protein_id], output_dir))
+        else:
+            rows.extend([protein_id, start, end, count, 0, "", "no structure"]
+                        for start, end, count in intervals)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(work) < 2:
+        for job in work:
+            rows.extend(_map_protein_job(job))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as pool:
+            for protein_rows in pool.map(_map_protein_job, work):
+                rows.extend(protein_rows)
+
+    for protein_id, start, end, count, found, filename, status in rows:
+        if filename:
+            print("Protein ID: {}  Sites: {}-{}  PSMs: {}  Residues: {}".format(
+                protein_id, start, end, count, found))
+    with open(os.path.join(output_dir, site_table), "w", encoding="utf8") as tablefile:
+        tablefile.write("\t".join(SITE_COLUMNS) + "\n")
+        for row in rows:
+            tablefile.write("\t".join(str(value) for value in row) + "\n")
+    print("Mapped {} of {} proteins; site table in {}".format(
+        len(work), len(proteins), os.path.join(output_dir, site_table)))
+    return rows
+
+def map_structure(filename, site_file, progress=None, script=None, output_dir=None):
+    '''
+    This function will map the PSM sites of the protein a structure models,
+    found by the accession of its file name, e.g. to color a structure loaded
+    in PyMOL by its PSM coverage
+
+    **Parameters**
 
-    # converting column data to list
-    site_start = data['Protein.Start'].tolist()
-    site_end = data['Protein.End'].tolist()
-    protein_id = data['Protein.ID'].tolist()
+    filename: *str or Structure*
+        A structure file name (e.g. AF-P22626-F1.pdb), or an already parsed Structure
 
-    # create a matrix of the lists
-    matrix = [protein_id, site_start, site_end]
+    site_file: *string*
+        The string of the filename for the csv file containing the proteomic site PSMs
+
+    progress: *callable*
+        A function taking the fraction done and a message, or None (see report_progress)
+
+    script: *PymolScript*
+        A script to add the PyMOL commands to, or None to start a new one
+
+    output_dir: *str*
+        The folder to write <structure>_mapped_site.pml to, or None to skip writing it
+
+    **Returns**
 
-    # access the 0 position of each of the three lists
-    print("Protein ID:", matrix[0][0])
-    print("Site Start:",matrix[1][0])
-    print("Site End:",matrix[2][0])
+        List of site table rows, one per merged interval of the protein
+        Text of the merged sites of the protein
+    '''
+    report_progress(progress, 0.0, "Reading structure")
+    structure = load_structure(filename)
+    protein_id = structure_accession(structure.filename or structure.object_name)
+    report_progress(progress, 0.3, "Reading PSMs")
+    data = read_psms(site_file)
+    report_progress(progress, 0.7, "Mapping sites")
+    found = (data["Protein.ID"] == protein_id).to_numpy()
+    psm_starts = data["Protein.Start"].to_numpy(np.int64)[found]
+    psm_ends = data["Protein.End"].to_numpy(np.int64)[found]
+    _, starts, ends, psms = merge_intervals(np.zeros(len(psm_starts), dtype=np.int64),
+                                            psm_starts, psm_ends)
+    rows = map_protein(protein_id, np.column_stack((starts, ends, psms)),
+                       residue_coverage(psm_starts, psm_ends), structure, output_dir, script)
+    if not rows:
+        print("No PSMs of {} in {}".format(protein_id, site_file))
+    for _, start, end, count, residues, _, _ in rows:
+        print("Protein ID: {}  Sites: {}-{}  PSMs: {}  Residues: {}".format(
+            protein_id, start, end, count, residues))
+    report_progress(progress, 1.0, "Done")
+    return rows
+
+def main(argv=None):
+    '''
+    This function will map the PSM sites of a psm csv file from the command line
 
-    # Initialize reading into PDB file and converting into a list of lines as strings
+    **Parameters**
 
-    # To write a pml file
-    bondfile=open("mapped_site.pml", "w",  encoding="utf8")
-    # pylint: disable=consider-using-f-string
-    bondfile.write("load {:}\n".format((filename)))
-    bondfile.write("remove resn hoh\n")
-    #bondfile.write("color green")
+    argv: *list*
+        Command line arguments, or None to use sys.argv
 
-    #pdbfile=input("Enter a PDB file\n")
-    rawfile=open(filename,"r",  encoding="utf8")
-    pdblist=rawfile.readlines()
-    rawfile.close()
+    **Returns**
 
-    bondfile.write("color pink, resi {}-{}\n".format((matrix[1][0]), (matrix[2][0])))
+        Exit status
+    '''
+    parser = argparse.ArgumentParser(
+        description="Map the PSM sites of a FragPipe psm csv file on protein structures")
+    parser.add_argument("site_file", help="csv file of PSMs with Protein.ID, "
+                                          "Protein.Start and Protein.End columns")
+    parser.add_argument("structures", nargs="*",
+                        help="structure files, directories or glob patterns "
+                             "(e.g. 'AF-*.pdb'), matched to proteins by accession")
+    parser.add_argument("-o", "--output", default=".",
+                        help="output folder (default: current folder)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--fetch", action="store_true",
+                        help="download the AlphaFold models of proteins without a structure")
+    parser.add_argument("--cache", default="alphafold_models",
+                        help="model store cache folder (default: alphafold_models)")
+    parser.add_argument("--accessions", default="accession_ids.txt",
+                        help="AlphaFold accession table (default: accession_ids.txt)")
+    args = parser.parse_args(argv)
+    store = ModelStore(args.cache) if args.fetch else None
+    try:
+        map_site(args.site_file, args.structures, args.output, args.jobs,
+                 store=store, accession_file=args.accessions)
+    finally:
+        if store is not None:
+            store.close()
+    return 0
 
 
 ### TESTING ####
@@ -153,4 +620,5 @@ def map_site(site_file, filename=str):
 
 #download_af_pdb('AF-P22626-F1')
 
-map_site("231017_PAR15map_nuclear_PSMs.csv" , "AF-P22626-F1.pdb")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+import csv
+import json
+import math
+import os
+from collections import OrderedDict
+import numpy as np
+
+############################################################
+###################  Analysis Results  #####################
+############################################################
+
+# One row per interaction, residue or measured value of an analysis. Atom
+# columns ending in 1 and 2 name both ends of an interaction, only the 1
+# columns are used for a residue, and index1 and index2 are the atom indices
+# in the Structure (-1 for none). value holds the distance in angstroms of an
+# interaction or the measured value (e.g. the mass in Daltons), angle an
+# H-bond angle in degrees, occupancy the fraction of models having an
+# interaction and code a one letter residue code
+RECORD_DTYPE = np.dtype([
+    ("kind", "U12"), ("model", np.int32),
+    ("index1", np.int32), ("chain1", "U4"), ("resn1", "U5"), ("resi1", "U8"), ("atom1", "U4"),
+    ("index2", np.int32), ("chain2", "U4"), ("resn2", "U5"), ("resi2", "U8"), ("atom2", "U4"),
+    ("value", np.float64), ("angle", np.float32), ("occupancy", np.float32), ("code", "U1"),
+])
+
+# Columns written before the record columns of every exported row
+EXPORT_COLUMNS = ("structure", "analysis") + RECORD_DTYPE.names
+
+# Records buffered before a Parquet row group is written
+_PARQUET_ROWS = 1 << 16
+
+class AnalysisResult:
+    '''
+    This class holds what one analysis found in one structure as a NumPy
+    record array, so results can be filtered, counted and exported in bulk
+    instead of read back from the printed text
+
+    **Attributes**
+
+    analysis: *str*
+        The analysis name (e.g. disulfide)
+
+    structure: *str*
+        The object name of the structure
+
+    records: *numpy.recarray*
+        One RECORD_DTYPE row per interaction, residue or measured value
+
+    values: *OrderedDict*
+        The summary values of the analysis (e.g. the number of bonds)
+    '''
+    __slots__ = ("analysis", "structure", "records", "values")
+
+    def __init__(self, analysis, structure, records, values=None):
+        self.analysis = analysis
+        self.structure = structure
+        self.records = np.rec.array(np.asarray(records, dtype=RECORD_DTYPE).reshape(-1))
+        self.values = OrderedDict() if values is None else OrderedDict(values)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return "<AnalysisResult {} of {}: {} records>".format(
+            self.analysis, self.structure, len(self))
+
+    def of_kind(self, kind):
+        '''
+        This function will return the records of one kind
+
+        **Parameters**
+
+        kind: *str*
+            The record kind (e.g. WC, salt_bridge)
+
+        **Returns**
+
+            numpy.recarray of the records of the kind
+        '''
+        return self.records[self.records.kind == kind]
+
+    def pairs(self, kind=None):
+        '''
+        This function will return the atom indices of the interactions
+
+        **Parameters**
+
+        kind: *str*
+            The record kind, or None for every record
+
+        **Returns**
+
+            Integer array of shape (records, 2) of the atom indices of both ends
+        '''
+        records = self.records if kind is None else self.of_kind(kind)
+        return np.column_stack((records.index1, records.index2)).astype(np.int64)
+
+def _empty_records(count):
+    '''
+    This function will make a record array with empty text, -1 indices and NaN numbers
+    '''
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    for field in ("index1", "index2"):
+        records[field] = -1
+    for field in ("value", "angle", "occupancy"):
+        records[field] = np.nan
+    return records
+
+def _fill_atoms(records, structure, atoms, side):
+    '''
+    This function will fill the index, chain, residue and atom columns of one side of records
+    '''
+    atoms = np.asarray(atoms, dtype=np.int64)
+    records["index" + side] = atoms
+    for field, column in (("chain", structure.chain), ("resn", structure.resn),
+                          ("resi", structure.resi), ("atom", structure.name)):
+        records[field + side] = column[atoms]
+
+def interaction_records(structure, kind, atoms, values=None, angles=None, occupancy=None,
+                        models=None):
+    '''
+    This function will build one record per atom pair of an interaction
+
+    **Parameters**
+
+    structure: *Structure*
+        The structure the atom indices refer to
+
+    kind: *str or numpy.ndarray*
+        The kind of every interaction (e.g. disulfide), or one kind for all
+
+    atoms: *numpy.ndarray*
+        Integer array of shape (interactions, 2) of atom indices
+
+    values: *numpy.ndarray*
+        The distance of every interaction, or None to measure it in the first model
+
+    angles, occupancy, models: *numpy.ndarray*
+        The angle, the fraction of models and the model of every interaction, or None
+
+    **Returns**
+
+        numpy record array of RECORD_DTYPE
+    '''
+    atoms = np.asarray(atoms, dtype=np.int64).reshape(-1, 2)
+    records = _empty_records(len(atoms))
+    records["kind"] = kind
+    records["model"] = 0 if models is None else models
+    _fill_atoms(records, structure, atoms[:, 0], "1")
+    _fill_atoms(records, structure, atoms[:, 1], "2")
+    if values is None:
+        coords = structure.coords.astype(np.float64)
+        values = np.sqrt(((coords[atoms[:, 0]] - coords[atoms[:, 1]]) ** 2).sum(axis=1))
+    records["value"] = values
+    if angles is not None:
+        records["angle"] = angles
+    records["occupancy"] = 1.0 if occupancy is None else occupancy
+    return records
+
+def residue_records(structure, kind, atoms, codes):
+    '''
+    This function will build one record per residue, given by one of its atoms
+
+    **Parameters**
+
+    structure: *Structure*
+        The structure the atom indices refer to
+
+    kind: *str*
+        The kind of the records (e.g. dssp, sequence)
+
+    atoms: *numpy.ndarray*
+        An atom index of every residue, e.g. its C-alpha
+
+    codes: *list*
+        The one letter code of every residue
+
+    **Returns**
+
+        numpy record array of RECORD_DTYPE
+    '''
+    records = _empty_records(len(atoms))
+    records["kind"] = kind
+    _fill_atoms(records, structure, atoms, "1")
+    records["code"] = np.asarray(codes, dtype="U1") if len(atoms) else []
+    return records
+
+def value_records(kind, values, models=None):
+    '''
+    This function will build one record per measured value without atoms,
+    e.g. a molecular weight
+
+    **Parameters**
+
+    kind: *str*
+        The kind of the records (e.g. mass)
+
+    values: *list*
+        The measured values
+
+    models: *list*
+        The model of every value, or None for the first model
+
+    **Returns**
+
+        numpy record array of RECORD_DTYPE
+    '''
+    records = _empty_records(len(values))
+    records["kind"] = kind
+    records["model"] = 0 if models is None else models
+    records["value"] = values
+    return records
+
+############################################################
+###################  Result Export  ########################
+############################################################
+
+# Export formats by file extension
+EXPORT_FORMATS = {".jsonl": "jsonl", ".json": "jsonl", ".csv": "csv", ".parquet": "parquet"}
+
+def _export_rows(result):
+    '''
+    This function will turn the records of a result into rows of plain
+    Python values, with None for missing numbers
+    '''
+    prefix = (result.structure, result.analysis)
+    for record in result.records.tolist():
+        yield prefix + tuple(None if isinstance(value, float) and math.isnan(value) else value
+                             for value in record)
+
+class ResultWriter:
+    '''
+    This class streams the records of many analysis results into one JSON
+    Lines, CSV or Parquet file, chosen by the file extension, so the results
+    of a whole batch are aggregated without holding them all in memory. Each
+    row carries the structure and analysis names before the RECORD_DTYPE columns
+
+    **Attributes**
+
+    filename: *str*
+        The file written
+
+    fmt: *str*
+        The export format (jsonl, csv or parquet)
+
+    rows: *int*
+        The number of rows written so far
+    '''
+    def __init__(self, filename, fmt=None):
+        self.filename = filename
+        if fmt is None:
+            fmt = EXPORT_FORMATS.get(os.path.splitext(filename)[1].lower())
+        if fmt not in EXPORT_FORMATS.values():
+            raise ValueError("Cannot export results as {}, use .jsonl, .csv or .parquet"
+                             .format(filename))
+        self.fmt = fmt
+        self.rows = 0
+        self._buffer = []
+        self._buffered = 0
+        self._writer = None
+        if fmt == "parquet":
+            try:
+                # pylint: disable=import-outside-toplevel
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError as error:
+                message = "Writing Parquet files needs pyarrow (pip install pyarrow)"
+                raise ImportError(message) from error
+            self._pyarrow = pyarrow
+            self._file = None
+        else:
+            self._file = open(filename, "w", encoding="utf8", newline="")
+            if fmt == "csv":
+                self._csv = csv.writer(self._file)
+                self._csv.writerow(EXPORT_COLUMNS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result):
+        '''
+        This function will write the records of one analysis result
+
+        **Parameters**
+
+        result: *AnalysisResult*
+            The result to write
+
+        **Returns**
+
+            None
+        '''
+        if self.fmt == "jsonl":
+            for row in _export_rows(result):
+                self._file.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n")
+        elif self.fmt == "csv":
+            self._csv.writerows(_export_rows(result))
+        else:
+            self._buffer.append(result)
+            self._buffered += len(result)
+            if self._buffered >= _PARQUET_ROWS:
+                self._flush()
+        self.rows += len(result)
+
+    def _flush(self):
+        '''
+        This function will write the buffered results as one Parquet row group
+        '''
+        pyarrow = self._pyarrow
+        results = [result for result in self._buffer if len(result)]
+        self._buffer, self._buffered = [], 0
+        if not results and self._writer is not None:
+            return
+        records = (np.concatenate([result.records for result in results]) if results
+                   else np.zeros(0, dtype=RECORD_DTYPE))
+        counts = [len(result) for result in results]
+        columns = OrderedDict((
+            ("structure", np.repeat(np.array([result.structure for result in results],
+                                             dtype=str), counts)),
+            ("analysis", np.repeat(np.array([result.analysis for result in results],
+                                            dtype=str), counts)),
+        ))
+        for field in RECORD_DTYPE.names:
+            columns[field] = records[field]
+        table = pyarrow.table(OrderedDict(
+            (name, pyarrow.array(column.tolist() if column.dtype.kind == "U" else column,
+                                 type=pyarrow.string() if column.dtype.kind == "U" else None,
+                                 from_pandas=True))
+            for name, column in columns.items()))
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.filename, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        '''
+        This function will write any buffered rows and close the file
+        '''
+        if self.fmt == "parquet":
+            if self._buffer or self._writer is None:
+                self._flush()
+            self._writer.close()
+        else:
+            self._file.close()
+
+def export_results(results, filename, fmt=None):
+    '''
+    This function will write the records of many analysis results to one file
+
+    **Parameters**
+
+    results: *list*
+        AnalysisResults, e.g. of every analysis of a batch
+
+    filename: *str*
+        The .jsonl, .csv or .parquet file to write
+
+    fmt: *str*
+        The export format (jsonl, csv or parquet), or None to choose it from the extension
+
+    **Returns**
+
+        The number of rows written
+    '''
+    with ResultWriter(filename, fmt) as writer:
+        for result in results:
+            writer.write(result)
+        return writer.rows
@@ -0,0 +1,168 @@
+import cProfile
+import json
+import time
+from collections import OrderedDict
+
+############################################################
+###################  Analysis Instrumentation  #############
+############################################################
+
+class AnalysisStats:
+    '''
+    This class records how long each stage of an analysis takes (e.g. parse,
+    filter, distance, emit, write) and counts the atoms and pairs it looks at,
+    so a slow run shows which stage is the bottleneck
+
+    **Attributes**
+
+    analysis: *str*
+        The name of the analysis
+
+    stages: *OrderedDict*
+        Stage names mapped to seconds, in the order the stages first ran
+
+    counters: *OrderedDict*
+        Counter names (e.g. atoms_scanned, pairs_evaluated) mapped to totals
+    '''
+    def __init__(self, analysis=""):
+        self.analysis = analysis
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self._stage = None
+        self._stage_start = 0.0
+
+    def __repr__(self):
+        return "<AnalysisStats {} {:.4f} s in {} stages>".format(
+            self.analysis, self.total_seconds, len(self.stages))
+
+    def start(self, stage):
+        '''
+        This function will end the running stage, if any, and start timing the next one.
+        A stage that runs more than once adds up its times
+
+        **Parameters**
+
+        stage: *str*
+            The name of the stage
+
+        **Returns**
+
+            None
+        '''
+        now = time.perf_counter()
+        self._end(now)
+        self._stage = stage
+        self._stage_start = now
+
+    def stop(self):
+        '''
+        This function will end the running stage
+        '''
+        self._end(time.perf_counter())
+        self._stage = None
+
+    def _end(self, now):
+        '''
+        This function will add the time of the running stage up to now
+        '''
+        if self._stage is not None:
+            self.stages[self._stage] = (self.stages.get(self._stage, 0.0)
+                                        + now - self._stage_start)
+
+    def count(self, counter, value=1):
+        '''
+        This function will add to a counter
+
+        **Parameters**
+
+        counter: *str*
+            The name of the counter (e.g. atoms_scanned)
+
+        value: *int*
+            The amount to add
+
+        **Returns**
+
+            None
+        '''
+        self.counters[counter] = self.counters.get(counter, 0) + int(value)
+
+    @property
+    def total_seconds(self):
+        '''
+        The time of all stages together
+        '''
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        '''
+        This function will return the stats as plain dictionaries
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+            Dictionary of the analysis name, total time, stage times and counters
+        '''
+        return {"analysis": self.analysis, "total_seconds": round(self.total_seconds, 6),
+                "stages": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+                "counters": dict(self.counters)}
+
+    def write_json(self, json_file):
+        '''
+        This function will write the stats as a JSON file
+
+        **Parameters**
+
+        json_file: *str*
+            The file name of the JSON file
+
+        **Returns**
+
+            None
+        '''
+        with open(json_file, "w", encoding="utf8") as statsfile:
+            json.dump(self.as_dict(), statsfile, indent=1)
+
+def run_instrumented(function, source, json_file=None, profile_file=None, **kwargs):
+    '''
+    This function will run an analysis with stats collection and optionally
+    dump the stats as JSON and a cProfile file (readable with pstats or snakeviz)
+
+    **Parameters**
+
+    function: *function*
+        A calc_miv analysis taking a stats keyword argument
+
+    source: *str or Structure*
+        The structure file name or parsed Structure to analyze
+
+    json_file: *str*
+        The file to write the stats to as JSON, or None
+
+    profile_file: *str*
+        The file to write the cProfile stats of the run to, or None to run without profiling
+
+    kwargs: *dict*
+        Further keyword arguments of the analysis
+
+    **Returns**
+
+        The analysis result and its AnalysisStats
+    '''
+    stats = AnalysisStats(function.__name__)
+    profiler = cProfile.Profile() if profile_file is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        result = function(source, stats=stats, **kwargs)
+    finally:
+        stats.stop()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+    if json_file is not None:
+        stats.write_json(json_file)
+    return result, stats
@@ -0,0 +1,1353 @@
+import gzip
+import mmap
+import os
+import re
+import threading
+import traceback
+from collections import OrderedDict
+import numpy as np
+
+############################################################
+###################  Structure Model  ######################
+############################################################
+
+# Structure file extensions read by read_structure, each also read gzip compressed
+STRUCTURE_EXTENSIONS = (".pdb", ".ent", ".cif", ".mmcif", ".bcif")
+
+def object_name(filename):
+    '''
+    This function will return the object name PyMOL gives a structure file on `load`
+
+    **Parameters**
+
+    filename: *str*
+        A string with the structure file name (e.g. 1fdl.pdb or 1fdl.cif.gz)
+
+    **Returns**
+
+        String of the file name without folder, extension and any .gz suffix
+    '''
+    basename = os.path.basename(filename)
+    if basename.lower().endswith(".gz"):
+        basename = basename[:-3]
+    return os.path.splitext(basename)[0]
+
+class Structure:
+    '''
+    This class holds a parsed PDB file as columnar NumPy arrays, so that a
+    structure is tokenized once and every analysis works on arrays instead
+    of re-slicing the raw PDB lines
+
+    **Attributes**
+
+    record: *numpy.ndarray*
+        Record type of each atom (e.g. ATOM, HETATM)
+
+    name: *numpy.ndarray*
+        Atom name of each atom with the padding removed (e.g. CA, O6)
+
+    resn: *numpy.ndarray*
+        Residue name of each atom (e.g. CYS, DG, A)
+
+    chain: *numpy.ndarray*
+        Chain identifier of each atom
+
+    resi: *numpy.ndarray*
+        Residue identifier of each atom as PyMOL writes it,
+        the residue number followed by any insertion code (e.g. 52A)
+
+    resv: *numpy.ndarray*
+        Residue number of each atom as integers
+
+    element: *numpy.ndarray*
+        Upper case element symbol of each atom (e.g. C, N, O, S, ZN)
+
+    models: *numpy.ndarray*
+        A float32 array of shape (models, atoms, 3) with the x, y and z
+        coordinates of every model of an ensemble, which share one topology
+
+    coords: *numpy.ndarray*
+        A view of shape (atoms, 3) of the coordinates of the first model
+
+    filename: *str*
+        The file the structure was read from
+
+    object_name: *str*
+        The object name PyMOL gives the structure on `load`
+
+    index: *AtomIndex*
+        The integer codes and inverted indexes of the categorical columns,
+        built on first use and shared by every selection of the structure
+    '''
+    # Per-atom text and integer columns with their dtypes, wide enough for
+    # the multi-character chains and residue names of mmCIF files
+    FIELDS = (("record", "U6"), ("name", "U4"), ("resn", "U5"), ("chain", "U4"),
+              ("resi", "U8"), ("resv", np.int32), ("element", "U2"))
+
+    def __init__(self, record, name, resn, chain, resi, resv, element, coords, filename=""):
+        fields = dict(record=record, name=name, resn=resn, chain=chain,
+                      resi=resi, resv=resv, element=element)
+        for field, dtype in self.FIELDS:
+            setattr(self, field, np.asarray(fields[field], dtype=dtype))
+        coords = np.asarray(coords, dtype=np.float32)
+        if len(self.record):
+            self.models = coords.reshape(-1, len(self.record), 3)
+        else:
+            self.models = np.zeros((1, 0, 3), dtype=np.float32)
+        self.filename = filename
+        self.object_name = object_name(filename)
+        self._index = None
+
+    def __len__(self):
+        return len(self.record)
+
+    def __repr__(self):
+        if self.model_count > 1:
+            return "<Structure {} with {} atoms in {} models>".format(
+                self.object_name, len(self), self.model_count)
+        return "<Structure {} with {} atoms>".format(self.object_name, len(self))
+
+    @property
+    def coords(self):
+        '''
+        The (atoms, 3) coordinates of the first model
+        '''
+        return self.models[0]
+
+    @property
+    def model_count(self):
+        '''
+        The number of models in the structure
+        '''
+        return len(self.models)
+
+    @property
+    def nbytes(self):
+        '''
+        The memory in bytes taken by the arrays of the structure
+        '''
+        return sum(array.nbytes for array in (self.record, self.name, self.resn, self.chain,
+                                              self.resi, self.resv, self.element, self.models))
+
+    @property
+    def index(self):
+        '''
+        The AtomIndex of the structure, built on first use
+        '''
+        if self._index is None:
+            self._index = AtomIndex(self)
+        return self._index
+
+    def select(self, query=None, **fields):
+        '''
+        This function will return the atoms matching every given column value
+        through the atom index (see AtomIndex.select)
+
+        **Parameters**
+
+        query: *str*
+            Optional text query of a residue name and an atom name (e.g. DG O6)
+
+        fields: *str or list*
+            Values to match per column (e.g. resn="CYS", element="S")
+
+        **Returns**
+
+            Sorted array of atom indices
+        '''
+        return self.index.select(query, **fields)
+
+    def atom_mask(self, resn=None, name=None, record="ATOM", element=None):
+        '''
+        This function will return a boolean mask of the atoms matching all given fields
+
+        **Parameters**
+
+        resn: *str*
+            Residue name to match, or None to match any residue
+
+        name: *str*
+            Atom name to match, or None to match any atom
+
+        record: *str*
+            Record type to match, or None to match ATOM and HETATM records
+
+        element: *str*
+            Element symbol to match, or None to match any element
+
+        **Returns**
+
+            Boolean array with one entry per atom
+        '''
+        return self.index.mask(resn=resn, name=name, record=record, element=element)
+
+    def residue_selection(self, index):
+        '''
+        This function will build the PyMOL selection macro of the residue of an atom
+
+        **Parameters**
+
+        index: *int*
+            The atom index in the structure
+
+        **Returns**
+
+            String of the residue macro (e.g. /1fdl//H/CYS`95)
+        '''
+        return "/{}//{}/{}`{}".format(self.object_name, self.chain[index],
+                                      self.resn[index], self.resi[index])
+
+    def atom_selection(self, index):
+        '''
+        This function will build the PyMOL selection macro of an atom
+
+        **Parameters**
+
+        index: *int*
+            The atom index in the structure
+
+        **Returns**
+
+            String of the atom macro (e.g. /1fdl//H/CYS`95/SG)
+        '''
+        return "{}/{}".format(self.residue_selection(index), self.name[index])
+
+    def residue_ranges(self, atoms):
+        '''
+        This function will build one compact PyMOL selection of the residues of
+        a set of atoms, writing each run of consecutive residues of a chain as
+        a range so PyMOL evaluates one selection instead of one per residue
+
+        **Parameters**
+
+        atoms: *numpy.ndarray*
+            Array of atom indices in the structure
+
+        **Returns**
+
+            String of the selection (e.g. 1kx5 and ((chain A and resi 46-57+67-71)
+            or (chain B and resi 3-9)), or none for no atoms
+        '''
+        atoms = np.asarray(atoms, dtype=np.int64)
+        if len(atoms) == 0:
+            return "none"
+        clauses = []
+        for chain in dict.fromkeys(self.chain[atoms].tolist()):
+            in_chain = np.flatnonzero(self.chain == chain)
+            # The residues of the chain in file order, and which of them are selected
+            resi, first = np.unique(self.resi[in_chain], return_index=True)
+            order = np.argsort(first)
+            resi = resi[order]
+            resv = self.resv[in_chain[first[order]]]
+            selected = np.isin(resi, self.resi[atoms[self.chain[atoms] == chain]])
+            # Runs of selected residues that follow each other in the chain
+            edges = np.diff(np.concatenate(([0], selected.astype(np.int8), [0])))
+            starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            sorted_resv = np.sort(resv)
+            items = []
+            for start, stop in zip(starts, stops):
+                low, high = resv[start], resv[stop - 1]
+                # A range is written only when the chain has no other residue
+                # inside it, as PyMOL selects every residue number in the range
+                inside = (np.searchsorted(sorted_resv, high, side="right")
+                          - np.searchsorted(sorted_resv, low, side="left"))
+                if (stop - start > 1 and 0 <= low < high and inside == stop - start
+                        and resi[start] == str(low) and resi[stop - 1] == str(high)):
+                    items.append("{}-{}".format(low, high))
+                else:
+                    items.extend(value.replace("-", "\\-") for value in resi[start:stop])
+            clauses.append("(chain {} and resi {})".format(
+                chain.strip() or '""', "+".join(items)))
+        return "{} and ({})".format(self.object_name, " or ".join(clauses))
+
+    def residue_label(self, index):
+        '''
+        This function will build a short text label of the residue of an atom
+
+        **Parameters**
+
+        index: *int*
+            The atom index in the structure
+
+        **Returns**
+
+            String of residue name, chain and residue number (e.g. CYS H  95)
+        '''
+        return "{} {}{:>4}".format(self.resn[index], self.chain[index], self.resi[index])
+
+############################################################
+###################  Atom Index  ###########################
+############################################################
+
+class AtomIndex:
+    '''
+    This class indexes the categorical columns of a Structure once: every
+    distinct value of a column gets an integer code, and an inverted index
+    lists the atoms of each code in file order, so a selection such as
+    "DG O6" or "CYS SG" looks up its atoms instead of comparing every
+    atom name of the structure
+
+    **Attributes**
+
+    values: *dict*
+        The sorted distinct values of each indexed column
+
+    codes: *dict*
+        The integer code of every atom in each indexed column, the position
+        of its value in values
+    '''
+    # Columns indexed, in the order a text query names them
+    FIELDS = ("resn", "name", "chain", "element", "record")
+
+    def __init__(self, structure):
+        self.size = len(structure)
+        self.values, self.codes = {}, {}
+        self._atoms, self._starts = {}, {}
+        for field in self.FIELDS:
+            values, codes = np.unique(getattr(structure, field), return_inverse=True)
+            codes = codes.ravel().astype(np.int32)
+            self.values[field] = values
+            self.codes[field] = codes
+            # The atoms of each code, in file order, start at _starts[code]
+            self._atoms[field] = np.argsort(codes, kind="stable")
+            self._starts[field] = np.concatenate(
+                ([0], np.cumsum(np.bincount(codes, minlength=len(values)))))
+
+    def __repr__(self):
+        return "<AtomIndex of {} atoms, {}>".format(self.size, ", ".join(
+            "{} {}".format(len(self.values[field]), field) for field in self.FIELDS))
+
+    def code(self, field, value):
+        '''
+        This function will return the integer code of a value of a column
+
+        **Parameters**
+
+        field: *str*
+            The column (resn, name, chain, element or record)
+
+        value: *str*
+            The value to look up (e.g. CYS)
+
+        **Returns**
+
+            Integer code of the value, or -1 when no atom has it
+        '''
+        values = self.values[field]
+        position = int(np.searchsorted(values, value))
+        if position < len(values) and values[position] == value:
+            return position
+        return -1
+
+    def atoms(self, field, value):
+        '''
+        This function will return the atoms having a value, or any of several
+        values, in a column
+
+        **Parameters**
+
+        field: *str*
+            The column (resn, name, chain, element or record)
+
+        value: *str or list*
+            The value to look up, or a list of values
+
+        **Returns**
+
+            Sorted array of atom indices
+        '''
+        values = [value] if isinstance(value, str) else dict.fromkeys(value)
+        starts, atoms = self._starts[field], self._atoms[field]
+        found = [atoms[starts[code]:starts[code + 1]]
+                 for code in (self.code(field, value) for value in values) if code >= 0]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        if len(found) == 1:
+            return found[0]
+        return np.sort(np.concatenate(found))
+
+    def select(self, query=None, **fields):
+        '''
+        This function will return the atoms matching every given column value,
+        starting from the column with the fewest matching atoms and checking
+        the others through their codes, so the cost follows the matches
+        rather than the size of the structure
+
+        **Parameters**
+
+        query: *str*
+            Optional text query of a residue name and an atom name (e.g. DG O6
+            or CYS SG), where * matches any value
+
+        fields: *str or list*
+            Values to match per column (e.g. resn="CYS", element="S"), a list
+            matching any of its values and None matching every atom
+
+        **Returns**
+
+            Sorted array of atom indices
+        '''
+        if query is not None:
+            words = query.split()
+            if len(words) > len(self.FIELDS):
+                raise ValueError("Too many fields in selection '{}'".format(query))
+            for field, word in zip(self.FIELDS, words):
+                if word != "*":
+                    fields.setdefault(field, word)
+        unknown = set(fields) - set(self.FIELDS)
+        if unknown:
+            raise ValueError("Cannot select atoms by {}".format(", ".join(sorted(unknown))))
+        terms = [(field, value) for field, value in fields.items() if value is not None]
+        if not terms:
+            return np.arange(self.size)
+        # The rarest term gives the candidates, the others filter them by code
+        candidates = [(self.atoms(field, value), field, value) for field, value in terms]
+        candidates.sort(key=lambda candidate: len(candidate[0]))
+        atoms = candidates[0][0]
+        for _, field, value in candidates[1:]:
+            if len(atoms) == 0:
+                break
+            values = [value] if isinstance(value, str) else value
+            codes = [self.code(field, value) for value in values]
+            atoms = atoms[np.isin(self.codes[field][atoms], codes)]
+        return atoms
+
+    def mask(self, query=None, **fields):
+        '''
+        This function will return the atoms of a selection as a boolean mask,
+        with the same arguments as select
+
+        **Returns**
+
+            Boolean array with one entry per atom
+        '''
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.select(query, **fields)] = True
+        return mask
+
+############################################################
+###################  Structure Readers  ####################
+############################################################
+
+# PDB record types read as atoms, as the bytes of the first six columns
+_ATOM_RECORDS = (np.frombuffer(b"ATOM  ", dtype=np.uint8),
+                 np.frombuffer(b"HETATM", dtype=np.uint8))
+
+# The PDB record that starts each model of an ensemble
+_MODEL_RECORD = np.frombuffer(b"MODEL ", dtype=np.uint8)
+
+# Fixed width of a PDB record line
+_PDB_LINE_WIDTH = 80
+
+# Bytes of a PDB file tokenized at a time, cut back to the last whole line
+_PDB_CHUNK_BYTES = 1 << 21
+
+def _chunk_stops(data, chunk_bytes=_PDB_CHUNK_BYTES):
+    '''
+    This function will split a byte array into chunks that end on a line break
+
+    **Parameters**
+
+    data: *numpy.ndarray*
+        A uint8 array of the file contents
+
+    chunk_bytes: *int*
+        The preferred size of a chunk in bytes
+
+    **Returns**
+
+        List of (start, stop) byte positions of the chunks
+    '''
+    stops = []
+    start = 0
+    while start < len(data):
+        stop = start + chunk_bytes
+        if stop >= len(data):
+            stop = len(data)
+        else:
+            newlines = np.flatnonzero(data[start:stop] == 10)
+            if len(newlines):
+                stop = start + newlines[-1] + 1
+            else:
+                # A line longer than a chunk runs on to the next line break
+                newlines = np.flatnonzero(data[stop:] == 10)
+                stop = stop + newlines[0] + 1 if len(newlines) else len(data)
+        stops.append((start, stop))
+        start = stop
+    return stops
+
+def _atom_lines(chunk):
+    '''
+    This function will find the ATOM and HETATM lines in a chunk of whole lines
+
+    **Parameters**
+
+    chunk: *numpy.ndarray*
+        A uint8 array of whole PDB lines
+
+    **Returns**
+
+        Array of start and array of end byte positions of the atom lines,
+        array of the number of MODEL lines before each atom line and the
+        number of MODEL lines in the chunk
+    '''
+    newlines = np.flatnonzero(chunk == 10)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(chunk)]))
+    long_enough = ends - starts >= 6
+    starts, ends = starts[long_enough], ends[long_enough]
+    heads = chunk[starts[:, np.newaxis] + np.arange(6)]
+    is_atom = np.zeros(len(starts), dtype=bool)
+    for record in _ATOM_RECORDS:
+        is_atom |= np.all(heads == record, axis=1)
+    is_model = np.all(heads == _MODEL_RECORD, axis=1)
+    models_before = np.cumsum(is_model)[is_atom]
+    return starts[is_atom], ends[is_atom], models_before, int(is_model.sum())
+
+def _atom_records(chunk):
+    '''
+    This function will gather the ATOM and HETATM lines of a chunk into a
+    fixed width byte matrix, padding short lines with spaces
+
+    **Parameters**
+
+    chunk: *numpy.ndarray*
+        A uint8 array of whole PDB lines
+
+    **Returns**
+
+        A uint8 array of shape (atoms, 80), array of the number of MODEL lines
+        before each atom line and the number of MODEL lines in the chunk
+    '''
+    starts, ends, models_before, model_lines = _atom_lines(chunk)
+    padded = np.concatenate((chunk, np.full(_PDB_LINE_WIDTH, 32, dtype=np.uint8)))
+    records = padded[starts[:, np.newaxis] + np.arange(_PDB_LINE_WIDTH)]
+    # Lines shorter than a full record are blanked past their end, which also
+    # drops the carriage return of Windows line endings
+    short = np.flatnonzero(ends - starts < _PDB_LINE_WIDTH)
+    if len(short):
+        inside = np.arange(_PDB_LINE_WIDTH) < (ends - starts)[short, np.newaxis]
+        tail = records[short]
+        tail[~inside | (tail == 13)] = 32
+        records[short] = tail
+    return records, models_before, model_lines
+
+def _record_field(records, start, stop):
+    '''
+    This function will view the columns [start, stop) of a byte matrix as one bytes string per row
+    '''
+    return np.ascontiguousarray(records[:, start:stop]).view("S{}".format(stop - start))[:, 0]
+
+def _text_field(records, start, stop, dtype):
+    '''
+    This function will read the columns [start, stop) of a byte matrix as stripped text
+    '''
+    return np.char.strip(_record_field(records, start, stop).astype(dtype))
+
+def _hybrid36(text):
+    '''
+    This function will read one residue number written as a decimal or, past
+    9999, as a hybrid-36 number (A000 = 10000, a000 after Z999), with 0 for a
+    blank or unreadable field
+    '''
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    width = len(text)
+    try:
+        value = int(text, 36)
+    except ValueError:
+        return 0
+    if width == 0 or text[0].isdigit():
+        return 0
+    # Upper case numbers follow 10**width - 1, lower case ones follow the upper case
+    value += 10 ** width - 10 * 36 ** (width - 1)
+    if text[0].islower():
+        value += 26 * 36 ** (width - 1)
+    return value
+
+def _residue_numbers(records):
+    '''
+    This function will read the resSeq columns of a byte matrix as integers,
+    parsing every field at once and falling back to one field at a time only
+    for a chunk with blank or hybrid-36 residue numbers
+    '''
+    field = _record_field(records, 22, 26)
+    try:
+        return field.astype(np.int32)
+    except ValueError:
+        return np.array([_hybrid36(value.decode("ascii", "replace")) for value in field],
+                        dtype=np.int32)
+
+class _AtomColumns:
+    '''
+    This class accumulates the fields of fixed width atom records into
+    preallocated columns, growing them only when more atoms arrive than
+    were reserved, so a structure is built without per-atom Python objects
+
+    **Attributes**
+
+    size: *int*
+        The number of atoms added so far
+
+    model_lines: *int*
+        The number of MODEL records seen so far
+    '''
+    def __init__(self, capacity=0):
+        self.size = 0
+        self.model_lines = 0
+        self.columns = {field: np.empty(capacity, dtype=dtype)
+                        for field, dtype in Structure.FIELDS}
+        self.coords = np.empty((capacity, 3), dtype=np.float32)
+        self.model = np.empty(capacity, dtype=np.int32)
+
+    def _reserve(self, capacity):
+        '''
+        This function will grow the columns to hold at least the given number of atoms
+        '''
+        if capacity <= len(self.coords):
+            return
+        capacity = max(capacity, 2 * len(self.coords))
+        for field, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[field] = grown
+        grown = np.empty((capacity, 3), dtype=np.float32)
+        grown[:self.size] = self.coords[:self.size]
+        self.coords = grown
+        grown = np.empty(capacity, dtype=np.int32)
+        grown[:self.size] = self.model[:self.size]
+        self.model = grown
+
+    def add(self, records, models_before, model_lines):
+        '''
+        This function will tokenize a byte matrix of atom records and append its atoms
+
+        **Parameters**
+
+        records: *numpy.ndarray*
+            A uint8 array of shape (atoms, 80) of ATOM and HETATM lines
+
+        models_before: *numpy.ndarray*
+            The number of MODEL lines of the chunk before each atom line
+
+        model_lines: *int*
+            The number of MODEL lines in the chunk
+
+        **Returns**
+
+            None
+        '''
+        count = len(records)
+        first_model = self.model_lines
+        self.model_lines += model_lines
+        if not count:
+            return
+        self._reserve(self.size + count)
+        rows = slice(self.size, self.size + count)
+        self.columns["record"][rows] = _text_field(records, 0, 6, "U6")
+        self.columns["name"][rows] = _text_field(records, 12, 16, "U4")
+        self.columns["resn"][rows] = _text_field(records, 17, 20, "U3")
+        self.columns["chain"][rows] = _record_field(records, 21, 22).astype("U1")
+        self.columns["resi"][rows] = _text_field(records, 22, 27, "U5")
+        self.columns["resv"][rows] = _residue_numbers(records)
+        # older files leave the element columns blank, so fall back to the atom name
+        element = _text_field(records, 76, 78, "U2")
+        fallback = _text_field(records, 12, 14, "U2").astype("U1")
+        self.columns["element"][rows] = np.where(element == "", fallback, element)
+        for axis, start in enumerate((30, 38, 46)):
+            self.coords[rows, axis] = _record_field(records, start, start + 8).astype(np.float32)
+        self.model[rows] = first_model + models_before
+        self.size += count
+
+    def structure(self, filename=""):
+        '''
+        This function will build a Structure from the atoms added so far
+
+        **Parameters**
+
+        filename: *str*
+            The file the atoms were read from
+
+        **Returns**
+
+            Structure holding every added atom
+        '''
+        columns = {field: column[:self.size] for field, column in self.columns.items()}
+        return stack_models(columns, self.coords[:self.size], self.model[:self.size], filename)
+
+def stack_models(columns, coords, model, filename=""):
+    '''
+    This function will build a Structure from atoms read model after model,
+    keeping the topology of the first model once and stacking the coordinates
+    of every model with the same number of atoms into a (models, atoms, 3) array
+
+    **Parameters**
+
+    columns: *dict*
+        Structure.FIELDS names mapped to arrays with one entry per atom read
+
+    coords: *numpy.ndarray*
+        A float array of shape (atoms read, 3)
+
+    model: *numpy.ndarray*
+        The model number of each atom read, in file order
+
+    filename: *str*
+        The file the atoms were read from
+
+    **Returns**
+
+        Structure of the first model topology with the coordinates of all models
+    '''
+    if len(model) == 0 or np.all(model == model[0]):
+        return Structure(coords=coords, filename=filename, **columns)
+    first = model == model[0]
+    numbers, counts = np.unique(model, return_counts=True)
+    # Models with a different number of atoms cannot share the topology and are dropped
+    stacked = np.isin(model, numbers[counts == counts[numbers == model[0]][0]])
+    columns = {field: column[first] for field, column in columns.items()}
+    return Structure(coords=coords[stacked], filename=filename, **columns)
+
+def parse_pdb(filename=str, chunk_bytes=_PDB_CHUNK_BYTES):
+    '''
+    This function will read a PDB file through a read-only memory map and
+    tokenize the ATOM and HETATM records into a columnar Structure. The file
+    is scanned in chunks of whole lines, once to count the atoms so every
+    column is allocated once at its final size and once to fill them, so
+    memory stays near the size of the result even for very large files
+
+    **Parameters**
+
+    filename: *str*
+        A string with the PDB file name (e.g. 1fdl.pdb)
+
+    chunk_bytes: *int*
+        The number of bytes tokenized at a time
+
+    **Returns**
+
+        Structure holding every atom record of the file
+    '''
+    with open(filename, "rb") as rawfile:
+        if os.fstat(rawfile.fileno()).st_size == 0:
+            return _AtomColumns().structure(filename)
+        with mmap.mmap(rawfile.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            columns = _read_mapped_pdb(buffer, chunk_bytes)
+    return columns.structure(filename)
+
+def _read_mapped_pdb(buffer, chunk_bytes):
+    '''
+    This function will tokenize the atom records of a memory mapped PDB file.
+    Every array viewing the map is released on return, so the map can be closed
+
+    **Parameters**
+
+    buffer: *mmap.mmap*
+        The memory mapped PDB file
+
+    chunk_bytes: *int*
+        The number of bytes tokenized at a time
+
+    **Returns**
+
+        _AtomColumns holding every atom record of the file
+    '''
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    try:
+        stops = _chunk_stops(data, chunk_bytes)
+        count = sum(len(_atom_lines(data[start:stop])[0]) for start, stop in stops)
+        columns = _AtomColumns(count)
+        for start, stop in stops:
+            columns.add(*_atom_records(data[start:stop]))
+        return columns
+    except Exception as error:
+        # The frames of the traceback still view the map, and closing it
+        # would raise a BufferError in place of the error itself
+        traceback.clear_frames(error.__traceback__)
+        raise
+    finally:
+        del data
+
+def parse_pdb_stream(stream, filename="", chunk_bytes=_PDB_CHUNK_BYTES):
+    '''
+    This function will tokenize the ATOM and HETATM records of a binary PDB
+    stream, such as a gzip file, one chunk of whole lines at a time, so the
+    decompressed file is never held in memory at once
+
+    **Parameters**
+
+    stream: *file*
+        A binary file object of PDB text
+
+    filename: *str*
+        The file the stream reads
+
+    chunk_bytes: *int*
+        The number of bytes read and tokenized at a time
+
+    **Returns**
+
+        Structure holding every atom record of the stream
+    '''
+    columns = _AtomColumns()
+    for chunk in _stream_chunks(stream, chunk_bytes):
+        columns.add(*_atom_records(chunk))
+    return columns.structure(filename)
+
+def _stream_chunks(stream, chunk_bytes=_PDB_CHUNK_BYTES):
+    '''
+    This function will read a binary stream in uint8 chunks of whole lines
+
+    **Parameters**
+
+    stream: *file*
+        A binary file object of text
+
+    chunk_bytes: *int*
+        The number of bytes read at a time
+
+    **Returns**
+
+        Iterator of uint8 arrays of whole lines
+    '''
+    rest = b""
+    while True:
+        block = stream.read(chunk_bytes)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b"\n") + 1
+        rest = block[cut:]
+        if cut:
+            yield np.frombuffer(block[:cut], dtype=np.uint8)
+    if rest:
+        yield np.frombuffer(rest, dtype=np.uint8)
+
+def parse_pdb_topology(stream, filename="", chunk_bytes=_PDB_CHUNK_BYTES):
+    '''
+    This function will read only the atoms of the first model of a binary PDB
+    stream, so the topology of a long multi-model trajectory is read without
+    reading the coordinates of every frame
+
+    **Parameters**
+
+    stream: *file*
+        A binary file object of PDB text
+
+    filename: *str*
+        The file the stream reads
+
+    chunk_bytes: *int*
+        The number of bytes read and tokenized at a time
+
+    **Returns**
+
+        Structure holding the atoms of the first model
+    '''
+    columns = _AtomColumns()
+    model_lines = 0
+    first_model = None
+    for chunk in _stream_chunks(stream, chunk_bytes):
+        records, models_before, lines = _atom_records(chunk)
+        model = model_lines + models_before
+        model_lines += lines
+        if len(records) and first_model is None:
+            first_model = model[0]
+        if first_model is None:
+            continue
+        first = model == first_model
+        columns.add(records[first], models_before[first], 0)
+        if not first.all() or model_lines > first_model:
+            break
+    return columns.structure(filename)
+
+def iter_pdb_models(stream, chunk_bytes=_PDB_CHUNK_BYTES):
+    '''
+    This function will read the coordinates of a multi-model PDB stream one
+    model at a time, tokenizing only the coordinate columns, so a trajectory
+    of any length is read with the memory of one chunk and one model
+
+    **Parameters**
+
+    stream: *file*
+        A binary file object of PDB text
+
+    chunk_bytes: *int*
+        The number of bytes read and tokenized at a time
+
+    **Returns**
+
+        Iterator of float arrays of shape (atoms, 3), one per model
+    '''
+    model_lines = 0
+    current = None
+    pending = []
+    for chunk in _stream_chunks(stream, chunk_bytes):
+        records, models_before, lines = _atom_records(chunk)
+        model = model_lines + models_before
+        model_lines += lines
+        if not len(records):
+            continue
+        coords = np.column_stack([_record_field(records, start, start + 8).astype(np.float32)
+                                  for start in (30, 38, 46)])
+        bounds = np.flatnonzero(np.diff(model)) + 1
+        for number, part in zip(model[np.concatenate(([0], bounds))], np.split(coords, bounds)):
+            if current is not None and number != current:
+                yield np.concatenate(pending)
+                pending = []
+            current = number
+            pending.append(part)
+    if pending:
+        yield np.concatenate(pending)
+
+# mmCIF _atom_site items read into each Structure column, the author
+# fields first as PyMOL reads them, then the label fields as a fallback
+_CIF_ITEMS = {
+    "record": ("group_PDB",),
+    "name": ("auth_atom_id", "label_atom_id"),
+    "resn": ("auth_comp_id", "label_comp_id"),
+    "chain": ("auth_asym_id", "label_asym_id"),
+    "resv": ("auth_seq_id", "label_seq_id"),
+    "insertion": ("pdbx_PDB_ins_code",),
+    "element": ("type_symbol",),
+    "x": ("Cartn_x",),
+    "y": ("Cartn_y",),
+    "z": ("Cartn_z",),
+    "model": ("pdbx_PDB_model_num",),
+}
+
+# Tokens of a CIF data line: quoted strings, which may contain their quote
+# character when it is not followed by whitespace, or bare words
+_CIF_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""", re.MULTILINE)
+
+# The loop_ header of the _atom_site table, and the first line after its rows
+_CIF_ATOM_SITE_LOOP = re.compile(r"^loop_[ \t]*\r?\n((?:[ \t]*_atom_site\.\S+[^\n]*\n)+)",
+                                 re.MULTILINE)
+_CIF_LOOP_END = re.compile(r"^(?:[_#]|loop_|data_)", re.MULTILINE)
+
+def _cif_column(table, field, rows):
+    '''
+    This function will return the first present _atom_site item of a Structure field
+
+    **Parameters**
+
+    table: *dict*
+        The _atom_site item names mapped to arrays of values
+
+    field: *str*
+        A key of _CIF_ITEMS
+
+    rows: *int*
+        The number of atoms, for the empty column of a missing item
+
+    **Returns**
+
+        String array of the item values with the CIF null values ? and . made empty
+    '''
+    for item in _CIF_ITEMS[field]:
+        if item in table:
+            values = np.asarray(table[item]).astype(str)
+            return np.where((values == "?") | (values == "."), "", values)
+    if field == "record":
+        return np.full(rows, "ATOM")
+    return np.full(rows, "")
+
+def _cif_structure(table, filename):
+    '''
+    This function will build a Structure from the columns of an _atom_site table
+
+    **Parameters**
+
+    table: *dict*
+        The _atom_site item names mapped to arrays of values
+
+    filename: *str*
+        The file the table was read from
+
+    **Returns**
+
+        Structure holding every atom of the table
+    '''
+    rows = len(next(iter(table.values()))) if table else 0
+    columns = {field: _cif_column(table, field, rows) for field in _CIF_ITEMS}
+    resv = columns["resv"]
+    resv = np.where(resv == "", "0", resv).astype(np.float64).astype(np.int32)
+    coords = np.column_stack([columns[axis].astype(np.float32) for axis in ("x", "y", "z")])
+    resi = np.char.add(resv.astype(str), columns["insertion"])
+    model = columns["model"]
+    model = np.where(model == "", "1", model).astype(np.float64).astype(np.int32)
+    fields = {"record": columns["record"], "name": columns["name"], "resn": columns["resn"],
+              "chain": columns["chain"], "resi": resi, "resv": resv,
+              "element": np.char.upper(columns["element"])}
+    return stack_models(fields, coords.reshape(-1, 3), model, filename)
+
+def parse_cif_text(text, filename=""):
+    '''
+    This function will read the _atom_site loop of mmCIF text into a columnar Structure
+
+    **Parameters**
+
+    text: *str*
+        The mmCIF file contents
+
+    filename: *str*
+        The file the text was read from
+
+    **Returns**
+
+        Structure holding every atom of the _atom_site loop
+    '''
+    header = _CIF_ATOM_SITE_LOOP.search(text)
+    if header is None:
+        return _cif_structure({}, filename)
+    tags = re.findall(r"_atom_site\.(\S+)", header.group(1))
+    start = header.end()
+    end = _CIF_LOOP_END.search(text, start)
+    end = len(text) if end is None else end.start()
+    block = text[start:end]
+    if "'" in block or '"' in block:
+        tokens = ["".join(groups) for groups in _CIF_TOKEN.findall(block)]
+    else:
+        tokens = block.split()
+    values = np.array(tokens, dtype=str).reshape(-1, len(tags))
+    table = {tag: values[:, column] for column, tag in enumerate(tags)}
+    return _cif_structure(table, filename)
+
+def parse_cif(filename=str):
+    '''
+    This function will read an mmCIF file, optionally gzip compressed,
+    into a columnar Structure
+
+    **Parameters**
+
+    filename: *str*
+        A string with the mmCIF file name (e.g. 1fdl.cif or 1fdl.cif.gz)
+
+    **Returns**
+
+        Structure holding every atom of the _atom_site loop
+    '''
+    opener = gzip.open if filename.lower().endswith(".gz") else open
+    with opener(filename, "rt", encoding="utf8") as rawfile:
+        return parse_cif_text(rawfile.read(), filename)
+
+# BinaryCIF byte array type codes to NumPy dtypes
+_BCIF_TYPES = {1: "<i1", 2: "<i2", 3: "<i4", 4: "<u1", 5: "<u2", 6: "<u4",
+               32: "<f4", 33: "<f8"}
+
+def _bcif_decode(data, encodings):
+    '''
+    This function will undo the encodings of a BinaryCIF column, last encoding first
+
+    **Parameters**
+
+    data: *bytes or numpy.ndarray*
+        The encoded column data
+
+    encodings: *list*
+        The BinaryCIF encoding descriptions in the order they were applied
+
+    **Returns**
+
+        Array of the decoded values
+    '''
+    for encoding in reversed(encodings):
+        kind = encoding["kind"]
+        if kind == "ByteArray":
+            data = np.frombuffer(data, dtype=_BCIF_TYPES[encoding["type"]])
+        elif kind == "FixedPoint":
+            dtype = _BCIF_TYPES[encoding["srcType"]]
+            data = (data / encoding["factor"]).astype(dtype)
+        elif kind == "IntervalQuantization":
+            step = (encoding["max"] - encoding["min"]) / (encoding["numSteps"] - 1)
+            data = (encoding["min"] + step * data).astype(_BCIF_TYPES[encoding["srcType"]])
+        elif kind == "RunLength":
+            data = np.repeat(data[0::2], data[1::2]).astype(_BCIF_TYPES[encoding["srcType"]])
+        elif kind == "Delta":
+            data = (np.cumsum(data, dtype=np.int64) + encoding["origin"])
+            data = data.astype(_BCIF_TYPES[encoding["srcType"]])
+        elif kind == "IntegerPacking":
+            # Values outside the packed range are split into runs of the
+            # boundary value ended by the remainder, which are summed back
+            bits = 8 * encoding["byteCount"]
+            if encoding["isUnsigned"]:
+                boundary = data == (1 << bits) - 1
+            else:
+                boundary = (data == (1 << (bits - 1)) - 1) | (data == -(1 << (bits - 1)))
+            ends = np.flatnonzero(~boundary)
+            starts = np.concatenate(([0], ends[:-1] + 1))
+            data = np.add.reduceat(data.astype(np.int64), starts) if len(ends) else data[:0]
+            data = data.astype(np.int32)
+        elif kind == "StringArray":
+            offsets = _bcif_decode(encoding["offsets"], encoding["offsetEncoding"])
+            strings = encoding["stringData"]
+            table = np.array([strings[first:last] for first, last
+                              in zip(offsets[:-1], offsets[1:])] + [""], dtype=str)
+            indices = _bcif_decode(data, encoding["dataEncoding"])
+            data = table[np.where(indices < 0, len(table) - 1, indices)]
+        else:
+            raise ValueError("Unsupported BinaryCIF encoding {}".format(kind))
+    return data
+
+def parse_bcif(filename=str):
+    '''
+    This function will read a BinaryCIF file, optionally gzip compressed,
+    into a columnar Structure. BinaryCIF needs the msgpack package
+
+    **Parameters**
+
+    filename: *str*
+        A string with the BinaryCIF file name (e.g. 1fdl.bcif)
+
+    **Returns**
+
+        Structure holding every atom of the _atom_site category
+    '''
+    try:
+        # pylint: disable=import-outside-toplevel
+        import msgpack
+    except ImportError as error:
+        raise ImportError("Reading BinaryCIF files needs msgpack (pip install msgpack)") from error
+    opener = gzip.open if filename.lower().endswith(".gz") else open
+    with opener(filename, "rb") as rawfile:
+        document = msgpack.unpackb(rawfile.read(), raw=False)
+    table = {}
+    for category in document["dataBlocks"][0]["categories"]:
+        if category["name"].lstrip("_") != "atom_site":
+            continue
+        for column in category["columns"]:
+            values = _bcif_decode(column["data"]["data"], column["data"]["encoding"])
+            if column.get("mask"):
+                mask = _bcif_decode(column["mask"]["data"], column["mask"]["encoding"])
+                values = np.where(mask == 0, values.astype(str), "")
+            table[column["name"]] = values
+    return _cif_structure(table, filename)
+
+def read_structure(filename=str):
+    '''
+    This function will read a PDB, mmCIF or BinaryCIF file into a columnar
+    Structure, choosing the reader from the file extension. Gzip compressed
+    files (e.g. 1fdl.pdb.gz) are decompressed while they are read
+
+    **Parameters**
+
+    filename: *str*
+        A string with the structure file name
+
+    **Returns**
+
+        Structure holding every atom of the file
+    '''
+    lowered = filename.lower()
+    compressed = lowered.endswith(".gz")
+    extension = os.path.splitext(lowered[:-3] if compressed else lowered)[1]
+    if extension in (".cif", ".mmcif"):
+        return parse_cif(filename)
+    if extension == ".bcif":
+        return parse_bcif(filename)
+    if compressed:
+        with gzip.open(filename, "rb") as rawfile:
+            return parse_pdb_stream(rawfile, filename)
+    return parse_pdb(filename)
+
+############################################################
+###################  Structure Cache  ######################
+############################################################
+
+class StructureCache:
+    '''
+    This class keeps recently parsed structures in memory, keyed by the file's
+    path, size and modification time so an edited file is parsed again. When
+    the cached arrays take more than max_bytes the least recently used
+    structures are evicted
+
+    **Attributes**
+
+    max_bytes: *int*
+        The memory budget in bytes of the cached structures
+
+    hits: *int*
+        Number of lookups answered from the cache
+
+    misses: *int*
+        Number of lookups that had to parse the file
+
+    evictions: *int*
+        Number of structures dropped to stay within max_bytes
+    '''
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def file_key(filename):
+        '''
+        This function will build the cache key of a file
+
+        **Parameters**
+
+        filename: *str*
+            A structure file name
+
+        **Returns**
+
+            Tuple of the absolute path, size in bytes and modification time
+        '''
+        stat = os.stat(filename)
+        return (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+    def get(self, filename, parser):
+        '''
+        This function will return the cached structure of a file, parsing
+        and caching it on a miss
+
+        **Parameters**
+
+        filename: *str*
+            A structure file name
+
+        parser: *callable*
+            The function parsing the file into a Structure
+
+        **Returns**
+
+            Structure of the file
+        '''
+        key = self.file_key(filename)
+        with self._lock:
+            structure = self._entries.get(key)
+            if structure is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return structure
+            self.misses += 1
+        structure = parser(filename)
+        self.put(key, structure)
+        return structure
+
+    def put(self, key, structure):
+        '''
+        This function will add a structure and evict the least recently used
+        structures until the cache fits in max_bytes. A structure larger than
+        the whole budget is not kept, and the cached structures stay
+
+        **Parameters**
+
+        key: *tuple*
+            The cache key from file_key
+
+        structure: *Structure*
+            The parsed structure
+
+        **Returns**
+
+            None
+        '''
+        with self._lock:
+            # An older version of the same file is replaced rather than kept
+            for old_key in [old_key for old_key in self._entries if old_key[0] == key[0]]:
+                self.nbytes -= self._entries.pop(old_key).nbytes
+            if structure.nbytes > self.max_bytes:
+                return
+            self._entries[key] = structure
+            self.nbytes += structure.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        '''
+        This function will drop every cached structure and reset the counters
+        '''
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''
+        This function will summarize the cache use
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+            Dictionary of hits, misses, evictions, cached structures and bytes
+        '''
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "structures": len(self), "bytes": self.nbytes, "max_bytes": self.max_bytes}
+
+# The cache shared by every calc_miv analysis and the batch mode
+STRUCTURE_CACHE = StructureCache()
+
+def load_structure(source, cache=STRUCTURE_CACHE):
+    '''
+    This function will return a Structure for a file name, or pass an
+    already parsed Structure through unchanged
+
+    **Parameters**
+
+    source: *str or Structure*
+        A structure file name or a Structure from read_structure
+
+    cache: *StructureCache*
+        The cache of parsed structures to use, or None to always parse the file
+
+    **Returns**
+
+        Structure of the given source
+    '''
+    if isinstance(source, Structure):
+        return source
+    if cache is None:
+        return read_structure(source)
+    return cache.get(source, read_structure)
+
+def structure_from_pymol(cmd, object_name, filename=""):
+    '''
+    This function will build a Structure from an object already loaded in
+    PyMOL, reusing its coordinates through cmd.get_coords instead of
+    reading and parsing the file again
+
+    **Parameters**
+
+    cmd: *module*
+        The pymol cmd module
+
+    object_name: *str*
+        The name of the loaded PyMOL object
+
+    filename: *str*
+        The file the object was loaded from
+
+    **Returns**
+
+        Structure of the atoms of the object
+    '''
+    atoms = []
+    cmd.iterate(object_name, "atoms.append((type, name, resn, chain, resi, resv, elem))",
+                space={"atoms": atoms})
+    # state 0 returns the coordinates of every state one after the other
+    coords = cmd.get_coords(object_name, 0 if cmd.count_states(object_name) > 1 else 1)
+    if coords is None:
+        coords = np.zeros((0, 3), dtype=np.float32)
+    fields = list(zip(*atoms)) if atoms else [[]] * 7
+    # PyMOL writes element symbols in title case (e.g. Zn), the readers in upper case
+    fields[6] = [element.upper() for element in fields[6]]
+    structure = Structure(*fields, coords=coords, filename=filename)
+    structure.object_name = object_name
+    return structure
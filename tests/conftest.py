@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root, next to the PyMOL plugin __init__.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDB_FILES = os.path.join(ROOT, "PDB_Files")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import pytest
+import accession_miv
+from accession_miv import AccessionIndex, accession_index, build_accession_index
+
+@pytest.fixture
+def accession_file(tmp_path):
+    '''
+    This function will write a small AlphaFold accession table with a header,
+    a protein of two fragments and a row without a model version
+    '''
+    filename = str(tmp_path / "accession_ids.csv")
+    with open(filename, "w", encoding="utf8") as accessionfile:
+        accessionfile.write("accession,first,last,alphafold_id,version\n"
+                            "A0A009IHW8,1,157,AF-A0A009IHW8-F1,4\n"
+                            "Q8WZ42,1401,2800,AF-Q8WZ42-F2,4\n"
+                            "Q8WZ42,1,1400,AF-Q8WZ42-F1,4\n"
+                            "P22626,1,353,AF-P22626-F1\n")
+    return filename
+
+def test_build_writes_every_row(accession_file):
+    index_file = build_accession_index(accession_file)
+    assert index_file == accession_file + ".sqlite"
+    connection = sqlite3.connect(index_file)
+    try:
+        rows = connection.execute("SELECT * FROM accessions ORDER BY alphafold_id").fetchall()
+    finally:
+        connection.close()
+    assert rows == [("A0A009IHW8", "AF-A0A009IHW8-F1", 1, 157, 4),
+                    ("P22626", "AF-P22626-F1", 1, 353, None),
+                    ("Q8WZ42", "AF-Q8WZ42-F1", 1, 1400, 4),
+                    ("Q8WZ42", "AF-Q8WZ42-F2", 1401, 2800, 4)]
+    assert not [name for name in os.listdir(os.path.dirname(index_file))
+                if name.endswith(".tmp")]
+
+def test_lookup_and_get(accession_file, monkeypatch):
+    monkeypatch.setattr(accession_miv, "_LOOKUP_BATCH", 2)
+    index = AccessionIndex(accession_file)
+    try:
+        found = index.lookup(["Q8WZ42", "P22626", "MISSING", "P22626", "A0A009IHW8"])
+        assert found == {"Q8WZ42": ["AF-Q8WZ42-F1", "AF-Q8WZ42-F2"],
+                         "P22626": ["AF-P22626-F1"],
+                         "A0A009IHW8": ["AF-A0A009IHW8-F1"]}
+        assert index.get("Q8WZ42") == "AF-Q8WZ42-F1"
+        assert index.get("MISSING") is None
+        assert index.get("MISSING", "none") == "none"
+    finally:
+        index.close()
+
+def test_index_is_rebuilt_when_the_table_changes(accession_file):
+    AccessionIndex(accession_file).close()
+    with open(accession_file, "a", encoding="utf8") as accessionfile:
+        accessionfile.write("P69905,1,142,AF-P69905-F1,4\n")
+    index = AccessionIndex(accession_file)
+    try:
+        assert index.get("P69905") == "AF-P69905-F1"
+    finally:
+        index.close()
+
+def test_index_is_used_without_the_table(accession_file):
+    build_accession_index(accession_file)
+    os.remove(accession_file)
+    index = AccessionIndex(accession_file)
+    try:
+        assert index.get("P22626") == "AF-P22626-F1"
+    finally:
+        index.close()
+
+def test_shared_index_per_table(accession_file):
+    index = accession_index(accession_file)
+    try:
+        assert accession_index(accession_file) is index
+    finally:
+        accession_miv._INDEXES.pop(os.path.abspath(accession_file)).close()
@@ -0,0 +1,36 @@
+import os
+import shutil
+from conftest import PDB_FILES
+import batch_miv
+from batch_miv import run_batch, structure_names
+
+def test_structure_names_number_shared_names():
+    filenames = ["a/x.pdb", "b/x.pdb", "x.cif.gz", "X.pdb", "x_2.pdb", "y.pdb"]
+    assert structure_names(filenames) == ["x", "x_2", "x_3", "X_4", "x_2_2", "y"]
+
+def test_same_names_in_two_folders_keep_both_results(tmp_path):
+    for folder in ("a", "b"):
+        os.makedirs(tmp_path / folder)
+        shutil.copy(os.path.join(PDB_FILES, "1fdl.pdb"), str(tmp_path / folder / "1fdl.pdb"))
+    filenames = [str(tmp_path / "a" / "1fdl.pdb"), str(tmp_path / "b" / "1fdl.pdb")]
+    output_dir = str(tmp_path / "out")
+    rows = run_batch(filenames, ["fasta", "mw"], output_dir, jobs=1)
+    assert [row[0] for row in rows] == ["1fdl", "1fdl", "1fdl_2", "1fdl_2"]
+    assert all(row[-1] == "ok" for row in rows)
+    for name in ("1fdl", "1fdl_2"):
+        assert os.path.exists(os.path.join(output_dir, name, "fasta.txt"))
+
+def test_results_only_come_back_for_an_export(tmp_path, monkeypatch):
+    returned = []
+    run_structure = batch_miv.run_structure
+    def recording(*args):
+        rows, results = run_structure(*args)
+        returned.append(results)
+        return rows, results
+    monkeypatch.setattr(batch_miv, "run_structure", recording)
+    filenames = [os.path.join(PDB_FILES, "1fdl.pdb")]
+    rows = run_batch(filenames, ["disulfide", "mw"], str(tmp_path / "out"), jobs=1)
+    assert [row[3] for row in rows] == ["9", "61306.00"] and returned == [[]]
+    run_batch(filenames, ["disulfide", "mw"], str(tmp_path / "out"), jobs=1,
+              export="records.jsonl")
+    assert [result.analysis for result in returned[1]] == ["disulfide", "mw"]
@@ -0,0 +1,36 @@
+import os
+import numpy as np
+from conftest import PDB_FILES
+from structure_miv import read_structure
+from calc_miv import calc_disulfide
+from bench_miv import PARSE, compare, run_benchmarks, tile_structure
+
+def test_tiled_copies_keep_their_own_results():
+    structure = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    tiled = tile_structure(structure, 3)
+    assert len(tiled) == 3 * len(structure)
+    assert tiled.object_name == "1fdl_x3"
+    assert np.allclose(tiled.coords[:len(structure)], structure.coords)
+    bonds = calc_disulfide(structure, pml_file=None).values["bonds"]
+    assert calc_disulfide(tiled, pml_file=None).values["bonds"] == 3 * bonds
+    assert tile_structure(structure, 1) is structure
+
+def test_run_benchmarks_times_parse_and_analyses():
+    results = run_benchmarks([os.path.join(PDB_FILES, "1z43.pdb")], ["mw"], scales=(1, 2),
+                             repeat=1)
+    assert [(entry["structure"], entry["benchmark"]) for entry in results] == [
+        ("1z43", PARSE), ("1z43", "mw"), ("1z43_x2", "mw")]
+    assert results[2]["atoms"] == 2 * results[1]["atoms"]
+    assert all(entry["seconds_median"] >= 0 and entry["peak_bytes"] > 0 for entry in results)
+
+def test_compare_reports_only_real_regressions():
+    def entry(benchmark, seconds, peak):
+        return {"structure": "1z43", "benchmark": benchmark, "seconds_median": seconds,
+                "peak_bytes": peak}
+    baseline = [entry("mw", 0.1, 1000), entry("fasta", 0.001, 1000), entry("parse", 0.1, 1000)]
+    results = [entry("mw", 0.2, 1100), entry("fasta", 0.004, 1000), entry("parse", 0.1, 2000),
+               entry("hbonds", 9.0, 9000)]
+    regressions = compare(results, baseline)
+    assert [(found["benchmark"], found["metric"]) for found in regressions] == [
+        ("mw", "seconds_median"), ("parse", "peak_bytes")]
+    assert regressions[0]["ratio"] == 2.0
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+import pytest
+from conftest import PDB_FILES
+from structure_miv import read_structure
+from calc_miv import (BASE_ATOM_TYPES, BASE_PAIR_RANGES, BASE_PAIR_RULES, AnalysisCancelled,
+                      BasePairRules, alpha_helice, calc_contacts, calc_disulfide, calc_hbonds,
+                      calc_peptide_mw, calc_wc_nwc, end_to_end_dist, model_pairs,
+                      output_fasta, scaled_progress)
+
+@pytest.fixture(scope="module")
+def dna():
+    return read_structure(os.path.join(PDB_FILES, "1bhm.pdb"))
+
+@pytest.fixture(scope="module")
+def antibody():
+    return read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+
+def test_sequence_and_mass(antibody):
+    fasta = output_fasta(antibody)
+    assert fasta.values["sequence"].startswith("DIQMTQSPASLSASVGETVTITC")
+    assert len(fasta) == len(fasta.values["sequence"]) == 561
+    mass = calc_peptide_mw(antibody)
+    assert mass.values["residues"] == 561
+    assert mass.values["mass"] == pytest.approx(61306.0, abs=0.1)
+
+def test_end_to_end_distance(antibody):
+    ca_atoms = antibody.select(name="CA", record="ATOM")
+    expected = np.linalg.norm(antibody.coords[ca_atoms[0]] - antibody.coords[ca_atoms[-1]])
+    result = end_to_end_dist(antibody, pml_file=None)
+    assert result.values["distance"] == pytest.approx(expected, abs=1e-3)
+    assert result.pairs().tolist() == [[ca_atoms[0], ca_atoms[-1]]]
+
+def _bonds(rules, structure):
+    '''
+    This function will match the rules against the neighbor pairs of a structure
+    '''
+    model, first, second, distance = model_pairs(structure, rules.atoms, rules.cutoff)
+    pairs = np.column_stack((rules.atoms[first], rules.atoms[second]))
+    return {kind: len(found[0]) for kind, found in rules.match(pairs, distance, model).items()}
+
+def test_empty_rule_set_finds_no_pairs(dna):
+    rules = BasePairRules(dna, rules=())
+    assert rules.cutoff == 0.0
+    assert _bonds(rules, dna) == {"WC": 0, "nWC": 0}
+
+def test_filtered_rule_set_keeps_its_kind(dna):
+    watson_crick = tuple(rule for rule in BASE_PAIR_RULES if rule[0] == "WC")
+    assert _bonds(BasePairRules(dna, rules=watson_crick), dna)["WC"] == 36
+    assert _bonds(BasePairRules(dna), dna)["WC"] == 36
+
+def test_rule_table_matches_each_rule_by_brute_force(dna):
+    rules = BasePairRules(dna)
+    model, first, second, distance = model_pairs(dna, rules.atoms, rules.cutoff)
+    pairs = np.column_stack((rules.atoms[first], rules.atoms[second]))
+    found = set()
+    for rule, bonds, _ in rules.match(pairs, distance, model).values():
+        found.update(zip(rule.tolist(), map(tuple, bonds.tolist())))
+    # Every rule checked on its own against every pair of its atom types
+    expected = set()
+    for number, (kind, type1, type2) in enumerate(BASE_PAIR_RULES):
+        atoms1, atoms2 = [dna.select(resn=[resn for resn in set(dna.resn.tolist())
+                                           if resn.endswith(BASE_ATOM_TYPES[name][0])],
+                                     name=BASE_ATOM_TYPES[name][1], record="ATOM")
+                          for name in (type1, type2)]
+        lower, upper = BASE_PAIR_RANGES[kind]
+        apart = np.linalg.norm(dna.coords[atoms1][:, np.newaxis]
+                               - dna.coords[atoms2][np.newaxis], axis=2)
+        expected.update((number, (int(atoms1[i]), int(atoms2[j])))
+                        for i, j in zip(*np.nonzero((apart > lower) & (apart < upper))))
+    assert found == expected
+    assert len(found) == 36
+
+def test_wc_nwc_result(dna):
+    result = calc_wc_nwc(dna, pml_file=None)
+    assert result.values["wc"] == 36 and result.values["nwc"] == 0
+    pairs = result.pairs("WC")
+    distance = np.linalg.norm(dna.coords[pairs[:, 0]] - dna.coords[pairs[:, 1]], axis=1)
+    assert np.all((distance > 2.0) & (distance < 3.2))
+
+def test_disulfides_match_brute_force(antibody):
+    sulfur = antibody.select(resn="CYS", name="SG", record="ATOM")
+    distance = np.linalg.norm(antibody.coords[sulfur][:, np.newaxis]
+                              - antibody.coords[sulfur][np.newaxis], axis=2)
+    first, second = np.nonzero(np.triu((distance > 1.95) & (distance < 2.05), 1))
+    expected = {frozenset(pair) for pair in zip(sulfur[first].tolist(), sulfur[second].tolist())}
+    result = calc_disulfide(antibody, pml_file=None)
+    assert result.values == {"cysteines": 18, "bonds": 9}
+    assert {frozenset(pair) for pair in result.pairs().tolist()} == expected
+    assert np.all(result.records.occupancy == 1.0)
+
+def _cancel_at(message):
+    '''
+    This function will make a progress callback that records every report
+    and cancels the analysis at the first report of a message
+    '''
+    reports = []
+    def progress(fraction, text):
+        reports.append((fraction, text))
+        if text == message:
+            raise AnalysisCancelled()
+    return progress, reports
+
+@pytest.mark.parametrize("analysis,filename", [
+    (calc_disulfide, "1fdl.pdb"), (calc_wc_nwc, "1bhm.pdb"), (alpha_helice, "1fdl.pdb"),
+    (calc_hbonds, "1kx5.pdb"), (calc_contacts, "1kx5.pdb"),
+])
+def test_cancel_inside_the_neighbor_search(analysis, filename):
+    structure = read_structure(os.path.join(PDB_FILES, filename))
+    progress, reports = _cancel_at("Searching neighbor cells")
+    with pytest.raises(AnalysisCancelled):
+        analysis(structure, pml_file=None, progress=progress)
+    assert reports[-1][1] == "Searching neighbor cells"
+    fractions = [fraction for fraction, _ in reports]
+    assert fractions == sorted(fractions) and 0.0 <= fractions[-1] < 1.0
+
+def test_progress_runs_to_the_end(antibody):
+    progress, reports = _cancel_at(None)
+    calc_disulfide(antibody, pml_file=None, progress=progress)
+    fractions = [fraction for fraction, _ in reports]
+    assert fractions == sorted(fractions) and fractions[-1] == 1.0
+
+def test_scaled_progress():
+    reports = []
+    stage = scaled_progress(lambda fraction, text: reports.append((fraction, text)), 0.4, 0.8)
+    stage(0.0, "a")
+    stage(0.5, "b")
+    stage(1.0, "c")
+    assert reports == [(0.4, "a"), (pytest.approx(0.6), "b"), (pytest.approx(0.8), "c")]
+    assert scaled_progress(None, 0.0, 1.0) is None
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+from conftest import PDB_FILES
+from structure_miv import Structure, read_structure, structure_from_pymol
+from contact_miv import METAL_ELEMENTS, find_contacts
+
+@pytest.fixture(scope="module")
+def nucleosome():
+    return read_structure(os.path.join(PDB_FILES, "1kx5.pdb"))
+
+class _PymolObject:
+    '''
+    This class answers the pymol cmd calls of structure_from_pymol from a
+    Structure, writing element symbols in title case as PyMOL does
+    '''
+    def __init__(self, structure):
+        self.structure = structure
+
+    def iterate(self, selection, expression, space):
+        structure = self.structure
+        for atom in range(len(structure)):
+            space["atoms"].append((structure.record[atom], structure.name[atom],
+                                   structure.resn[atom], structure.chain[atom],
+                                   structure.resi[atom], int(structure.resv[atom]),
+                                   structure.element[atom].title()))
+
+    def get_coords(self, selection, state):
+        return self.structure.coords
+
+    def count_states(self, selection):
+        return 1
+
+def test_contact_counts(nucleosome):
+    contacts = find_contacts(nucleosome)
+    assert dict(contacts.counts()) == {"salt_bridge": 77, "pi_stacking": 4,
+                                       "hydrophobic": 209, "metal": 15}
+    for kind, cutoff in (("salt_bridge", 4.0), ("hydrophobic", 4.0), ("metal", 3.0)):
+        atoms = contacts.atoms[contacts.of_kind(kind)]
+        distances = np.linalg.norm(nucleosome.coords[atoms[:, 0]]
+                                   - nucleosome.coords[atoms[:, 1]], axis=1)
+        assert np.all(distances <= cutoff)
+        assert np.allclose(distances, contacts.distances[contacts.of_kind(kind)], atol=1e-4)
+
+def test_interchain_contacts_cross_chains(nucleosome):
+    contacts = find_contacts(nucleosome)
+    salt = contacts.atoms[contacts.of_kind("salt_bridge")]
+    assert np.all(nucleosome.chain[salt[:, 0]] != nucleosome.chain[salt[:, 1]])
+    everything = find_contacts(nucleosome, interchain=False)
+    assert everything.counts()["salt_bridge"] > contacts.counts()["salt_bridge"]
+
+def test_metals_list_the_ion_first(nucleosome):
+    contacts = find_contacts(nucleosome)
+    metal = contacts.atoms[contacts.of_kind("metal")]
+    assert np.all(np.isin(nucleosome.element[metal[:, 0]], METAL_ELEMENTS))
+
+def test_pymol_element_case_keeps_metal_contacts(nucleosome):
+    loaded = structure_from_pymol(_PymolObject(nucleosome), "1kx5", "1kx5.pdb")
+    assert "MN" in loaded.element.tolist()
+    assert find_contacts(loaded).counts() == find_contacts(nucleosome).counts()
+
+def test_selenomethionine_is_hydrophobic():
+    # The SE of an MSE (HETATM) of chain A 3.8 angstroms from the CB of an ALA of chain B
+    structure = Structure(record=np.array(["HETATM"] * 3 + ["ATOM"]),
+                          name=np.array(["CG", "SE", "CE", "CB"]),
+                          resn=np.array(["MSE"] * 3 + ["ALA"]),
+                          chain=np.array(["A"] * 3 + ["B"]), resi=np.array(["1"] * 3 + ["2"]),
+                          resv=np.array([1] * 3 + [2]), element=np.array(["C", "SE", "C", "C"]),
+                          coords=np.array([[-1.5, 1.0, 0.0], [0.0, 0.0, 0.0], [1.2, 1.4, 0.0],
+                                           [0.0, -3.8, 0.0]]))
+    contacts = find_contacts(structure)
+    assert contacts.atoms[contacts.of_kind("hydrophobic")].tolist() == [[1, 3]]
@@ -0,0 +1,36 @@
+import io
+import os
+from conftest import PDB_FILES
+from structure_miv import load_structure, parse_pdb_stream
+from dssp_miv import assign_secondary_structure
+
+def _chain_codes(filename, chain):
+    '''
+    This function will return the residue numbers and DSSP codes of one chain
+    '''
+    structure = load_structure(os.path.join(PDB_FILES, filename))
+    secondary = assign_secondary_structure(structure)
+    in_chain = structure.chain[secondary.atoms] == chain
+    return structure.resi[secondary.atoms][in_chain].astype(int), secondary.codes[in_chain]
+
+def test_minimal_helices_start_at_second_turn():
+    # 1njg chain A has 4-turns at 21-31, which DSSP assigns as H 22-34
+    resi, codes = _chain_codes("1njg.pdb", "A")
+    window = (resi >= 15) & (resi <= 40)
+    assert resi[window & (codes == "H")].tolist() == list(range(22, 35))
+
+def test_helices_lie_inside_deposited_helix_records():
+    helices = []
+    with open(os.path.join(PDB_FILES, "1njg.pdb"), encoding="utf8") as pdb:
+        for line in pdb:
+            if line.startswith("HELIX"):
+                helices.append((line[19], int(line[21:25]), int(line[33:37])))
+    for chain in "AB":
+        resi, codes = _chain_codes("1njg.pdb", chain)
+        for number in resi[codes == "H"]:
+            assert any(helix_chain == chain and first <= number <= last
+                       for helix_chain, first, last in helices), (chain, number)
+
+def test_empty_structure_has_no_residues():
+    secondary = assign_secondary_structure(parse_pdb_stream(io.BytesIO(b"")))
+    assert len(secondary) == 0
@@ -0,0 +1,63 @@
+from emit_miv import PymolScript
+
+class _RecordingCmd:
+    '''
+    This class stands in for the pymol cmd module, recording every call
+    '''
+    def __init__(self, objects=()):
+        self.objects = list(objects)
+        self.calls = []
+
+    def get_names(self, kind):
+        return list(self.objects)
+
+    def __getattr__(self, command):
+        def call(*args, **kwargs):
+            self.calls.append((command, args, kwargs))
+        return call
+
+def _script():
+    '''
+    This function will record a small analysis script
+    '''
+    script = PymolScript()
+    script.load("PDB_Files/1fdl.pdb", "1fdl")
+    script.remove("resn hoh")
+    script.show("sticks", "/1fdl//H/CYS`22")
+    script.show("sticks", "/1fdl//H/CYS`95")
+    script.color("yellow", "/1fdl//H/CYS`22/SG")
+    script.dist("disulfide", "/1fdl//H/CYS`22/SG", "/1fdl//H/CYS`95/SG")
+    script.alter("1fdl", "b = coverage.get(int(resv), 0.0)", {"coverage": {22: 2.0}})
+    return script
+
+def test_pml_text():
+    assert _script().to_pml().splitlines() == [
+        "load PDB_Files/1fdl.pdb",
+        "remove resn hoh",
+        "show sticks, /1fdl//H/CYS`22",
+        "show sticks, /1fdl//H/CYS`95",
+        "color yellow, /1fdl//H/CYS`22/SG",
+        "dist disulfide, /1fdl//H/CYS`22/SG, /1fdl//H/CYS`95/SG",
+        "python",
+        "cmd.alter('1fdl', 'b = coverage.get(int(resv), 0.0)', space={'coverage': {22: 2.0}})",
+        "python end",
+    ]
+
+def test_batched_merges_runs_of_the_same_command():
+    batched = _script().batched()
+    assert batched[2] == ("show", ("sticks", "(/1fdl//H/CYS`22) or (/1fdl//H/CYS`95)"))
+    assert batched[3] == ("color", ("yellow", "/1fdl//H/CYS`22/SG"))
+    assert len(batched) == len(_script()) - 1
+
+def test_apply_loads_missing_objects_once():
+    cmd = _RecordingCmd()
+    _script().apply(cmd)
+    commands = [command for command, _, _ in cmd.calls]
+    assert commands == ["set", "load", "remove", "show", "color", "distance", "alter", "set"]
+    assert cmd.calls[-2][2] == {"space": {"coverage": {22: 2.0}}}
+    assert cmd.calls[0][1] == ("suspend_updates", 1) and cmd.calls[-1][1] == ("suspend_updates", 0)
+
+def test_apply_reuses_a_loaded_object():
+    cmd = _RecordingCmd(["1fdl"])
+    _script().apply(cmd)
+    assert "load" not in [command for command, _, _ in cmd.calls]
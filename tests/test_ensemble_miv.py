@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import pytest
+from conftest import PDB_FILES
+from structure_miv import read_structure
+from calc_miv import calc_disulfide, end_to_end_dist
+
+def _atom_lines(filename):
+    '''
+    This function will read the ATOM and HETATM lines of a PDB file
+    '''
+    with open(os.path.join(PDB_FILES, filename), encoding="utf8") as pdb:
+        return [line for line in pdb if line.startswith(("ATOM", "HETATM"))]
+
+def _moved(line, shift):
+    '''
+    This function will move the x coordinate of an atom line
+    '''
+    return line[:30] + "{:8.3f}".format(float(line[30:38]) + shift) + line[38:]
+
+def _ensemble(tmp_path, models):
+    '''
+    This function will write models of atom lines as one multi-model PDB file
+    '''
+    lines = []
+    for number, atoms in enumerate(models, 1):
+        lines += ["MODEL     {:>4}\n".format(number)] + atoms + ["ENDMDL\n"]
+    filename = str(tmp_path / "ensemble.pdb")
+    with open(filename, "w", encoding="utf8") as pdb:
+        pdb.writelines(lines + ["END\n"])
+    return filename
+
+@pytest.fixture(scope="module")
+def atoms():
+    return _atom_lines("1fdl.pdb")
+
+def test_models_share_one_topology(tmp_path, atoms):
+    shifted = [_moved(line, 1.0) for line in atoms]
+    structure = read_structure(_ensemble(tmp_path, [atoms, shifted, atoms[:-5]]))
+    # The model with missing atoms cannot share the topology and is dropped
+    assert structure.models.shape == (2, len(atoms), 3)
+    assert len(structure) == len(atoms)
+    assert np.allclose(structure.models[1, :, 0] - structure.models[0, :, 0], 1.0, atol=1e-3)
+    assert np.array_equal(structure.coords, structure.models[0])
+
+def test_bond_occupancy_and_per_model_distances(tmp_path, atoms):
+    structure = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    bonds = calc_disulfide(structure, pml_file=None).pairs()
+    broken = int(bonds[0, 0])
+    # In the second model one sulfur of the first bond moves away and the chain end moves
+    last = int(structure.select(name="CA", record="ATOM")[-1])
+    second = [_moved(line, 3.0) if index in (broken, last) else line
+              for index, line in enumerate(atoms)]
+    ensemble = read_structure(_ensemble(tmp_path, [atoms, second]))
+    result = calc_disulfide(ensemble, pml_file=None)
+    occupancy = dict(zip(map(tuple, result.pairs().tolist()), result.records.occupancy))
+    assert occupancy.pop(tuple(bonds[0].tolist())) == 0.5
+    assert set(occupancy.values()) == {1.0}
+    distances = end_to_end_dist(ensemble, pml_file=None).records
+    assert distances.model.tolist() == [0, 1]
+    assert distances.value[0] != pytest.approx(distances.value[1])
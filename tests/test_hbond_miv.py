@@ -0,0 +1,99 @@
+import os
+import numpy as np
+import pytest
+from conftest import PDB_FILES
+from structure_miv import Structure, read_structure
+from hbond_miv import (HBOND_ACCEPTORS, HBOND_DONORS, SP2, find_hbonds, place_hydrogens,
+                       select_table)
+
+@pytest.fixture(scope="module")
+def nucleosome():
+    return read_structure(os.path.join(PDB_FILES, "1kx5.pdb"))
+
+def _angles(structure, bonds):
+    '''
+    This function will compute the donor-hydrogen...acceptor angle of every H-bond
+    '''
+    to_donor = structure.coords[bonds.donors] - bonds.hydrogens
+    to_acceptor = structure.coords[bonds.acceptors] - bonds.hydrogens
+    cosine = (to_donor * to_acceptor).sum(axis=1) / (
+        np.linalg.norm(to_donor, axis=1) * np.linalg.norm(to_acceptor, axis=1))
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+def test_interface_hbonds_meet_the_geometry(nucleosome):
+    bonds = find_hbonds(nucleosome)
+    assert len(bonds) == 645
+    donors, _ = select_table(nucleosome, HBOND_DONORS)
+    acceptors, _ = select_table(nucleosome, HBOND_ACCEPTORS)
+    assert np.all(np.isin(bonds.donors, donors)) and np.all(np.isin(bonds.acceptors, acceptors))
+    assert np.all(nucleosome.chain[bonds.donors] != nucleosome.chain[bonds.acceptors])
+    distance = np.linalg.norm(nucleosome.coords[bonds.donors]
+                              - nucleosome.coords[bonds.acceptors], axis=1)
+    assert np.allclose(bonds.distances, distance, atol=1e-4)
+    assert np.all(bonds.distances <= 3.5)
+    assert np.all(bonds.angles >= 120.0)
+    assert np.allclose(bonds.angles, _angles(nucleosome, bonds), atol=1e-3)
+    assert np.allclose(np.linalg.norm(bonds.hydrogens - nucleosome.coords[bonds.donors],
+                                      axis=1), 1.0, atol=1e-3)
+    pairs = bonds.pairs()
+    assert pairs.tolist() == sorted(pairs.tolist())
+
+def test_stricter_criteria_keep_a_subset(nucleosome):
+    every = set(map(tuple, find_hbonds(nucleosome, interchain=False).pairs().tolist()))
+    interface = set(map(tuple, find_hbonds(nucleosome).pairs().tolist()))
+    strict = find_hbonds(nucleosome, distance=3.0, angle=150.0)
+    assert interface < every
+    assert set(map(tuple, strict.pairs().tolist())) < interface
+    assert np.all(strict.distances <= 3.0) and np.all(strict.angles >= 150.0)
+
+def test_amide_hydrogens_point_away_from_the_bonded_atoms():
+    antibody = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    # The backbone N of the residues after the first of chain L, prolines left out
+    donors = antibody.select(name="N", chain="L", record="ATOM")[1:40]
+    donors = donors[antibody.resn[donors] != "PRO"]
+    hydrogens, neighbors = place_hydrogens(antibody, donors, np.full(len(donors), SP2))
+    assert np.all(neighbors >= 0)
+    assert np.all(np.isnan(hydrogens[:, 1]))
+    to_hydrogen = hydrogens[:, 0] - antibody.coords[donors]
+    assert np.allclose(np.linalg.norm(to_hydrogen, axis=1), 1.0, atol=1e-3)
+    # In the plane of C-N-CA and about 120 degrees from both bonds
+    for donor, toward in zip(donors, to_hydrogen):
+        bonded = antibody.coords - antibody.coords[donor]
+        length = np.linalg.norm(bonded, axis=1)
+        bonded = bonded[(length > 0) & (length < 1.9)]
+        assert len(bonded) == 2
+        cosine = bonded @ toward / np.linalg.norm(bonded, axis=1)
+        assert np.all((np.degrees(np.arccos(cosine)) > 110.0)
+                      & (np.degrees(np.arccos(cosine)) < 130.0))
+        assert abs(np.linalg.det(np.vstack((bonded, toward)))) < 1e-3
+
+def test_structure_without_acceptors_has_no_hbonds(nucleosome):
+    carbons = nucleosome.select(element="C")
+    fields = {field: getattr(nucleosome, field)[carbons] for field, _ in Structure.FIELDS}
+    structure = Structure(coords=nucleosome.coords[carbons], **fields)
+    assert len(find_hbonds(structure)) == 0
+
+def _serine_to(resn, record, name, element):
+    '''
+    This function will build a serine of chain B whose OG hydroxyl points at
+    the chalcogen of a methionine-like residue of chain A
+    '''
+    tilt = np.radians(180.0 - 109.5)
+    coords = np.array([
+        [-1.5, 1.0, 0.0], [0.0, 0.0, 0.0], [1.2, 1.4, 0.0],
+        [3.2 + 1.43 * np.cos(tilt), 1.43 * np.sin(tilt), 0.0], [3.2, 0.0, 0.0]])
+    return Structure(record=np.array([record] * 3 + ["ATOM"] * 2),
+                     name=np.array(["CG", name, "CE", "CB", "OG"]),
+                     resn=np.array([resn] * 3 + ["SER"] * 2),
+                     chain=np.array(["A"] * 3 + ["B"] * 2),
+                     resi=np.array(["1"] * 3 + ["2"] * 2), resv=np.array([1] * 3 + [2] * 2),
+                     element=np.array(["C", element, "C", "C", "O"]), coords=coords)
+
+@pytest.mark.parametrize("resn,record,name,element", [
+    ("MET", "ATOM", "SD", "S"), ("MSE", "HETATM", "SE", "SE")])
+def test_methionine_and_selenomethionine_accept(resn, record, name, element):
+    structure = _serine_to(resn, record, name, element)
+    bonds = find_hbonds(structure)
+    assert bonds.pairs().tolist() == [[4, 1]]
+    assert bonds.distances[0] == pytest.approx(3.2)
+    assert bonds.angles[0] == pytest.approx(180.0, abs=0.1)
@@ -0,0 +1,107 @@
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from conftest import ROOT
+from modelstore_miv import ModelStore, model_files
+
+@pytest.fixture(scope="module")
+def model_data():
+    with open(os.path.join(ROOT, "AF-P22626-F1.pdb"), "rb") as pdb:
+        return pdb.read()
+
+@pytest.fixture
+def store(tmp_path):
+    store = ModelStore(str(tmp_path / "cache"), base_url="http://127.0.0.1:9/files")
+    yield store
+    store.close()
+
+@pytest.fixture
+def server(tmp_path, model_data):
+    '''
+    This function will serve a folder with one model, an error page named as
+    a model and a PAE file over HTTP on the local machine
+    '''
+    folder = tmp_path / "served"
+    folder.mkdir()
+    (folder / "AF-P22626-F1-model_v4.pdb").write_bytes(model_data)
+    (folder / "AF-P22626-F1-predicted_aligned_error_v4.json").write_text('[{"pae": []}]')
+    (folder / "AF-BROKEN-F1-model_v4.pdb").write_text("<html>Not here</html>")
+    handler = partial(_QuietHandler, directory=str(folder))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    '''
+    This class serves files without logging every request
+    '''
+    def log_message(self, *args):
+        pass
+
+def test_model_files():
+    assert model_files("AF-P22626-F1") == [
+        "AF-P22626-F1-model_v4.pdb", "AF-P22626-F1-predicted_aligned_error_v4.json"]
+    assert model_files("AF-P22626-F1", version="v3", pae=False) == [
+        "AF-P22626-F1-model_v3.pdb"]
+
+def test_put_stores_contents_once(store, model_data):
+    name = "AF-P22626-F1-model_v4.pdb"
+    assert store.path(name) is None and not store.verify(name)
+    path = store.put(name, model_data)
+    assert store.path(name) == path and store.verify(name)
+    # The same contents under another name share the stored object
+    assert store.put("P22626.pdb", model_data) == path
+    with open(path, "rb") as cached:
+        assert cached.read() == model_data
+    assert not os.listdir(os.path.join(store.cache_dir, "tmp"))
+
+def test_verify_finds_changed_contents(store, model_data):
+    path = store.put("AF-P22626-F1-model_v4.pdb", model_data)
+    with open(path, "ab") as cached:
+        cached.write(b"REMARK changed\n")
+    assert not store.verify("AF-P22626-F1-model_v4.pdb")
+
+@pytest.mark.parametrize("name,data", [
+    ("empty.pdb", b""),
+    ("page.pdb", b"<html>Not found</html>"),
+    ("cut.pdb", b"ATOM      1  N   MET A   1     -55.432  -7.842 -14.794"),
+    ("page.cif", b"data_page\n"),
+    ("pae.json", b"[{"),
+])
+def test_put_rejects_bad_contents(store, name, data):
+    with pytest.raises(ValueError):
+        store.put(name, data)
+    assert store.path(name) is None
+
+def test_export(store, model_data, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        store.export("AF-P22626-F1-model_v4.pdb", str(tmp_path / "model.pdb"))
+    store.put("AF-P22626-F1-model_v4.pdb", model_data)
+    destination = str(tmp_path / "model.pdb")
+    open(destination, "w", encoding="utf8").close()
+    assert store.export("AF-P22626-F1-model_v4.pdb", destination) == destination
+    with open(destination, "rb") as exported:
+        assert exported.read() == model_data
+
+def test_fetch_models_from_local_server(tmp_path, server, model_data):
+    store = ModelStore(str(tmp_path / "cache"), base_url=server, max_connections=2, retries=0)
+    try:
+        paths, errors = store.fetch_models(["AF-P22626-F1", "AF-BROKEN-F1", "AF-MISSING-F1"])
+        pdb, pae = paths["AF-P22626-F1"]
+        with open(pdb, "rb") as cached:
+            assert cached.read() == model_data
+        assert pae is not None and store.verify("AF-P22626-F1-predicted_aligned_error_v4.json")
+        assert paths["AF-BROKEN-F1"][0] is None
+        assert "no ATOM records" in errors["AF-BROKEN-F1-model_v4.pdb"]
+        assert "HTTP 404" in errors["AF-MISSING-F1-model_v4.pdb"]
+    finally:
+        store.close()
+    # Cached files are returned without asking a server again
+    offline = ModelStore(store.cache_dir, base_url="http://127.0.0.1:9/", retries=0)
+    paths, errors = offline.fetch(["AF-P22626-F1-model_v4.pdb"])
+    assert paths == {"AF-P22626-F1-model_v4.pdb": pdb} and not errors
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from neighbor_miv import CellList, find_pairs, spread_models
+
+def _brute_pairs(coords1, coords2, cutoff):
+    '''
+    This function will list every (i, j) pair closer than the cutoff by checking all of them
+    '''
+    distance = np.linalg.norm(coords1[:, np.newaxis] - coords2[np.newaxis], axis=2)
+    return {(int(i), int(j)) for i, j in zip(*np.nonzero(distance < cutoff))}
+
+@pytest.fixture
+def coords():
+    return np.random.default_rng(7).uniform(0.0, 20.0, size=(400, 3))
+
+def test_self_pairs_match_brute_force(coords):
+    first, second, distance = find_pairs(coords, cutoff=3.2)
+    expected = {(i, j) for i, j in _brute_pairs(coords, coords, 3.2) if i < j}
+    assert set(zip(first.tolist(), second.tolist())) == expected
+    assert np.all(first < second)
+    assert np.allclose(distance, np.linalg.norm(coords[first] - coords[second], axis=1))
+
+def test_query_pairs_match_brute_force(coords):
+    other = np.random.default_rng(8).uniform(-2.0, 22.0, size=(150, 3))
+    first, second, _ = find_pairs(other, coords, cutoff=2.5)
+    assert set(zip(first.tolist(), second.tolist())) == _brute_pairs(other, coords, 2.5)
+
+def test_sparse_grid_searches_sorted_keys():
+    # Two far apart clusters give a grid too sparse for a dense start table
+    rng = np.random.default_rng(9)
+    coords = np.concatenate((rng.uniform(0, 5, (50, 3)), rng.uniform(5000, 5005, (50, 3))))
+    cell_list = CellList(coords, 2.0)
+    assert cell_list.cell_starts is None
+    first, second, _ = cell_list.query_pairs()
+    expected = {(i, j) for i, j in _brute_pairs(coords, coords, 2.0) if i < j}
+    assert set(zip(first.tolist(), second.tolist())) == expected
+
+def test_smaller_query_cutoff_and_empty_inputs(coords):
+    cell_list = CellList(coords, 4.0)
+    first, second, distance = cell_list.query_pairs(cutoff=2.0)
+    assert np.all(distance < 2.0)
+    assert len(first) == len(find_pairs(coords, cutoff=2.0)[0])
+    assert len(find_pairs(np.zeros((0, 3)), cutoff=3.0)[0]) == 0
+    assert len(CellList(coords, 3.0).query(np.zeros((0, 3)))[0]) == 0
+
+def test_spread_models_never_pairs_across_models(coords):
+    models = np.stack((coords[:100], coords[:100] + 0.1))
+    first, second, _ = find_pairs(spread_models(models, 3.2), cutoff=3.2)
+    assert np.all(first // 100 == second // 100)
+    single = find_pairs(coords[:100], cutoff=3.2)[0]
+    assert np.count_nonzero(first < 100) == len(single)
+
+@pytest.mark.parametrize("cutoff", [0.0, -1.0, float("nan"), float("inf")])
+def test_cell_list_rejects_cutoffs_without_a_grid(cutoff):
+    with pytest.raises(ValueError):
+        CellList(np.zeros((3, 3)), cutoff)
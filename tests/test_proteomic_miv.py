@@ -0,0 +1,190 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from conftest import ROOT
+from emit_miv import PymolScript
+from proteomic_miv import (map_site, map_structure, merge_intervals, read_psms,
+                           residue_coverage, structure_accession)
+
+def _brute_merge(protein_ids, starts, ends):
+    '''
+    This function will merge the intervals of every protein one interval at a time
+    '''
+    merged = []
+    for protein_id in sorted(set(protein_ids)):
+        spans = sorted((start, end) for name, start, end in zip(protein_ids, starts, ends)
+                       if name == protein_id)
+        current = None
+        for start, end in spans:
+            if current is not None and start <= current[2]:
+                current[2] = max(current[2], end)
+                current[3] += 1
+            else:
+                current = [protein_id, start, end, 1]
+                merged.append(current)
+    return [tuple(interval) for interval in merged]
+
+def _merged(protein_ids, starts, ends):
+    return list(zip(*(array.tolist() for array in merge_intervals(protein_ids, starts, ends))))
+
+def test_merge_intervals_edge_cases():
+    proteins, starts, ends, psms = merge_intervals([], [], [])
+    assert len(proteins) == len(starts) == len(ends) == len(psms) == 0
+    # One PSM, nested, overlapping, touching at one residue and adjacent but apart
+    assert _merged(["P1"], [5], [9]) == [("P1", 5, 9, 1)]
+    assert _merged(["P1"] * 2, [1, 3], [20, 5]) == [("P1", 1, 20, 2)]
+    assert _merged(["P1"] * 2, [10, 1], [15, 12]) == [("P1", 1, 15, 2)]
+    assert _merged(["P1"] * 2, [1, 5], [5, 9]) == [("P1", 1, 9, 2)]
+    assert _merged(["P1"] * 2, [1, 6], [5, 9]) == [("P1", 1, 5, 1), ("P1", 6, 9, 1)]
+
+def test_merge_intervals_keeps_proteins_apart():
+    # A long interval of one protein must not swallow the next protein's sites
+    proteins = ["P2", "P1", "P2", "P1", "P3"]
+    starts = [2, 1, 50, 80, 1]
+    ends = [10, 1000, 60, 90, 3]
+    assert _merged(proteins, starts, ends) == [
+        ("P1", 1, 1000, 2), ("P2", 2, 10, 1), ("P2", 50, 60, 1), ("P3", 1, 3, 1)]
+
+def test_merge_intervals_match_brute_force():
+    rng = np.random.default_rng(3)
+    proteins = rng.choice(["A", "B", "C", "D"], size=500)
+    starts = rng.integers(1, 2000, size=500)
+    ends = starts + rng.integers(0, 40, size=500)
+    assert _merged(proteins, starts, ends) == _brute_merge(
+        proteins.tolist(), starts.tolist(), ends.tolist())
+    # Integer protein codes merge the same way as names
+    codes = np.searchsorted(np.unique(proteins), proteins)
+    assert [interval[1:] for interval in _merged(codes, starts, ends)] == [
+        interval[1:] for interval in _brute_merge(proteins.tolist(), starts.tolist(),
+                                                  ends.tolist())]
+
+def test_residue_coverage():
+    covered, depth = residue_coverage([], [])
+    assert len(covered) == len(depth) == 0
+    covered, depth = residue_coverage([5], [5])
+    assert covered.tolist() == [5] and depth.tolist() == [1]
+    covered, depth = residue_coverage([3, 5, 10], [6, 5, 11])
+    assert covered.tolist() == [3, 4, 5, 6, 10, 11]
+    assert depth.tolist() == [1, 1, 2, 1, 1, 1]
+
+def test_residue_coverage_matches_brute_force():
+    rng = np.random.default_rng(4)
+    starts = rng.integers(1, 300, size=200)
+    ends = starts + rng.integers(0, 25, size=200)
+    counts = np.zeros(400, dtype=np.int64)
+    for start, end in zip(starts, ends):
+        counts[start:end + 1] += 1
+    covered, depth = residue_coverage(starts, ends)
+    assert covered.tolist() == np.flatnonzero(counts).tolist()
+    assert depth.tolist() == counts[counts > 0].tolist()
+
+def test_structure_accession():
+    assert structure_accession("AF-P22626-F1-model_v4.pdb") == "P22626"
+    assert structure_accession("/data/AF-Q9Y6K9-F2.cif.gz") == "Q9Y6K9"
+    assert structure_accession("P22626.pdb") == "P22626"
+
+@pytest.fixture
+def site_file(tmp_path):
+    '''
+    This function will write a psm csv file with sites of P22626, a protein
+    without a structure and a PSM without a protein site
+    '''
+    filename = str(tmp_path / "psms.csv")
+    with open(filename, "w", encoding="utf8") as csvfile:
+        csvfile.write("Peptide,Protein.Start,Protein.End,Protein.ID,Gene\n"
+                      "AAA,10,20,P22626,HNRNPA2B1\n"
+                      "BBB,15,30,P22626,HNRNPA2B1\n"
+                      "CCC,100,110,P22626,HNRNPA2B1\n"
+                      "DDD,5,9,Q00000,NONE\n"
+                      "EEE,,,P22626,HNRNPA2B1\n")
+    return filename
+
+def test_map_site_writes_table_and_scripts(site_file, tmp_path):
+    structure = str(tmp_path / "AF-P22626-F1.pdb")
+    shutil.copy(os.path.join(ROOT, "AF-P22626-F1.pdb"), structure)
+    output_dir = str(tmp_path / "out")
+    rows = map_site(site_file, structure, output_dir=output_dir, jobs=1)
+    assert sorted(row[:5] + row[6:] for row in rows) == [
+        ["P22626", 10, 30, 2, 21, "ok"], ["P22626", 100, 110, 1, 11, "ok"],
+        ["Q00000", 5, 9, 1, 0, "no structure"]]
+    with open(os.path.join(output_dir, "mapped_sites.tsv"), encoding="utf8") as table:
+        assert len(table.read().splitlines()) == 1 + len(rows)
+    with open(os.path.join(output_dir, "AF-P22626-F1_mapped_site.pml"), encoding="utf8") as pml:
+        script = pml.read()
+    assert "alter" in script and "spectrum b, white_red" in script
+
+def test_read_psms_types_and_cache(site_file, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    data = read_psms(site_file, cache_dir=cache_dir, chunk_rows=2)
+    # The PSM without a site is dropped and the unused Gene column is never read
+    assert list(data.columns) == ["Protein.ID", "Protein.Start", "Protein.End", "Peptide"]
+    assert data["Protein.ID"].tolist() == ["P22626", "P22626", "P22626", "Q00000"]
+    assert list(data["Protein.ID"].cat.categories) == ["P22626", "Q00000"]
+    assert str(data["Protein.Start"].dtype) == "Int32"
+    cached = os.listdir(cache_dir)
+    assert len(cached) == 1 and cached[0].endswith(".parquet")
+    # A second read comes from the cache, an edited file is read again
+    assert read_psms(site_file, cache_dir=cache_dir).equals(data)
+    with open(site_file, "a", encoding="utf8") as csvfile:
+        csvfile.write("FFF,1,4,Q00000,NONE\n")
+    assert len(read_psms(site_file, cache_dir=cache_dir)) == 5
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_read_psms_without_sites(tmp_path):
+    filename = str(tmp_path / "empty.csv")
+    with open(filename, "w", encoding="utf8") as csvfile:
+        csvfile.write("Peptide,Protein.Start,Protein.End,Protein.ID\n")
+    data = read_psms(filename, cache_dir=str(tmp_path / "cache"))
+    assert len(data) == 0
+    assert list(data.columns) == ["Protein.ID", "Protein.Start", "Protein.End", "Peptide"]
+
+class _Cmd:
+    '''
+    This class stands in for the pymol cmd module with the structure already
+    loaded, recording every call
+    '''
+    def __init__(self, *objects):
+        self.objects = list(objects)
+        self.calls = []
+
+    def get_names(self, kind):
+        return list(self.objects)
+
+    def __getattr__(self, command):
+        def call(*args, **kwargs):
+            self.calls.append((command, args, kwargs))
+        return call
+
+def test_map_structure_colors_by_coverage(site_file, tmp_path):
+    structure = str(tmp_path / "AF-P22626-F1.pdb")
+    shutil.copy(os.path.join(ROOT, "AF-P22626-F1.pdb"), structure)
+    fractions = []
+    script = PymolScript()
+    rows = map_structure(structure, site_file, progress=lambda done, _: fractions.append(done),
+                         script=script)
+    assert [row[1:5] for row in rows] == [[10, 30, 2, 21], [100, 110, 1, 11]]
+    assert fractions[0] == 0.0 and fractions[-1] == 1.0 and fractions == sorted(fractions)
+    # Without an output folder nothing is written next to the structure
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".pml")]
+
+    cmd = _Cmd("AF-P22626-F1")
+    script.apply(cmd)
+    commands = [call[0] for call in cmd.calls if call[0] != "set"]
+    assert commands == ["remove", "alter", "spectrum"]
+    _, (selection, expression), kwargs = cmd.calls[2]
+    coverage = kwargs["space"]["coverage"]
+    assert (selection, expression) == ("AF-P22626-F1", "b = coverage.get(int(resv), 0.0)")
+    expected = {residue: 1.0 for residue in list(range(10, 31)) + list(range(100, 111))}
+    expected.update({residue: 2.0 for residue in range(15, 21)})
+    assert coverage == expected
+    assert cmd.calls[3][1] == ("b", "white_red", "AF-P22626-F1", 0, 2)
+
+def test_map_structure_without_psms(site_file, tmp_path, capsys):
+    structure = str(tmp_path / "P69905.pdb")
+    shutil.copy(os.path.join(ROOT, "AF-P22626-F1.pdb"), structure)
+    output_dir = str(tmp_path / "out")
+    os.makedirs(output_dir)
+    assert map_structure(structure, site_file, output_dir=output_dir) == []
+    assert "No PSMs of P69905" in capsys.readouterr().out
+    assert os.listdir(output_dir) == ["P69905_mapped_site.pml"]
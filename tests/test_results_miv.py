@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import PDB_FILES
+import results_miv
+from structure_miv import read_structure
+from calc_miv import calc_disulfide, calc_peptide_mw, calc_wc_nwc, end_to_end_dist
+from results_miv import (EXPORT_COLUMNS, RECORD_DTYPE, AnalysisResult, ResultWriter,
+                         export_results)
+from batch_miv import run_batch
+
+# Exported columns holding text
+TEXT_COLUMNS = ("structure", "analysis") + tuple(
+    name for name in RECORD_DTYPE.names if RECORD_DTYPE[name].kind == "U")
+
+@pytest.fixture(scope="module")
+def results():
+    '''
+    This function will run analyses with interaction, value and residue records
+    '''
+    antibody = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    dna = read_structure(os.path.join(PDB_FILES, "1bhm.pdb"))
+    return [calc_disulfide(antibody, pml_file=None), end_to_end_dist(antibody, pml_file=None),
+            calc_peptide_mw(antibody), calc_wc_nwc(dna, pml_file=None),
+            AnalysisResult("empty", "none", [])]
+
+def _read(filename, fmt):
+    '''
+    This function will read an exported file back with pandas
+    '''
+    if fmt == "jsonl":
+        return pd.read_json(filename, lines=True, dtype=False)
+    if fmt == "csv":
+        return pd.read_csv(filename, keep_default_na=False, na_values=[""],
+                           dtype={"resi1": str, "resi2": str})
+    return pd.read_parquet(filename)
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv", "parquet"])
+def test_round_trip(results, tmp_path, fmt, monkeypatch):
+    # A small buffer writes the Parquet file as several row groups
+    monkeypatch.setattr(results_miv, "_PARQUET_ROWS", 5)
+    filename = str(tmp_path / "results.{}".format(fmt))
+    rows = export_results(results, filename)
+    assert rows == sum(len(result) for result in results) == 9 + 1 + 1 + 36
+    data = _read(filename, fmt)
+    assert tuple(data.columns) == EXPORT_COLUMNS
+    assert len(data) == rows
+    assert data["analysis"].tolist() == (["disulfide"] * 9 + ["end_to_end"] + ["mw"]
+                                         + ["wc_nwc"] * 36)
+    records = np.concatenate([result.records for result in results])
+    assert data["index1"].tolist() == records["index1"].tolist()
+    assert data["resi2"].fillna("").astype(str).tolist() == records["resi2"].tolist()
+    assert np.allclose(data["value"].to_numpy(float), records["value"], equal_nan=True)
+    # Missing numbers are written as empty values, not as text
+    assert data["angle"].isna().all()
+
+def _columns(data):
+    '''
+    This function will turn an exported table into lists of text and of
+    rounded numbers per column, with missing values made comparable
+    '''
+    return {column: (data[column].fillna("").astype(str).tolist()
+                     if column in TEXT_COLUMNS else
+                     np.nan_to_num(data[column].to_numpy(float), nan=-1.0).round(4).tolist())
+            for column in EXPORT_COLUMNS}
+
+def test_formats_agree(results, tmp_path):
+    tables = []
+    for fmt in ("jsonl", "csv", "parquet"):
+        filename = str(tmp_path / "results.{}".format(fmt))
+        export_results(results, filename)
+        tables.append(_columns(_read(filename, fmt)))
+    assert tables[0] == tables[1] == tables[2]
+
+def test_empty_parquet_keeps_the_columns(tmp_path):
+    filename = str(tmp_path / "empty.parquet")
+    assert export_results([], filename) == 0
+    data = pd.read_parquet(filename)
+    assert tuple(data.columns) == EXPORT_COLUMNS and len(data) == 0
+
+def test_writer_format_from_name(tmp_path):
+    with ResultWriter(str(tmp_path / "rows.txt"), fmt="csv") as writer:
+        assert writer.fmt == "csv"
+    with pytest.raises(ValueError):
+        ResultWriter(str(tmp_path / "rows.xlsx"))
+
+def test_batch_export(tmp_path):
+    output_dir = str(tmp_path / "out")
+    run_batch([os.path.join(PDB_FILES, "1fdl.pdb")], ["disulfide", "mw"], output_dir, jobs=1,
+              export="records.csv")
+    data = pd.read_csv(os.path.join(output_dir, "records.csv"))
+    assert data.groupby("analysis").size().to_dict() == {"disulfide": 9, "mw": 1}
+    assert set(data["structure"]) == {"1fdl"}
@@ -0,0 +1,35 @@
+import json
+import os
+import pstats
+import time
+from conftest import PDB_FILES
+from calc_miv import calc_disulfide
+from stats_miv import AnalysisStats, run_instrumented
+
+def test_stages_add_up_and_counters_sum():
+    stats = AnalysisStats("test")
+    stats.start("parse")
+    time.sleep(0.01)
+    stats.start("distance")
+    stats.count("pairs_evaluated", 5)
+    stats.start("parse")
+    stats.count("pairs_evaluated", 2)
+    stats.count("atoms_scanned")
+    stats.stop()
+    assert list(stats.stages) == ["parse", "distance"]
+    assert stats.stages["parse"] >= 0.01
+    assert stats.total_seconds == sum(stats.stages.values())
+    assert stats.counters == {"pairs_evaluated": 7, "atoms_scanned": 1}
+
+def test_run_instrumented_writes_stats_and_profile(tmp_path, capsys):
+    json_file, profile_file = str(tmp_path / "stats.json"), str(tmp_path / "run.prof")
+    result, stats = run_instrumented(calc_disulfide, os.path.join(PDB_FILES, "1fdl.pdb"),
+                                     json_file, profile_file, pml_file=None)
+    assert result.values["bonds"] == 9
+    with open(json_file, encoding="utf8") as statsfile:
+        saved = json.load(statsfile)
+    assert saved["analysis"] == "calc_disulfide"
+    assert saved["counters"] == stats.counters and saved["counters"]["atoms_selected"] == 18
+    assert {"filter", "distance", "print"} <= set(saved["stages"])
+    assert pstats.Stats(profile_file).total_calls > 0
+    assert "CYS" in capsys.readouterr().out
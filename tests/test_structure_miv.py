@@ -0,0 +1,338 @@
+import gzip
+import io
+import os
+import re
+import shutil
+import numpy as np
+import pytest
+from conftest import PDB_FILES
+from structure_miv import (StructureCache, load_structure, parse_pdb, parse_pdb_stream,
+                           parse_cif_text, read_structure, _hybrid36)
+
+def _atom_line(resseq="   1", x="  11.104"):
+    '''
+    This function will return a real ATOM record with its resSeq or x columns replaced
+    '''
+    with open(os.path.join(PDB_FILES, "1fdl.pdb"), encoding="utf8") as pdb:
+        line = next(line for line in pdb if line.startswith("ATOM"))
+    return line[:22] + resseq + line[26:30] + x + line[38:]
+
+def _write(tmp_path, name, text):
+    '''
+    This function will write text to a file in the test folder and return its path
+    '''
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+def test_mapped_and_streamed_parses_agree():
+    filename = os.path.join(PDB_FILES, "1fdl.pdb")
+    mapped = parse_pdb(filename)
+    with open(filename, "rb") as stream:
+        streamed = parse_pdb_stream(stream, filename, chunk_bytes=4096)
+    assert len(mapped) == 4309
+    for field, _ in mapped.FIELDS:
+        assert np.array_equal(getattr(mapped, field), getattr(streamed, field)), field
+    assert np.array_equal(mapped.coords, streamed.coords)
+
+def test_small_chunks_split_lines_the_same_way():
+    filename = os.path.join(PDB_FILES, "1bhm.pdb")
+    whole = parse_pdb(filename)
+    chunked = parse_pdb(filename, chunk_bytes=1000)
+    assert np.array_equal(whole.name, chunked.name)
+    assert np.array_equal(whole.models, chunked.models)
+
+def test_gzip_and_plain_files_agree(tmp_path):
+    filename = os.path.join(PDB_FILES, "1z43.pdb")
+    compressed = str(tmp_path / "1z43.pdb.gz")
+    with open(filename, "rb") as plain, gzip.open(compressed, "wb") as packed:
+        packed.write(plain.read())
+    assert np.array_equal(read_structure(filename).coords, read_structure(compressed).coords)
+
+def test_blank_and_hybrid36_residue_numbers(tmp_path):
+    text = _atom_line("   7") + _atom_line("    ") + _atom_line("A000") + _atom_line("a000")
+    structure = parse_pdb(_write(tmp_path, "blank.pdb", text))
+    assert structure.resv.tolist() == [7, 0, 10000, 1223056]
+    assert structure.resi.tolist() == ["7", "", "A000", "a000"]
+
+def test_hybrid36_decoding():
+    assert _hybrid36("9999") == 9999
+    assert _hybrid36("ZZZZ") == 1223055
+    assert _hybrid36("zzzz") == 2436111
+    assert _hybrid36("????") == 0
+
+def test_unreadable_coordinates_raise_their_own_error(tmp_path):
+    text = _atom_line() + _atom_line(x="  abc.de")
+    with pytest.raises(ValueError, match="abc.de"):
+        parse_pdb(_write(tmp_path, "bad.pdb", text))
+
+def test_windows_line_endings_and_empty_files(tmp_path):
+    line = _atom_line()
+    structure = parse_pdb(_write(tmp_path, "crlf.pdb", line.rstrip("\n") + "\r\n"))
+    assert structure.element.tolist() == [line[76:78].strip()]
+    assert len(parse_pdb(_write(tmp_path, "empty.pdb", ""))) == 0
+    assert len(parse_pdb_stream(io.BytesIO(b""))) == 0
+
+def test_cif_matches_pdb_atoms():
+    text = """data_test
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_seq_id
+_atom_site.pdbx_PDB_ins_code
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.pdbx_PDB_model_num
+ATOM 1 N N GLY A 1 ? 1.0 2.0 3.0 1
+ATOM 2 C CA GLY A 1 ? 2.0 2.0 3.0 1
+#
+"""
+    structure = parse_cif_text(text)
+    assert structure.name.tolist() == ["N", "CA"]
+    assert structure.resv.tolist() == [1, 1]
+    assert np.allclose(structure.coords[1], [2.0, 2.0, 3.0])
+
+def test_cache_hits_and_reparses_edited_files(tmp_path):
+    filename = str(tmp_path / "1z43.pdb")
+    shutil.copy(os.path.join(PDB_FILES, "1z43.pdb"), filename)
+    cache = StructureCache()
+    first = load_structure(filename, cache)
+    assert load_structure(filename, cache) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    with open(filename, "a", encoding="utf8") as pdb:
+        pdb.write(_atom_line())
+    os.utime(filename, ns=(0, os.stat(filename).st_mtime_ns + 10 ** 9))
+    edited = load_structure(filename, cache)
+    assert len(edited) == len(first) + 1
+    assert len(cache) == 1 and cache.nbytes == edited.nbytes
+
+def test_cache_evicts_least_recently_used():
+    names = ("1z43.pdb", "1eej.pdb", "1fdl.pdb")
+    sizes = [read_structure(os.path.join(PDB_FILES, name)).nbytes for name in names]
+    cache = StructureCache(max_bytes=sizes[0] + sizes[1] + sizes[2] // 2)
+    for name in names[:2]:
+        load_structure(os.path.join(PDB_FILES, name), cache)
+    load_structure(os.path.join(PDB_FILES, names[0]), cache)
+    load_structure(os.path.join(PDB_FILES, names[2]), cache)
+    assert cache.evictions == 1
+    assert {key[0] for key in cache._entries} == {os.path.join(PDB_FILES, names[0]),
+                                                  os.path.join(PDB_FILES, names[2])}
+    assert cache.nbytes <= cache.max_bytes
+
+def test_cache_does_not_keep_structures_over_budget():
+    cache = StructureCache(max_bytes=10)
+    structure = load_structure(os.path.join(PDB_FILES, "1z43.pdb"), cache)
+    assert len(structure) and len(cache) == 0 and cache.nbytes == 0
+
+def test_oversized_structure_keeps_the_cached_structures():
+    small = [os.path.join(PDB_FILES, name) for name in ("1fdl.pdb", "1bhm.pdb")]
+    sizes = [read_structure(filename).nbytes for filename in small]
+    large = os.path.join(PDB_FILES, "1kx5.pdb")
+    assert read_structure(large).nbytes > sum(sizes)
+    cache = StructureCache(max_bytes=sum(sizes))
+    for filename in small:
+        load_structure(filename, cache)
+    load_structure(large, cache)
+    assert {key[0] for key in cache._entries} == set(small)
+    assert cache.nbytes == sum(sizes) and cache.evictions == 0
+    load_structure(small[0], cache)
+    assert cache.hits == 1
+
+def _cif_text(structure):
+    '''
+    This function will write the atoms of a structure as an mmCIF _atom_site loop
+    '''
+    items = ("group_PDB", "type_symbol", "auth_atom_id", "auth_comp_id", "auth_asym_id",
+             "auth_seq_id", "Cartn_x", "Cartn_y", "Cartn_z", "pdbx_PDB_model_num")
+    lines = ["data_test", "loop_"] + ["_atom_site." + item for item in items]
+    for atom in range(len(structure)):
+        name = structure.name[atom]
+        lines.append(" ".join((
+            structure.record[atom], structure.element[atom],
+            '"{}"'.format(name) if "'" in name else name, structure.resn[atom],
+            structure.chain[atom], str(structure.resv[atom]),
+            *("{:.3f}".format(value) for value in structure.coords[atom]), "1")))
+    return "\n".join(lines + ["#", ""])
+
+def _integer_packing(values):
+    '''
+    This function will pack integers into int8, splitting values outside its
+    range into runs of the boundary value as BinaryCIF does
+    '''
+    packed = []
+    for value in values.tolist():
+        while value >= 127:
+            packed.append(127)
+            value -= 127
+        while value <= -128:
+            packed.append(-128)
+            value += 128
+        packed.append(value)
+    return np.array(packed, dtype=np.int8)
+
+def _bcif_strings(values):
+    '''
+    This function will encode a string column as a BinaryCIF StringArray
+    '''
+    table, indices = np.unique(values, return_inverse=True)
+    offsets = np.concatenate(([0], np.cumsum([len(value) for value in table])))
+    return {"data": indices.astype("<i4").tobytes(), "encoding": [{
+        "kind": "StringArray", "stringData": "".join(table.tolist()),
+        "offsets": offsets.astype("<i4").tobytes(),
+        "offsetEncoding": [{"kind": "ByteArray", "type": 3}],
+        "dataEncoding": [{"kind": "ByteArray", "type": 3}]}]}
+
+def test_mmcif_and_gzip_mmcif_match_pdb(tmp_path):
+    structure = read_structure(os.path.join(PDB_FILES, "1bhm.pdb"))
+    filename = str(tmp_path / "1bhm.cif.gz")
+    with gzip.open(filename, "wt", encoding="utf8") as ciffile:
+        ciffile.write(_cif_text(structure))
+    parsed = read_structure(filename)
+    for field in ("record", "name", "resn", "chain", "resv", "element"):
+        assert np.array_equal(getattr(parsed, field), getattr(structure, field)), field
+    assert np.allclose(parsed.coords, structure.coords, atol=1e-3)
+
+def test_binary_cif_decodes_every_encoding(tmp_path):
+    msgpack = pytest.importorskip("msgpack")
+    structure = read_structure(os.path.join(PDB_FILES, "1z43.pdb"))
+    resv = structure.resv.astype(np.int64)
+    columns = [{"name": name, "data": _bcif_strings(getattr(structure, field))}
+               for name, field in (("group_PDB", "record"), ("auth_atom_id", "name"),
+                                   ("auth_comp_id", "resn"), ("auth_asym_id", "chain"),
+                                   ("type_symbol", "element"))]
+    columns.append({"name": "auth_seq_id", "data": {
+        "data": _integer_packing(np.diff(resv, prepend=resv[0])).tobytes(),
+        "encoding": [{"kind": "Delta", "origin": int(resv[0]), "srcType": 3},
+                     {"kind": "IntegerPacking", "byteCount": 1, "isUnsigned": False},
+                     {"kind": "ByteArray", "type": 1}]}})
+    for axis, name in enumerate(("Cartn_x", "Cartn_y", "Cartn_z")):
+        fixed = np.round(structure.coords[:, axis].astype(np.float64) * 1000).astype("<i4")
+        columns.append({"name": name, "data": {"data": fixed.tobytes(), "encoding": [
+            {"kind": "FixedPoint", "factor": 1000, "srcType": 33},
+            {"kind": "ByteArray", "type": 3}]}})
+    columns.append({"name": "pdbx_PDB_model_num", "data": {
+        "data": np.array([1, len(structure)], dtype="<i4").tobytes(),
+        "encoding": [{"kind": "RunLength", "srcType": 3, "srcSize": len(structure)},
+                     {"kind": "ByteArray", "type": 3}]}})
+    document = {"dataBlocks": [{"categories": [
+        {"name": "_atom_site", "rowCount": len(structure), "columns": columns}]}]}
+    filename = str(tmp_path / "1z43.bcif")
+    with open(filename, "wb") as bciffile:
+        bciffile.write(msgpack.packb(document, use_bin_type=True))
+    parsed = read_structure(filename)
+    for field in ("record", "name", "resn", "chain", "resv", "element"):
+        assert np.array_equal(getattr(parsed, field), getattr(structure, field)), field
+    assert np.allclose(parsed.coords, structure.coords, atol=1e-3)
+
+def _selected_residues(structure, selection):
+    '''
+    This function will evaluate a residue_ranges selection the way PyMOL does,
+    a range selecting every residue number inside it
+    '''
+    selected = set()
+    assert selection.startswith(structure.object_name + " and (")
+    for clause in selection[len(structure.object_name) + 6:-1].split(" or "):
+        chain, resi = clause.strip("()").split(" and resi ")
+        chain = chain[len("chain "):].replace('""', "")
+        in_chain = np.char.strip(structure.chain) == chain
+        for item in re.split(r"(?<!\\)\+", resi):
+            found = re.fullmatch(r"(-?\d+)-(-?\d+)", item)
+            if found:
+                low, high = int(found.group(1)), int(found.group(2))
+                atoms = np.flatnonzero(in_chain & (structure.resv >= low)
+                                       & (structure.resv <= high))
+            else:
+                atoms = np.flatnonzero(in_chain & (structure.resi == item.replace("\\-", "-")))
+            assert len(atoms), item
+            selected.update(zip(structure.chain[atoms].tolist(), structure.resi[atoms].tolist()))
+    return selected
+
+def _residues(structure, atoms):
+    return set(zip(structure.chain[atoms].tolist(), structure.resi[atoms].tolist()))
+
+def test_residue_ranges_select_exactly_the_residues():
+    structure = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    rng = np.random.default_rng(5)
+    assert structure.residue_ranges([]) == "none"
+    for size in (1, 10, 200, len(structure)):
+        atoms = rng.choice(len(structure), size=size, replace=False)
+        selection = structure.residue_ranges(atoms)
+        assert _selected_residues(structure, selection) == _residues(structure, atoms)
+    # Whole chains are written as one range each
+    assert structure.residue_ranges(np.arange(len(structure))).count("-") <= 2 * 3
+
+def test_residue_ranges_keep_insertion_codes_and_negative_numbers():
+    line = _atom_line()
+    lines = [line[:21] + chain + "{:>4}".format(resseq) + icode + line[27:]
+             for chain, resseq, icode in [
+                 ("A", -2, " "), ("A", -1, " "), ("A", 0, " "), ("A", 1, " "),
+                 ("A", 52, " "), ("A", 52, "A"), ("A", 52, "B"), ("A", 53, " "),
+                 ("A", 54, " "), ("A", 60, " "), ("A", 61, " "), ("A", 62, " "),
+                 (" ", 5, " "), (" ", 6, " ")]]
+    structure = parse_pdb_stream(io.BytesIO("".join(lines).encode()), "ins.pdb")
+    # Negative numbers are escaped, and a range is written only where PyMOL
+    # selects nothing else, the insertion codes of 52 included
+    selection = structure.residue_ranges(np.delete(np.arange(len(structure)), [3, 9]))
+    assert selection == ('ins and ((chain A and resi \\-2+\\-1+0+52-54+61-62) '
+                         'or (chain "" and resi 5-6))')
+    assert structure.residue_ranges([4, 5, 7]) == "ins and ((chain A and resi 52+52A+53))"
+    rng = np.random.default_rng(6)
+    for _ in range(50):
+        atoms = np.flatnonzero(rng.random(len(structure)) < 0.5)
+        if len(atoms):
+            selection = structure.residue_ranges(atoms)
+            assert _selected_residues(structure, selection) == _residues(structure, atoms)
+
+def _brute_select(structure, **fields):
+    '''
+    This function will select atoms by comparing every atom of every given column
+    '''
+    mask = np.ones(len(structure), dtype=bool)
+    for field, value in fields.items():
+        if value is not None:
+            mask &= np.isin(getattr(structure, field), [value] if isinstance(value, str)
+                            else value)
+    return np.flatnonzero(mask)
+
+@pytest.mark.parametrize("fields", [
+    dict(resn="CYS", name="SG"),
+    dict(resn="CYS", element="S", record="ATOM"),
+    dict(resn=["ASP", "GLU"], name=["OD1", "OE1", "OE2"]),
+    dict(name="CA", chain="H"),
+    dict(record="HETATM"),
+    dict(resn="CYS", name="XX"),
+    dict(resn=["NONE"]),
+    dict(resn=None, name="N"),
+    dict(resn=["CYS", "CYS"], name="SG"),
+    dict(resn=["CYS", "CYS"]),
+])
+def test_atom_index_matches_brute_force(fields):
+    structure = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    expected = _brute_select(structure, **fields)
+    selected = structure.index.select(**fields)
+    assert selected.tolist() == expected.tolist()
+    assert np.array_equal(structure.index.mask(**fields), np.isin(np.arange(len(structure)),
+                                                                  expected))
+
+def test_atom_index_codes_and_text_queries():
+    structure = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    index = structure.index
+    for field in index.FIELDS:
+        values = index.values[field]
+        assert np.array_equal(values[index.codes[field]], getattr(structure, field))
+        assert index.code(field, values[-1]) == len(values) - 1
+        assert index.code(field, "~absent") == -1
+    assert index.select("CYS SG").tolist() == _brute_select(
+        structure, resn="CYS", name="SG").tolist()
+    assert index.select("* CA * C ATOM").tolist() == _brute_select(
+        structure, name="CA", element="C", record="ATOM").tolist()
+    assert len(index.select()) == len(structure)
+    with pytest.raises(ValueError):
+        index.select("CYS SG H S ATOM extra")
+    with pytest.raises(ValueError):
+        index.select(resi="22")
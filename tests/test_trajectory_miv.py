@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pytest
+from conftest import PDB_FILES
+from structure_miv import read_structure
+from neighbor_miv import VerletList
+from calc_miv import calc_disulfide
+from trajectory_miv import Trajectory, disulfide_frames, read_pdb_frames, track_interactions
+
+def _brute_pairs(coords, cutoff):
+    '''
+    This function will list every (i, j) pair with i < j closer than the cutoff
+    '''
+    distance = np.linalg.norm(coords[:, np.newaxis] - coords[np.newaxis], axis=2)
+    return {(int(i), int(j)) for i, j in zip(*np.nonzero(distance < cutoff)) if i < j}
+
+def test_verlet_list_matches_brute_force_as_atoms_move():
+    rng = np.random.default_rng(11)
+    coords = rng.uniform(0.0, 15.0, size=(300, 3))
+    verlet = VerletList(coords, 3.0, skin=1.0)
+    for step in range(6):
+        coords = coords + rng.normal(0.0, 0.02, size=coords.shape)
+        first, second, distance = verlet.update(coords)
+        assert set(zip(first.tolist(), second.tolist())) == _brute_pairs(coords, 3.0), step
+        assert np.all(distance < 3.0)
+    # Small steps reuse the candidates, a large jump searches them again
+    builds = verlet.builds
+    assert builds == 1
+    coords = coords + rng.normal(0.0, 2.0, size=coords.shape)
+    first, second, _ = verlet.update(coords)
+    assert verlet.builds == builds + 1
+    assert set(zip(first.tolist(), second.tolist())) == _brute_pairs(coords, 3.0)
+
+def test_verlet_list_rejects_other_atom_counts():
+    verlet = VerletList(np.zeros((4, 3)), 2.0)
+    with pytest.raises(ValueError):
+        verlet.update(np.zeros((5, 3)))
+
+@pytest.fixture
+def trajectory_file(tmp_path):
+    '''
+    This function will write 1fdl as a three frame PDB trajectory, the
+    sulfur of its first disulfide bond pulled away in the second frame
+    '''
+    with open(os.path.join(PDB_FILES, "1fdl.pdb"), encoding="utf8") as pdb:
+        atoms = [line for line in pdb if line.startswith(("ATOM", "HETATM"))]
+    structure = read_structure(os.path.join(PDB_FILES, "1fdl.pdb"))
+    broken = int(calc_disulfide(structure, pml_file=None).pairs()[0, 0])
+    pulled = list(atoms)
+    line = pulled[broken]
+    pulled[broken] = line[:30] + "{:8.3f}".format(float(line[30:38]) + 4.0) + line[38:]
+    lines = []
+    for number, frame in enumerate([atoms, pulled, atoms], 1):
+        lines += ["MODEL     {:>4}\n".format(number)] + frame + ["ENDMDL\n"]
+    filename = str(tmp_path / "md.pdb")
+    with open(filename, "w", encoding="utf8") as pdb:
+        pdb.writelines(lines + ["END\n"])
+    return filename, len(atoms), broken
+
+def test_pdb_frames_read_every_model(trajectory_file):
+    filename, atoms, _ = trajectory_file
+    frames = list(read_pdb_frames(filename))
+    assert [frame.shape for frame in frames] == [(atoms, 3)] * 3
+    trajectory = Trajectory(filename)
+    assert len(trajectory.topology) == atoms
+    assert sum(1 for _ in trajectory) == 3
+    assert trajectory.frames == 3
+
+def test_disulfide_frames_follow_the_trajectory(trajectory_file):
+    filename, _, _ = trajectory_file
+    counts = [len(found["disulfide"]) for found in disulfide_frames(Trajectory(filename))]
+    assert counts == [9, 8, 9]
+
+def test_track_interactions_writes_series_and_persistence(trajectory_file, tmp_path):
+    filename, _, broken = trajectory_file
+    series_file = str(tmp_path / "series.tsv")
+    counts, persistence = track_interactions(Trajectory(filename), series_file=series_file)
+    assert counts["disulfide"].tolist() == [9, 8, 9]
+    pairs, found = persistence["disulfide"]
+    assert len(pairs) == 9
+    assert sorted(found.tolist()) == [2] + [3] * 8
+    assert broken in pairs[found == 2]
+    with open(series_file, encoding="utf8") as series:
+        rows = series.read().splitlines()
+    assert rows[0].split("\t") == ["frame", "kind", "residue1", "atom1", "residue2", "atom2"]
+    assert len(rows) == 1 + 9 + 8 + 9
+
+def test_topology_is_needed_for_other_formats(tmp_path):
+    with pytest.raises(ValueError):
+        Trajectory(str(tmp_path / "md.dcd"))
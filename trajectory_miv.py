@@ -0,0 +1,482 @@
+import argparse
+import gzip
+import os
+import sys
+from collections import OrderedDict
+import numpy as np
+# pylint: disable=import-error
+try:
+    from .structure_miv import iter_pdb_models, load_structure, parse_pdb_topology
+    from .neighbor_miv import VerletList
+    from .calc_miv import BasePairRules
+    from .stats_miv import AnalysisStats
+except ImportError:
+    from structure_miv import iter_pdb_models, load_structure, parse_pdb_topology
+    from neighbor_miv import VerletList
+    from calc_miv import BasePairRules
+    from stats_miv import AnalysisStats
+
+############################################################
+###################  Trajectory Readers  ###################
+############################################################
+
+# Frames read from an XTC file at a time
+_XTC_FRAMES = 64
+
+def read_pdb_frames(filename):
+    '''
+    This function will read the models of a multi-model PDB file, optionally
+    gzip compressed, as trajectory frames
+
+    **Parameters**
+
+    filename: *str*
+        A string with the PDB file name (e.g. md.pdb)
+
+    **Returns**
+
+        Iterator of float arrays of shape (atoms, 3), one per frame
+    '''
+    opener = gzip.open if filename.lower().endswith(".gz") else open
+    with opener(filename, "rb") as rawfile:
+        yield from iter_pdb_models(rawfile)
+
+def _dcd_record(stream, int32):
+    '''
+    This function will read one Fortran unformatted record of a DCD file
+
+    **Parameters**
+
+    stream: *file*
+        The binary DCD file
+
+    int32: *numpy.dtype*
+        The 32 bit integer type of the file's byte order
+
+    **Returns**
+
+        Bytes of the record, or None at the end of the file
+    '''
+    marker = stream.read(4)
+    if not marker:
+        return None
+    size = int(np.frombuffer(marker, dtype=int32)[0]) if len(marker) == 4 else -1
+    payload = stream.read(size) if size >= 0 else b""
+    end = stream.read(4)
+    if size < 0 or len(payload) != size or len(end) != 4 \
+            or int(np.frombuffer(end, dtype=int32)[0]) != size:
+        raise ValueError("Truncated or corrupt DCD record in {}".format(stream.name))
+    return payload
+
+def read_dcd_frames(filename):
+    '''
+    This function will read the frames of a CHARMM or NAMD DCD file one at a
+    time, in either byte order, skipping the unit cell of each frame
+
+    **Parameters**
+
+    filename: *str*
+        A string with the DCD file name (e.g. md.dcd)
+
+    **Returns**
+
+        Iterator of float arrays of shape (atoms, 3), one per frame
+    '''
+    with open(filename, "rb") as dcdfile:
+        header = dcdfile.read(8)
+        for order in ("<", ">"):
+            if len(header) == 8 and header[4:] == b"CORD" \
+                    and np.frombuffer(header[:4], dtype=order + "i4")[0] == 84:
+                break
+        else:
+            raise ValueError("{} is not a DCD file".format(filename))
+        int32 = np.dtype(order + "i4")
+        float32 = np.dtype(order + "f4")
+        dcdfile.seek(0)
+        control = np.frombuffer(_dcd_record(dcdfile, int32)[4:], dtype=int32)
+        # CHARMM files set their version in the last control word and flag
+        # a unit cell block and a fourth dimension before each frame
+        charmm = control[19] != 0
+        unit_cell = charmm and control[10] != 0
+        four_dims = charmm and control[11] != 0
+        if control[8]:
+            raise ValueError("DCD files with fixed atoms are not supported: {}".format(filename))
+        _dcd_record(dcdfile, int32)
+        atoms = int(np.frombuffer(_dcd_record(dcdfile, int32), dtype=int32)[0])
+        while True:
+            if unit_cell and _dcd_record(dcdfile, int32) is None:
+                return
+            axes = []
+            for _ in range(3):
+                record = _dcd_record(dcdfile, int32)
+                if record is None:
+                    if axes or unit_cell:
+                        raise ValueError("Truncated DCD frame in {}".format(filename))
+                    return
+                axes.append(np.frombuffer(record, dtype=float32))
+            if four_dims:
+                _dcd_record(dcdfile, int32)
+            if any(len(axis) != atoms for axis in axes):
+                raise ValueError("DCD frame of {} does not have {} atoms".format(filename, atoms))
+            yield np.column_stack(axes)
+
+def read_xtc_frames(filename):
+    '''
+    This function will read the frames of a GROMACS XTC file, converted from
+    nanometers to angstroms. XTC needs the mdtraj package
+
+    **Parameters**
+
+    filename: *str*
+        A string with the XTC file name (e.g. md.xtc)
+
+    **Returns**
+
+        Iterator of float arrays of shape (atoms, 3), one per frame
+    '''
+    try:
+        # pylint: disable=import-outside-toplevel
+        from mdtraj.formats import XTCTrajectoryFile
+    except ImportError as error:
+        raise ImportError("Reading XTC trajectories needs mdtraj (pip install mdtraj)") from error
+    with XTCTrajectoryFile(filename, "r") as xtcfile:
+        while True:
+            xyz = xtcfile.read(n_frames=_XTC_FRAMES)[0]
+            if not len(xyz):
+                return
+            for frame in xyz:
+                yield frame * np.float32(10.0)
+
+# Trajectory file extension to the function reading its frames, extended with register_reader
+TRAJECTORY_READERS = {
+    ".pdb": read_pdb_frames,
+    ".ent": read_pdb_frames,
+    ".dcd": read_dcd_frames,
+    ".xtc": read_xtc_frames,
+}
+
+def register_reader(extension, reader):
+    '''
+    This function will add or replace the reader of a trajectory format
+
+    **Parameters**
+
+    extension: *str*
+        The file extension (e.g. .trr)
+
+    reader: *function*
+        A function taking the file name and returning an iterator of float
+        arrays of shape (atoms, 3), one per frame, in angstroms
+
+    **Returns**
+
+        None
+    '''
+    TRAJECTORY_READERS[extension.lower()] = reader
+
+def trajectory_reader(filename):
+    '''
+    This function will return the reader of a trajectory file from its
+    extension, ignoring a .gz suffix
+
+    **Parameters**
+
+    filename: *str*
+        A string with the trajectory file name
+
+    **Returns**
+
+        The function reading the frames of the file
+    '''
+    lowered = filename.lower()
+    extension = os.path.splitext(lowered[:-3] if lowered.endswith(".gz") else lowered)[1]
+    if extension not in TRAJECTORY_READERS:
+        raise ValueError("No trajectory reader for {} files (known: {})".format(
+            extension or filename, ", ".join(sorted(TRAJECTORY_READERS))))
+    return TRAJECTORY_READERS[extension]
+
+class Trajectory:
+    '''
+    This class pairs the frames of a trajectory file with the topology of its
+    atoms, read once, and streams the frames one at a time
+
+    **Attributes**
+
+    filename: *str*
+        The trajectory file
+
+    topology: *Structure*
+        The atoms of every frame, from the topology file or the first model
+        of a PDB trajectory
+
+    frames: *int*
+        The number of frames read so far
+    '''
+    def __init__(self, filename, topology=None):
+        self.filename = filename
+        self.reader = trajectory_reader(filename)
+        if topology is None:
+            if self.reader is not read_pdb_frames:
+                raise ValueError("A topology file is needed for {}".format(filename))
+            opener = gzip.open if filename.lower().endswith(".gz") else open
+            with opener(filename, "rb") as rawfile:
+                topology = parse_pdb_topology(rawfile, filename)
+        self.topology = load_structure(topology)
+        self.frames = 0
+
+    def __repr__(self):
+        return "<Trajectory {} of {} atoms, {} frames read>".format(
+            self.filename, len(self.topology), self.frames)
+
+    def __iter__(self):
+        for coords in self.reader(self.filename):
+            if len(coords) != len(self.topology):
+                raise ValueError("Frame {} of {} has {} atoms, the topology has {}".format(
+                    self.frames + 1, self.filename, len(coords), len(self.topology)))
+            self.frames += 1
+            yield coords
+
+############################################################
+###################  Interaction Time Series  ##############
+############################################################
+
+def disulfide_frames(trajectory, skin=2.0, stats=None):
+    '''
+    This function will find the disulfide bonds of every frame of a
+    trajectory, selecting the cysteine sulfur atoms once
+
+    **Parameters**
+
+    trajectory: *Trajectory*
+        The trajectory to read
+
+    skin: *float*
+        The Verlet list skin in angstroms
+
+    stats: *AnalysisStats*
+        Collects the time of each stage and the pairs counted, or None
+
+    **Returns**
+
+        Iterator of dictionaries of the bond kind to an integer array of
+        shape (bonds, 2) of atom indices, one per frame
+    '''
+    stats = AnalysisStats("disulfide_frames") if stats is None else stats
+    structure = trajectory.topology
+    cys_atoms = structure.select(resn="CYS", element="S", record="ATOM")
+    cys_sorted = cys_atoms[np.argsort(structure.resv[cys_atoms], kind="stable")]
+    stats.count("atoms_selected", len(cys_sorted))
+    yield from _verlet_frames(trajectory, cys_sorted, 2.05, skin, stats, _disulfide_bonds)
+
+def _disulfide_bonds(atoms, first, second, distance):
+    '''
+    This function will keep the sulfur pairs of a frame within the disulfide bond distance
+    '''
+    in_range = distance > 1.95
+    return {"disulfide": np.column_stack((atoms[second[in_range]], atoms[first[in_range]]))}
+
+def base_pair_frames(trajectory, skin=2.0, stats=None):
+    '''
+    This function will find the WC and non-WC hydrogen bonds of every frame of
+    a trajectory, selecting the base atoms of every rule once
+
+    **Parameters**
+
+    trajectory: *Trajectory*
+        The trajectory to read
+
+    skin: *float*
+        The Verlet list skin in angstroms
+
+    stats: *AnalysisStats*
+        Collects the time of each stage and the pairs counted, or None
+
+    **Returns**
+
+        Iterator of dictionaries of the bond kind (WC or nWC) to an integer
+        array of shape (bonds, 2) of atom indices, one per frame
+    '''
+    stats = AnalysisStats("base_pair_frames") if stats is None else stats
+    rules = BasePairRules(trajectory.topology)
+    stats.count("atoms_selected", len(rules.atoms))
+
+    def base_pairs(atoms, first, second, distance):
+        '''
+        This function will match the base atom pairs of a frame against every rule
+        '''
+        pair_atoms = np.column_stack((atoms[first], atoms[second]))
+        found = rules.match(pair_atoms, distance, np.zeros(len(distance), dtype=int))
+        return {kind: np.unique(pairs, axis=0) for kind, (_, pairs, _) in found.items()}
+
+    yield from _verlet_frames(trajectory, rules.atoms, rules.cutoff, skin, stats, base_pairs)
+
+def _verlet_frames(trajectory, atoms, cutoff, skin, stats, bonds):
+    '''
+    This function will update a Verlet list of the selected atoms frame after
+    frame and turn the pairs within the cutoff into the bonds of each frame
+
+    **Parameters**
+
+    trajectory: *Trajectory*
+        The trajectory to read
+
+    atoms: *numpy.ndarray*
+        Array of the atom indices to pair
+
+    cutoff: *float*
+        The largest bond distance in angstroms
+
+    skin: *float*
+        The Verlet list skin in angstroms
+
+    stats: *AnalysisStats*
+        Collects the time of each stage and the pairs counted
+
+    bonds: *function*
+        Takes atoms and the first positions, second positions and distances
+        of the pairs, and returns a dictionary of bond kind to atom pairs
+
+    **Returns**
+
+        Iterator of the bond dictionaries, one per frame
+    '''
+    verlet = None
+    frames = iter(trajectory)
+    while True:
+        stats.start("read")
+        coords = next(frames, None)
+        if coords is None:
+            break
+        stats.start("distance")
+        if verlet is None:
+            verlet = VerletList(coords[atoms], cutoff, skin)
+        found = bonds(atoms, *verlet.update(coords[atoms]))
+        stats.stop()
+        yield found
+    stats.stop()
+    stats.count("frames", trajectory.frames)
+    if verlet is not None:
+        stats.count("verlet_builds", verlet.builds)
+        stats.count("pairs_evaluated", verlet.candidates)
+
+# Analysis name to the function yielding the bonds of every frame
+FRAME_ANALYSES = OrderedDict((
+    ("disulfide", disulfide_frames),
+    ("wc_nwc", base_pair_frames),
+))
+
+def track_interactions(trajectory, analysis="disulfide", series_file=None, skin=2.0,
+                       stats=None):
+    '''
+    This function will follow the bonds of an analysis through a trajectory,
+    writing every bond of every frame as it is found so memory stays constant
+    however many frames there are, and print how many frames each bond persists
+
+    **Parameters**
+
+    trajectory: *Trajectory*
+        The trajectory to read
+
+    analysis: *str*
+        The name of the analysis (a key of FRAME_ANALYSES)
+
+    series_file: *str*
+        The tab separated file to write one row per bond and frame to, or None
+
+    skin: *float*
+        The Verlet list skin in angstroms
+
+    stats: *AnalysisStats*
+        Collects the time of each stage and the pairs counted, or None
+
+    **Returns**
+
+        Dictionary of the bond kind to an array of the number of bonds in each
+        frame, and dictionary of the bond kind to an integer array of shape
+        (bonds, 2) of atom indices and an array of the frames having each bond
+    '''
+    stats = AnalysisStats("track_interactions") if stats is None else stats
+    structure = trajectory.topology
+    counts = OrderedDict()
+    persistence = OrderedDict()
+    seriesfile = open(series_file, "w", encoding="utf8") if series_file is not None else None
+    try:
+        if seriesfile is not None:
+            seriesfile.write("frame\tkind\tresidue1\tatom1\tresidue2\tatom2\n")
+        for frame, found in enumerate(FRAME_ANALYSES[analysis](trajectory, skin, stats), 1):
+            for kind, pairs in found.items():
+                counts.setdefault(kind, []).append(len(pairs))
+                seen = persistence.setdefault(kind, {})
+                for atom1, atom2 in pairs.tolist():
+                    seen[(atom1, atom2)] = seen.get((atom1, atom2), 0) + 1
+                if seriesfile is not None and len(pairs):
+                    stats.start("write")
+                    seriesfile.writelines(
+                        "{}\t{}\t{}\t{}\t{}\t{}\n".format(
+                            frame, kind, structure.residue_label(atom1), structure.name[atom1],
+                            structure.residue_label(atom2), structure.name[atom2])
+                        for atom1, atom2 in pairs)
+                    stats.stop()
+    finally:
+        if seriesfile is not None:
+            seriesfile.close()
+
+    frames = trajectory.frames
+    print("\n{} frames of {} atoms".format(frames, len(structure)))
+    for kind, frame_counts in counts.items():
+        counts[kind] = np.array(frame_counts)
+        print("{} bonds per frame: mean {:.2f}, min {}, max {}".format(
+            kind, counts[kind].mean(), counts[kind].min(), counts[kind].max()))
+    print("\nPERSISTENCE (fraction of frames with the bond)")
+    for kind, seen in persistence.items():
+        pairs = np.array(list(seen), dtype=np.int64).reshape(-1, 2)
+        found = np.array(list(seen.values()), dtype=np.int64)
+        persistence[kind] = (pairs, found)
+        for (atom1, atom2), frames_found in zip(pairs, found):
+            print("{:<9} {} {:<4} --- {} {:<4} {:.2f}".format(
+                kind, structure.residue_label(atom1), structure.name[atom1],
+                structure.residue_label(atom2), structure.name[atom2], frames_found / frames))
+    return counts, persistence
+
+def main(argv=None):
+    '''
+    This function will track the bonds of a trajectory from the command line
+
+    **Parameters**
+
+    argv: *list*
+        Command line arguments, or None to use sys.argv
+
+    **Returns**
+
+        Exit status
+    '''
+    parser = argparse.ArgumentParser(
+        description="Follow disulfide or base pair bonds through a multi-model PDB, "
+                    "DCD or XTC trajectory")
+    parser.add_argument("trajectory", help="trajectory file ({})".format(
+        ", ".join(sorted(TRAJECTORY_READERS))))
+    parser.add_argument("-t", "--topology",
+                        help="structure file of the trajectory atoms (default: the first "
+                             "model of a PDB trajectory)")
+    parser.add_argument("-a", "--analysis", default="disulfide", choices=list(FRAME_ANALYSES),
+                        help="bonds to follow (default: disulfide)")
+    parser.add_argument("-o", "--output", default="interactions.tsv",
+                        help="tab separated file of the bonds of every frame "
+                             "(default: interactions.tsv)")
+    parser.add_argument("--skin", type=float, default=2.0,
+                        help="Verlet list skin in angstroms (default: 2.0)")
+    parser.add_argument("--stats",
+                        help="JSON file to write per-stage times and counters to")
+    args = parser.parse_args(argv)
+
+    stats = AnalysisStats(args.analysis)
+    track_interactions(Trajectory(args.trajectory, args.topology), args.analysis,
+                       args.output, args.skin, stats)
+    if args.stats:
+        stats.write_json(args.stats)
+    print("Wrote the bonds of every frame to {}".format(args.output))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())